@@ -0,0 +1,145 @@
+"""Failure handling for the Supabase client: circuit breakers, retry budget, adaptive timeouts.
+
+* CircuitBreaker: one per table. After SUPABASE_BREAKER_FAILURES consecutive
+  failures (transport errors, 5xx, 429) it opens and calls fail at once with
+  CircuitOpenError. After SUPABASE_BREAKER_RESET_SECONDS one probe is let
+  through (half-open). The probe closes the breaker or opens it again.
+* RetryBudget: a token bucket shared by all tables. Each first-attempt success
+  earns SUPABASE_RETRY_RATIO of a token and each retry spends one, so
+  retries stay a small share of traffic. In an outage they cannot multiply
+  load on a struggling upstream.
+* LatencyTracker: one per (operation, table). The request timeout follows
+  the recent p99 of successful calls, between SUPABASE_MIN_TIMEOUT_SECONDS
+  and SUPABASE_TIMEOUT_SECONDS. Slow calls then fail fast enough to trip the
+  breaker instead of tying up workers for the full timeout.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+
+from app.utils.metrics import gauge
+
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "10"))
+SUPABASE_MIN_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_MIN_TIMEOUT_SECONDS", "2"))
+SUPABASE_TIMEOUT_P99_MULTIPLIER = float(os.getenv("SUPABASE_TIMEOUT_P99_MULTIPLIER", "4"))
+SUPABASE_BREAKER_FAILURES = int(os.getenv("SUPABASE_BREAKER_FAILURES", "5"))
+SUPABASE_BREAKER_RESET_SECONDS = float(os.getenv("SUPABASE_BREAKER_RESET_SECONDS", "15"))
+SUPABASE_RETRY_RATIO = float(os.getenv("SUPABASE_RETRY_RATIO", "0.1"))
+SUPABASE_RETRY_BURST = float(os.getenv("SUPABASE_RETRY_BURST", "10"))
+
+LATENCY_WINDOW = 256
+# Successful calls needed before the timeout adapts; until then SUPABASE_TIMEOUT_SECONDS
+LATENCY_MIN_SAMPLES = 32
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_MAX_SECONDS = 1.0
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = gauge("supabase_breaker_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ("table",))
+TIMEOUT_SECONDS = gauge("supabase_timeout_seconds", "Current adaptive request timeout", ("method", "table"))
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Raised without contacting Supabase while a table's breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self._lock = threading.Lock()
+        BREAKER_STATE.set(0, name)
+
+    def _set(self, state: str):
+        self.state = state
+        BREAKER_STATE.set(STATE_VALUES[state], self.name)
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected (without starting a probe)."""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < SUPABASE_BREAKER_RESET_SECONDS
+
+    def allow(self) -> bool:
+        """Whether a call may go out now. May start a half-open probe."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now - self.opened_at < SUPABASE_BREAKER_RESET_SECONDS:
+                return False
+            # One probe at a time; a probe that never reported back is replaced
+            if self.state == HALF_OPEN and now - self.probe_started < SUPABASE_BREAKER_RESET_SECONDS:
+                return False
+            self._set(HALF_OPEN)
+            self.probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                self._set(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= SUPABASE_BREAKER_FAILURES:
+                self._set(OPEN)
+                self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    def __init__(self, ratio: float = SUPABASE_RETRY_RATIO, burst: float = SUPABASE_RETRY_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class LatencyTracker:
+    def __init__(self, method: str, table: str):
+        self.labels = (method, table)
+        self.samples: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.current = SUPABASE_TIMEOUT_SECONDS
+        self._recorded = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+            self._recorded += 1
+            # Re-derive the timeout every 16 samples rather than sorting on every call
+            if len(self.samples) >= LATENCY_MIN_SAMPLES and self._recorded % 16 == 0:
+                ordered = sorted(self.samples)
+                p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+                self.current = min(SUPABASE_TIMEOUT_SECONDS,
+                                   max(SUPABASE_MIN_TIMEOUT_SECONDS, p99 * SUPABASE_TIMEOUT_P99_MULTIPLIER))
+                TIMEOUT_SECONDS.set(round(self.current, 3), *self.labels)
+
+    def timeout(self) -> float:
+        return self.current
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (1-based)."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
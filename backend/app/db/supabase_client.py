@@ -1,15 +1,71 @@
-"""Lightweight Supabase REST client using httpx."""
+"""Lightweight Supabase REST client using httpx.
 
+Every call goes through `_request`, which applies the table's circuit
+breaker, an adaptive timeout and budgeted, jittered retries
+(app/db/resilience.py). Retries only happen when repeating the call is safe:
+the request never reached Supabase, or the call is idempotent.
+
+While a table's breaker is open, inserts and upserts are not sent. They go
+to the local write spool (app/db/write_spool.py) and are replayed once
+Supabase recovers. Reads, updates and RPCs fail fast with CircuitOpenError.
+While anything is still spooled, new inserts and upserts are spooled too,
+so they reach the database in the order they were made. An update whose
+filters select a row that is still in the spool (its id is one the spool
+made up) is spooled behind that row rather than sent, where it would match
+nothing.
+"""
+
+import logging
 import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
 import httpx
 from dotenv import load_dotenv
 
+from app.db.resilience import (
+    SUPABASE_TIMEOUT_SECONDS,
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyTracker,
+    RetryBudget,
+    backoff_seconds,
+)
+from app.db.write_spool import get_write_spool
+from app.utils.metrics import counter, supabase_timer
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
+SUPABASE_MAX_RETRIES = int(os.getenv("SUPABASE_MAX_RETRIES", "2"))
+
+# Never spooled: callers need the database's answer (e.g. whether a claim won)
+UNSPOOLED_TABLES = {"idempotency_keys"}
+# Keyed by their own columns rather than a generated `id`
+NATURAL_KEY_TABLES = {"ehr_import_items", "idempotency_keys"}
+# Columns defaulting to NOW(), filled in when spooling so replay keeps the original time
+STAMP_COLUMNS = {
+    "patients": ("created_at",),
+    "patient_intakes": ("created_at",),
+    "triage_results": ("arrival_time", "created_at"),
+    "bed_assignments": ("assigned_at",),
+    "lab_bookings": ("booking_time",),
+    "ehr_import_jobs": ("created_at",),
+}
+
+RETRIES = counter("supabase_retries_total", "Supabase calls retried", ("table",))
+SHORT_CIRCUITS = counter("supabase_short_circuits_total", "Supabase calls rejected by an open breaker", ("table",))
 
 _client: httpx.Client | None = None
+_breakers: dict[str, CircuitBreaker] = {}
+_trackers: dict[tuple[str, str], LatencyTracker] = {}
+_registry_lock = threading.Lock()
+_retry_budget = RetryBudget()
 
 
 def get_client() -> httpx.Client:
@@ -24,26 +80,173 @@ def get_client() -> httpx.Client:
                 "Content-Type": "application/json",
                 "Prefer": "return=representation",
             },
-            timeout=10.0,
+            timeout=SUPABASE_TIMEOUT_SECONDS,
         )
     return _client
 
 
+def get_breaker(table: str) -> CircuitBreaker:
+    with _registry_lock:
+        if table not in _breakers:
+            _breakers[table] = CircuitBreaker(table)
+        return _breakers[table]
+
+
+def _tracker(op: str, table: str) -> LatencyTracker:
+    with _registry_lock:
+        if (op, table) not in _trackers:
+            _trackers[(op, table)] = LatencyTracker(op, table)
+        return _trackers[(op, table)]
+
+
+def _upstream_failure(e: httpx.HTTPError) -> bool:
+    """Whether the error counts against the breaker (vs. a bad request Supabase answered)."""
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500 or e.response.status_code == 429
+    return isinstance(e, httpx.TransportError)
+
+
+def _retryable(e: httpx.HTTPError, idempotent: bool) -> bool:
+    # Never reached the database, or was turned away before running
+    if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code in (429, 503):
+        return True
+    return idempotent
+
+
+def _request(op: str, table: str, method: str, path: str, idempotent: bool = False, **kwargs) -> httpx.Response:
+    """Send one REST call with breaker, adaptive timeout and budgeted retries."""
+    breaker = get_breaker(table)
+    tracker = _tracker(op, table)
+    if not breaker.allow():
+        SHORT_CIRCUITS.inc(table)
+        raise CircuitOpenError(f"Circuit open for {table}")
+    client = get_client()
+    attempt = 0
+    while True:
+        # A retry after a timeout gets the full timeout, in case the call is legitimately slow
+        timeout = tracker.timeout() if attempt == 0 else SUPABASE_TIMEOUT_SECONDS
+        start = time.perf_counter()
+        try:
+            with supabase_timer(op, table):
+                resp = client.request(method, path, timeout=timeout, **kwargs)
+                if resp.status_code >= 400 and op in ("PATCH", "UPSERT"):
+                    logger.error(f"Supabase {resp.status_code} on {op} /{table}: {resp.text}")
+                resp.raise_for_status()
+        except httpx.HTTPError as e:
+            if not _upstream_failure(e):
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if (attempt >= SUPABASE_MAX_RETRIES or not _retryable(e, idempotent)
+                    or not breaker.allow() or not _retry_budget.withdraw()):
+                raise
+            attempt += 1
+            RETRIES.inc(table)
+            time.sleep(backoff_seconds(attempt))
+            continue
+        breaker.record_success()
+        tracker.record(time.perf_counter() - start)
+        if attempt == 0:
+            _retry_budget.deposit()
+        return resp
+
+
+# --- spooled writes ---
+
+def _spoolable(table: str) -> bool:
+    return bool(SUPABASE_URL) and table not in UNSPOOLED_TABLES
+
+
+def _spool(kind: str, table: str, rows: list[dict], on_conflict: str | None = None) -> list[dict]:
+    if kind == "insert":
+        now = datetime.utcnow().isoformat()
+        stamped = []
+        for row in rows:
+            row = {**{column: now for column in STAMP_COLUMNS.get(table, ())}, **row}
+            if table not in NATURAL_KEY_TABLES and not row.get("id"):
+                row["id"] = str(uuid.uuid4())
+            stamped.append(row)
+        rows = stamped
+    get_write_spool().append({
+        "op": kind, "table": table, "rows": rows, "on_conflict": on_conflict,
+        "spooled_at": datetime.utcnow().isoformat(),
+    })
+    return rows
+
+
+def _write(kind: str, table: str, rows: list[dict], send, on_conflict: str | None = None) -> list:
+    """Send a write, or spool it while the table's breaker is open. Returns the written rows."""
+    spoolable = _spoolable(table)
+    if not (spoolable and (get_write_spool().has_pending() or get_breaker(table).is_open())):
+        try:
+            return send()
+        except CircuitOpenError:
+            if not spoolable:
+                raise
+    return _spool(kind, table, rows, on_conflict)
+
+
+def replay_spooled_writes() -> int:
+    """Replay spooled writes in order until done or Supabase fails again. Returns entries replayed."""
+    spool = get_write_spool()
+    replayed = 0
+    for name in spool.claim():
+        entries = spool.read(name)
+        done = 0
+        try:
+            for entry in entries:
+                try:
+                    _replay(entry)
+                except httpx.HTTPStatusError as e:
+                    status = e.response.status_code
+                    if status >= 500 or status in (408, 429):
+                        raise
+                    spool.reject(entry, f"{status} {e.response.text}")
+                done += 1
+        finally:
+            spool.keep(name, entries[done:])
+            replayed += done
+    return replayed
+
+
+def _replay(entry: dict):
+    table = entry["table"]
+    if entry["op"] == "insert":
+        # Ignore rows already written by an earlier, interrupted replay
+        _request("POST", table, "POST", f"/{table}", idempotent=True, json=entry["rows"],
+                 headers={"Prefer": "resolution=ignore-duplicates,return=minimal"})
+    elif entry["op"] == "update":
+        _request("PATCH", table, "PATCH", f"/{table}", idempotent=True, params=entry["match"],
+                 json=entry["data"], headers={"Prefer": "return=minimal"})
+    else:
+        _request("UPSERT", table, "POST", f"/{table}", idempotent=True, json=entry["rows"],
+                 params={"on_conflict": entry["on_conflict"]},
+                 headers={"Prefer": "resolution=merge-duplicates,return=minimal"})
+
+
+# --- table operations ---
+
 def table_insert(table: str, data: dict) -> dict:
     """INSERT a row into a table. Returns the inserted row."""
-    client = get_client()
-    resp = client.post(f"/{table}", json=data)
-    resp.raise_for_status()
-    rows = resp.json()
+    def send():
+        return _request("POST", table, "POST", f"/{table}", json=data).json()
+
+    rows = _write("insert", table, [data], send)
     return rows[0] if isinstance(rows, list) and rows else rows
 
 
+def table_insert_many(table: str, rows: list[dict]) -> list:
+    """INSERT several rows in one request. Returns the inserted rows."""
+    if not rows:
+        return []
+    return _write("insert", table, rows, lambda: _request("POST", table, "POST", f"/{table}", json=rows).json())
+
+
 def table_select(table: str, params: dict | None = None) -> list:
     """SELECT rows from a table/view with optional query params."""
-    client = get_client()
-    resp = client.get(f"/{table}", params=params or {})
-    resp.raise_for_status()
-    return resp.json()
+    return _request("GET", table, "GET", f"/{table}", idempotent=True, params=params or {}).json()
 
 
 def table_select_one(table: str, params: dict | None = None) -> dict | None:
@@ -54,9 +257,39 @@ def table_select_one(table: str, params: dict | None = None) -> dict | None:
 
 def table_update(table: str, match_params: dict, data: dict) -> list:
     """UPDATE rows matching params."""
-    client = get_client()
-    resp = client.patch(f"/{table}", params=match_params, json=data)
-    if resp.status_code >= 400:
-        print(f"[Supabase ERROR] {resp.status_code} on PATCH /{table}: {resp.text}")
-    resp.raise_for_status()
-    return resp.json()
+    if _spoolable(table) and get_write_spool().has_pending():
+        spooled = get_write_spool().spooled_rows(table, match_params)
+        if spooled:
+            get_write_spool().append({
+                "op": "update", "table": table, "match": match_params, "data": data,
+                "spooled_at": datetime.utcnow().isoformat(),
+            })
+            return [{**row, **data} for row in spooled]
+    return _request("PATCH", table, "PATCH", f"/{table}", params=match_params, json=data).json()
+
+
+def table_delete(table: str, match_params: dict) -> list:
+    """DELETE rows matching params. Returns the deleted rows."""
+    return _request("DELETE", table, "DELETE", f"/{table}", idempotent=True, params=match_params).json()
+
+
+def table_upsert(table: str, rows: list[dict], on_conflict: str) -> list:
+    """INSERT rows, merging into existing rows that collide on `on_conflict` columns."""
+    if not rows:
+        return []
+
+    def send():
+        return _request(
+            "UPSERT", table, "POST", f"/{table}",
+            idempotent=True,
+            params={"on_conflict": on_conflict},
+            json=rows,
+            headers={"Prefer": "resolution=merge-duplicates,return=representation"},
+        ).json()
+
+    return _write("upsert", table, rows, send, on_conflict)
+
+
+def rpc(function: str, args: dict | None = None):
+    """Call a Postgres function exposed by PostgREST. Returns its result."""
+    return _request("RPC", function, "POST", f"/rpc/{function}", json=args or {}).json()
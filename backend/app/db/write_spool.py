@@ -0,0 +1,209 @@
+"""Local spool for Supabase writes made while a table's circuit breaker is open.
+
+Each write is appended as one JSON line to `pending.jsonl` under
+SUPABASE_SPOOL_DIR and fsynced before the caller gets its result back. The
+replay worker (app/services/write_replay.py) claims the file by renaming it
+to `replay-<ns>.jsonl`, then replays the entries in order. Entries it has
+replayed are dropped from the file, so a crash in the middle does not replay
+them twice. Any entry Supabase rejects outright (a 4xx) goes to
+`rejected.jsonl` for a human to look at.
+
+Replayed inserts ignore duplicates on the primary key, so the spool is safe
+to replay twice, e.g. by two workers sharing a directory.
+
+The spool keeps an in-memory view of what it holds: per file, the entry
+count and the rows spooled for each table, with spooled updates applied to
+them. `spooled_rows` lets an update aimed at a row that only exists in the
+spool be spooled behind it instead of silently matching nothing. The view
+is refreshed from disk when this worker appends or records replay
+progress, and by the replay worker's `pending()` check every few seconds.
+A refresh reads only what was appended since (a file that was replaced is
+reread), and is how the spool sees entries appended or replayed by other
+workers sharing the directory.
+`has_pending()` only reads the last refreshed count, so writes made while
+Supabase is healthy cost no filesystem calls and take no lock.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from app.utils.metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SUPABASE_SPOOL_DIR = os.getenv("SUPABASE_SPOOL_DIR", os.path.join(BASE_DIR, "supabase_spool"))
+
+PENDING = "pending.jsonl"
+REJECTED = "rejected.jsonl"
+
+SPOOLED = counter("supabase_spooled_writes_total", "Writes diverted to the local spool", ("table",))
+SPOOL_PENDING = gauge("supabase_spool_pending", "Spooled writes not yet replayed to Supabase")
+
+
+def _filter_value(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _match(row: dict, match_params: dict) -> bool | None:
+    """Whether a row passes PostgREST filters; None if a filter is not one we evaluate."""
+    for column, condition in match_params.items():
+        if condition == "is.null":
+            if row.get(column) is not None:
+                return False
+        elif condition.startswith("eq."):
+            if column not in row or _filter_value(row[column]) != condition[3:]:
+                return False
+        else:
+            return None
+    return True
+
+
+class _SpoolFile:
+    def __init__(self, inode: int):
+        self.inode = inode
+        self.offset = 0  # bytes read so far, always at a line boundary
+        self.count = 0
+        self.rows: dict[str, list[dict]] = {}  # table -> rows spooled in this file
+
+
+class WriteSpool:
+    def __init__(self, directory: str = SUPABASE_SPOOL_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._files: dict[str, _SpoolFile] = {}
+        self._count = 0  # entries held as of the last refresh
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _replay_files(self) -> list[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f for f in os.listdir(self.directory) if f.startswith("replay-") and f.endswith(".jsonl"))
+
+    def _refresh(self):
+        """Bring the in-memory view in line with the files on disk (lock held)."""
+        current = {}
+        for name in [*self._replay_files(), PENDING]:  # oldest first
+            try:
+                st = os.stat(self._path(name))
+            except FileNotFoundError:
+                continue
+            known = self._files.get(name)
+            if known is None or known.inode != st.st_ino:
+                # claim() renames the pending file without rewriting it
+                known = self._files.get(PENDING) if name != PENDING else None
+            if known is None or known.inode != st.st_ino or st.st_size < known.offset:
+                known = _SpoolFile(st.st_ino)  # new, or rewritten by keep()
+            current[name] = known
+            if st.st_size > known.offset:
+                self._read_tail(name, known, current.values())
+        self._files = current
+        self._count = sum(f.count for f in current.values())
+        SPOOL_PENDING.set(self._count)
+
+    def _read_tail(self, name: str, spool_file: _SpoolFile, files):
+        with open(self._path(name), "rb") as f:
+            f.seek(spool_file.offset)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]  # leave a line still being written for later
+        spool_file.offset += len(complete)
+        for line in complete.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            spool_file.count += 1
+            if entry["op"] == "update":
+                for row in self._spooled(entry["table"], entry["match"], files):
+                    row.update(entry["data"])
+            else:
+                spool_file.rows.setdefault(entry["table"], []).extend(dict(row) for row in entry["rows"])
+
+    def _spooled(self, table: str, match_params: dict, files) -> list[dict]:
+        return [
+            row for spool_file in files for row in spool_file.rows.get(table, ())
+            if _match(row, match_params)
+        ]
+
+    def pending(self) -> int:
+        """Entries not yet replayed, re-read from disk."""
+        with self._lock:
+            self._refresh()
+            return self._count
+
+    def has_pending(self) -> bool:
+        """Whether entries were waiting at the last refresh (no disk access)."""
+        return self._count > 0
+
+    def spooled_rows(self, table: str, match_params: dict) -> list[dict]:
+        """Rows of `table` still in the spool that `match_params` filters would select."""
+        with self._lock:
+            self._refresh()
+            return [dict(row) for row in self._spooled(table, match_params, self._files.values())]
+
+    def append(self, entry: dict):
+        line = json.dumps(entry, default=str) + "\n"
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(PENDING), "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._refresh()
+        SPOOLED.inc(entry["table"])
+
+    def claim(self) -> list[str]:
+        """Move new entries out of the way of appends; returns replay files, oldest first."""
+        with self._lock:
+            pending = self._path(PENDING)
+            if os.path.exists(pending) and os.path.getsize(pending):
+                os.replace(pending, self._path(f"replay-{time.time_ns():020d}.jsonl"))
+            return self._replay_files()
+
+    def read(self, name: str) -> list[dict]:
+        try:
+            with open(self._path(name), encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []  # finished by another worker sharing the directory
+
+    def keep(self, name: str, remaining: list[dict]):
+        """Record progress on a replay file: `remaining` entries are still to go."""
+        path = self._path(name)
+        if remaining:
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(e, default=str) + "\n" for e in remaining)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # another worker sharing the directory finished it first
+        with self._lock:
+            self._refresh()
+
+    def reject(self, entry: dict, error: str):
+        with self._lock:
+            with open(self._path(REJECTED), "a", encoding="utf-8") as f:
+                f.write(json.dumps({**entry, "error": error}, default=str) + "\n")
+        logger.error(f"Spooled {entry['op']} on {entry['table']} rejected by Supabase: {error}")
+
+
+_spool: WriteSpool | None = None
+
+
+def get_write_spool() -> WriteSpool:
+    """Return the process-wide write spool."""
+    global _spool
+    if _spool is None:
+        _spool = WriteSpool()
+    return _spool
@@ -1,6 +1,9 @@
 """FastAPI application entry point."""
 
+import asyncio
+import logging
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
@@ -9,12 +12,69 @@ from app.routes import dashboard
 from app.routes.ehr import router as ehr_router
 from app.routes.patients import router as patients_router
 from app.init_db import init_db
+from app.services.rollup import start_rollup_worker, stop_rollup_worker
+from app.services.triage_queue import load_queue, start_triage_queue_resync, stop_triage_queue_resync
+from app.services.wait_estimator import seed_wait_estimator, start_wait_estimator_sync, stop_wait_estimator_sync
+from app.services.bed_index import load_bed_index, start_bed_index_resync, stop_bed_index_resync
+from app.services.lab_scheduler import load_lab_scheduler, start_lab_scheduler_resync, stop_lab_scheduler_resync
+from app.services.ehr_pool import shutdown_pool
+from app.services.ehr_import import resume_import_jobs, stop_import_jobs
+from app.services.transcription import shutdown_transcription_pool
+from app.services.feedback_log import start_feedback_log, stop_feedback_log
+from app.services.model_refresh import start_model_refresh, stop_model_refresh
+from app.services.write_replay import start_write_replay, stop_write_replay
+from app.utils.admission import ADMISSION_MAX_IN_FLIGHT, AdmissionMiddleware
+from app.utils.metrics import MetricsMiddleware, render_prometheus
+from app.utils.profiler import ProfilerMiddleware, debug_enabled
+
+logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Initialize DB on startup
     init_db()
+    # Rebuild the live triage queue from open triages
+    try:
+        await asyncio.to_thread(load_queue)
+        seed_wait_estimator()
+    except Exception as e:
+        logger.error(f"Failed to load triage queue: {e}")
+    start_triage_queue_resync()
+    start_wait_estimator_sync()
+    # Load bed availability so free-bed lookups never hit the database
+    try:
+        await asyncio.to_thread(load_bed_index)
+    except Exception as e:
+        logger.error(f"Failed to load bed index: {e}")
+    start_bed_index_resync()
+    # Drain writes spooled locally while Supabase was unavailable
+    start_write_replay()
+    # Load lab slot calendars from pending bookings
+    try:
+        await asyncio.to_thread(load_lab_scheduler)
+    except Exception as e:
+        logger.error(f"Failed to load lab scheduler: {e}")
+    start_lab_scheduler_resync()
+    # Keep the reporting rollup tables fed in the background
+    start_rollup_worker()
+    # Open the feedback log and its index
+    await start_feedback_log()
+    # Fold clinician priority corrections back into the triage model
+    start_model_refresh()
+    # Pick up EHR imports interrupted by the last shutdown
+    await resume_import_jobs()
     yield
+    await stop_import_jobs()
+    await stop_model_refresh()
+    await stop_feedback_log()
+    await stop_rollup_worker()
+    await stop_wait_estimator_sync()
+    await stop_triage_queue_resync()
+    await stop_bed_index_resync()
+    await stop_lab_scheduler_resync()
+    await stop_write_replay()
+    shutdown_pool()
+    shutdown_transcription_pool()
 
 app = FastAPI(
     title="AI Triage API",
@@ -23,6 +83,10 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Shed dashboard reads before triage when the worker is saturated (inside CORS so 503s carry CORS headers)
+if ADMISSION_MAX_IN_FLIGHT > 0:
+    app.add_middleware(AdmissionMiddleware)
+
 # CORS middleware for frontend communication
 app.add_middleware(
     CORSMiddleware,
@@ -31,6 +95,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request latency histograms, exported at /metrics
+app.add_middleware(MetricsMiddleware)
+# Per-request profiling is only wired in when DEBUG_TOKEN is set
+if debug_enabled():
+    app.add_middleware(ProfilerMiddleware)
 
 # Include routes
 app.include_router(triage_router, prefix="/api")
@@ -44,6 +113,18 @@ app.include_router(resources_router, prefix="/api")
 from app.routes.voice import router as voice_router
 app.include_router(voice_router, prefix="/api")
 
+from app.routes.analytics import router as analytics_router
+app.include_router(analytics_router, prefix="/api")
+
+from app.routes.queue import router as queue_router
+app.include_router(queue_router, prefix="/api")
+
+from app.routes.forecast import router as forecast_router
+app.include_router(forecast_router, prefix="/api")
+
+from app.routes.debug import router as debug_router
+app.include_router(debug_router)
+
 
 @app.get("/")
 async def root():
@@ -53,3 +134,9 @@ async def root():
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
@@ -1,9 +1,14 @@
 """Load and run the disease prediction model."""
 
+import logging
 import os
 import numpy as np
 import joblib
 
+from app.utils import model_client
+
+logger = logging.getLogger(__name__)
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 MODEL_PATH = os.path.join(BASE_DIR, "saved_models", "disease_model.joblib")
 ENCODER_PATH = os.path.join(BASE_DIR, "saved_models", "disease_label_encoder.joblib")
@@ -15,12 +20,20 @@ _symptom_columns = None
 
 
 def get_model():
-    global _model, _label_encoder, _symptom_columns
+    global _model
     if _model is None:
         _model = joblib.load(MODEL_PATH)
+    label_encoder, symptom_columns = get_metadata()
+    return _model, label_encoder, symptom_columns
+
+
+def get_metadata():
+    """Label encoder and symptom columns, without loading the (large) model itself."""
+    global _label_encoder, _symptom_columns
+    if _label_encoder is None:
         _label_encoder = joblib.load(ENCODER_PATH)
         _symptom_columns = joblib.load(COLUMNS_PATH)
-    return _model, _label_encoder, _symptom_columns
+    return _label_encoder, _symptom_columns
 
 
 def predict_disease(symptom_features: np.ndarray) -> dict:
@@ -32,12 +45,31 @@ def predict_disease(symptom_features: np.ndarray) -> dict:
     Returns:
         dict with predicted_disease, disease_confidence, top_diseases
     """
-    model, label_encoder, _ = get_model()
-    prediction = model.predict(symptom_features)[0]
-    probabilities = model.predict_proba(symptom_features)[0]
+    return predict_disease_batch(symptom_features)[0]
+
+
+def predict_disease_batch(symptom_features: np.ndarray) -> list[dict]:
+    """Predict diseases for every row of an (n, num_symptoms) matrix in one model call."""
+    label_encoder, _ = get_metadata()
+    if model_client.enabled():
+        try:
+            predictions, probabilities, _ = model_client.predict(model_client.MODEL_DISEASE, symptom_features)
+        except model_client.ModelServerUnavailable as e:
+            logger.warning(f"Model server unavailable ({e}); predicting disease in-process")
+            predictions, probabilities = predict_local(symptom_features)
+    else:
+        predictions, probabilities = predict_local(symptom_features)
+    names = label_encoder.inverse_transform(predictions)
+    return [_disease_result(name, row, label_encoder) for name, row in zip(names, probabilities)]
+
+
+def predict_local(symptom_features: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Raw encoded labels and class probabilities from the model loaded in this process."""
+    model, _, _ = get_model()
+    return model.predict(symptom_features), model.predict_proba(symptom_features)
 
-    predicted_disease = label_encoder.inverse_transform([prediction])[0]
 
+def _disease_result(predicted_disease: str, probabilities: np.ndarray, label_encoder) -> dict:
     # Confidence calculation for many-class models:
     # Raw max probability is tiny (0.5% for 721 classes). Instead, use how much
     # the top prediction stands out relative to a uniform baseline (1/N).
@@ -82,5 +114,5 @@ def predict_disease(symptom_features: np.ndarray) -> dict:
 
 def get_symptom_columns() -> list[str]:
     """Return the list of symptom column names used by the model."""
-    _, _, symptom_columns = get_model()
+    _, symptom_columns = get_metadata()
     return symptom_columns
@@ -1,79 +1,111 @@
+"""Heuristic length-of-stay (LOS) estimator.
 
-def predict_los(risk_level: str, predicted_disease: str, age: int, vitals: dict) -> dict:
-    """
-    Predict Length of Stay (LOS) based on heuristic rules.
-    """
-    days = 0
-    confidence = 1.0  # Start with high confidence
-
-    # 1. Base days by risk level
-    if risk_level.lower() == "high":
-        days += 7
-    elif risk_level.lower() == "medium":
-        days += 3
-    else:
-        days += 1
-
-    # 2. Disease modifiers
+Vitals are numeric (NaN or None when not recorded), and every rule is an
+array expression, so `estimate_los` scores N patients in one NumPy pass.
+Single intakes, batch imports and census forecasts all share it. The
+disease keyword rules are resolved once per disease name and then cached.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+RISK_BASE_DAYS = {"high": 7, "medium": 3, "low": 1}
+
+# First matching keyword group wins; minor conditions shorten the stay (min 1 day)
+DISEASE_RULES = [
+    (3, ["cardiac", "heart", "myocardial", "stroke", "neuro"]),
+    (2, ["pneumonia", "asthma", "copd", "respiratory", "lung"]),
+    (1, ["infection", "sepsis", "viral", "bacterial", "covid"]),
+    (-1, ["rash", "dermatitis", "acne", "ent", "ear", "nose", "throat"]),
+]
+
+# Values assumed for vitals that were not recorded (all within normal range)
+DEFAULT_HEART_RATE = 75
+DEFAULT_SYSTOLIC_BP = 120
+DEFAULT_OXYGEN_SATURATION = 98
+DEFAULT_TEMPERATURE_F = 98.6
+
+
+@lru_cache(maxsize=None)
+def disease_modifier(predicted_disease: str) -> int:
+    """Extra days for a disease, from the first keyword group it matches."""
     disease_lower = predicted_disease.lower()
-    if any(k in disease_lower for k in ["cardiac", "heart", "myocardial", "stroke", "neuro"]):
-        days += 3
-    elif any(k in disease_lower for k in ["pneumonia", "asthma", "copd", "respiratory", "lung"]):
-        days += 2
-    elif any(k in disease_lower for k in ["infection", "sepsis", "viral", "bacterial", "covid"]):
-        days += 1
-    elif any(k in disease_lower for k in ["rash", "dermatitis", "acne", "ent", "ear", "nose", "throat"]):
-        days = max(1, days - 1) # Reduce stay for minor issues, but min 1 day
-
-    # 3. Age modifier
-    if age > 60:
-        extra_days = (age - 60) // 10
-        days += extra_days
-
-    # 4. Vitals severity penalties
-    # Heart Rate
-    try:
-        hr_val = vitals.get("heart_rate") or vitals.get("hr", 75)
-        hr = int(float(hr_val)) # Handle "98.0" strings
-    except:
-        hr = 75
-
-    if not (60 <= hr <= 100):
-        days += 1
-        confidence -= 0.1
-
-    # Blood Pressure (Systolic)
-    bp = vitals.get("blood_pressure") or vitals.get("bp", "120/80")
-    try:
-        systolic = int(str(bp).split("/")[0])
-        if systolic > 140 or systolic < 90:
-            days += 1
-            confidence -= 0.1
-    except:
-        pass
-
-    # SpO2
-    try:
-        spo2_val = vitals.get("oxygen_saturation") or vitals.get("spo2", 98)
-        spo2 = int(float(spo2_val))
-    except:
-        spo2 = 98
-
-    if spo2 < 95:
-        days += 2
-        confidence -= 0.2
-
-    # Temperature
-    try:
-        temp_val = vitals.get("temperature") or vitals.get("temp", 98.6)
-        temp = float(temp_val)
-    except:
-        temp = 98.6
-
-    if temp > 100.4 or temp < 96.0:
-        days += 1
-
-    return {
-        "estimated_los_days": int(days),
-        "los_confidence": round(max(0.1, min(1.0, confidence)), 2)
-    }
+    for days, keywords in DISEASE_RULES:
+        if any(k in disease_lower for k in keywords):
+            return days
+    return 0
+
+
+def _vital(values, default: float) -> np.ndarray:
+    array = np.asarray(values, dtype=float)  # None becomes NaN
+    return np.where(np.isnan(array), default, array)
+
+
+def estimate_los(
+    risk_levels,
+    predicted_diseases,
+    ages,
+    heart_rate,
+    systolic_bp,
+    oxygen_saturation,
+    temperature_f,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Estimated days and confidence for N patients.
+
+    Every argument is a length-N sequence or array; missing vitals are None or NaN.
+    """
+    base = np.array([RISK_BASE_DAYS.get(r.lower(), 1) for r in risk_levels])
+    modifier = np.array([disease_modifier(d) for d in predicted_diseases])
+    ages = np.asarray(ages, dtype=float)
+    hr = np.trunc(_vital(heart_rate, DEFAULT_HEART_RATE))
+    systolic = np.trunc(_vital(systolic_bp, DEFAULT_SYSTOLIC_BP))
+    spo2 = np.trunc(_vital(oxygen_saturation, DEFAULT_OXYGEN_SATURATION))
+    temp = _vital(temperature_f, DEFAULT_TEMPERATURE_F)
+
+    hr_abnormal = ((hr < 60) | (hr > 100)).astype(int)
+    bp_abnormal = ((systolic < 90) | (systolic > 140)).astype(int)
+    hypoxic = (spo2 < 95).astype(int)
+    febrile = ((temp > 100.4) | (temp < 96.0)).astype(int)
+
+    days = np.maximum(1, base + modifier)
+    days += np.where(ages > 60, (ages - 60) // 10, 0).astype(int)
+    days += hr_abnormal + bp_abnormal + 2 * hypoxic + febrile
+
+    confidence = 1.0 - 0.1 * hr_abnormal - 0.1 * bp_abnormal - 0.2 * hypoxic
+    return days, np.round(np.clip(confidence, 0.1, 1.0), 2)
+
+
+def predict_los_batch(
+    risk_levels,
+    predicted_diseases,
+    ages,
+    heart_rate,
+    systolic_bp,
+    oxygen_saturation,
+    temperature_f,
+) -> list[dict]:
+    """`estimate_los` as one result dict per patient."""
+    days, confidence = estimate_los(
+        risk_levels, predicted_diseases, ages, heart_rate, systolic_bp, oxygen_saturation, temperature_f
+    )
+    return [
+        {"estimated_los_days": int(d), "los_confidence": float(c)}
+        for d, c in zip(days, confidence)
+    ]
+
+
+def predict_los(
+    risk_level: str,
+    predicted_disease: str,
+    age: int,
+    heart_rate: float | None = None,
+    systolic_bp: float | None = None,
+    oxygen_saturation: float | None = None,
+    temperature_f: float | None = None,
+) -> dict:
+    """Predict Length of Stay (LOS) for one patient based on heuristic rules."""
+    return predict_los_batch(
+        [risk_level], [predicted_disease], [age],
+        [heart_rate], [systolic_bp], [oxygen_saturation], [temperature_f],
+    )[0]
@@ -1,19 +1,54 @@
-"""Load and run the triage level prediction model."""
+"""Load and run the triage level prediction model.
 
+Every prediction also yields per-feature attributions. XGBoost's
+`pred_contribs` output (exact TreeSHAP) splits each class margin into one
+contribution per feature plus a bias, and those sum back to the margin.
+So the class probabilities are the softmax of the summed contributions, and
+a single model pass gives both the prediction and its explanation.
+"""
+
+import logging
 import os
+import time
+import threading
+from collections import OrderedDict
 import numpy as np
 import joblib
+import xgboost as xgb
+
+from app.utils import model_client
+
+logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 MODEL_PATH = os.path.join(BASE_DIR, "saved_models", "triage_model.joblib")
 
+FEATURE_NAMES = ["age", "heart_rate", "systolic_bp", "oxygen_saturation", "body_temperature", "chronic_disease_count"]
+
+# How often to check whether a refreshed model was published (see model_refresh)
+RELOAD_CHECK_SECONDS = float(os.getenv("MODEL_RELOAD_CHECK_SECONDS", "30"))
+# Predictions cached by feature vector; many intakes share the same (defaulted) vitals
+TRIAGE_CACHE_SIZE = int(os.getenv("TRIAGE_CACHE_SIZE", "4096"))
+
 _model = None
+_model_mtime = 0.0
+_next_check = 0.0
+_cache: OrderedDict[bytes, tuple] = OrderedDict()
+_cache_expires = 0.0
+_cache_lock = threading.Lock()  # batch imports predict from worker threads
 
 
 def get_model():
-    global _model
-    if _model is None:
-        _model = joblib.load(MODEL_PATH)
+    global _model, _model_mtime, _next_check
+    now = time.monotonic()
+    if _model is None or now >= _next_check:
+        _next_check = now + RELOAD_CHECK_SECONDS
+        mtime = os.path.getmtime(MODEL_PATH)
+        if _model is None or mtime != _model_mtime:
+            _model = joblib.load(MODEL_PATH)
+            _model_mtime = mtime
+            with _cache_lock:
+                _cache.clear()
     return _model
 
 
@@ -24,11 +59,81 @@ def predict_triage(features: np.ndarray) -> dict:
         features: shape (1, 6) - [age, heart_rate, systolic_bp, oxygen_sat, body_temp, chronic_disease_count]
 
     Returns:
-        dict with risk_level, priority_score, confidence, triage_level
+        dict with risk_level, priority_score, confidence, triage_level and
+        feature_contributions (feature name -> push towards a higher triage level)
+    """
+    return predict_triage_batch(features)[0]
+
+
+def predict_triage_batch(features: np.ndarray) -> list[dict]:
+    """Predict triage for every row of an (n, 6) feature matrix in one model call."""
+    global _cache_expires
+    features = np.ascontiguousarray(features, dtype=np.float64)
+    if model_client.enabled():
+        # The server reloads refreshed models on its own; expire entries on the same schedule
+        now = time.monotonic()
+        if now >= _cache_expires:
+            with _cache_lock:
+                _cache.clear()
+            _cache_expires = now + RELOAD_CHECK_SECONDS
+
+    keys = [row.tobytes() for row in features]
+    with _cache_lock:
+        results = [_cache.get(key) for key in keys]
+        for key, result in zip(keys, results):
+            if result is not None:
+                _cache.move_to_end(key)
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        rows = features[missing]
+        if model_client.enabled():
+            try:
+                levels, probabilities, contributions = model_client.predict(model_client.MODEL_TRIAGE, rows)
+                contributions = contributions.reshape(len(rows), probabilities.shape[1], -1)
+            except model_client.ModelServerUnavailable as e:
+                logger.warning(f"Model server unavailable ({e}); predicting triage in-process")
+                levels, probabilities, contributions = predict_local(rows)
+        else:
+            levels, probabilities, contributions = predict_local(rows)
+        with _cache_lock:
+            for j, i in enumerate(missing):
+                results[i] = _cache[keys[i]] = _triage_result(int(levels[j]), probabilities[j], contributions[j])
+            while len(_cache) > TRIAGE_CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    # Callers may modify their result; the cached one must stay intact
+    return [{**r, "feature_contributions": dict(r["feature_contributions"])} for r in results]
+
+
+def predict_local(features: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Levels, class probabilities and per-class feature contributions from the local model.
+
+    Contributions have shape (n, n_classes, n_features + 1); the last column is the bias.
     """
     model = get_model()
-    triage_level = int(model.predict(features)[0])
-    probabilities = model.predict_proba(features)[0]
+    contributions = model.get_booster().predict(xgb.DMatrix(features), pred_contribs=True)
+    margins = contributions.sum(axis=2)
+    exp = np.exp(margins - margins.max(axis=1, keepdims=True))
+    probabilities = exp / exp.sum(axis=1, keepdims=True)
+    return probabilities.argmax(axis=1), probabilities, contributions
+
+
+def _severity_contributions(contributions: np.ndarray) -> np.ndarray:
+    """Collapse per-class contributions to one signed number per feature.
+
+    Each class margin is weighted by its level, centred on zero (-1.5, -0.5,
+    0.5, 1.5 for four levels). A positive value pushes the patient towards
+    more urgent levels and a negative one towards less urgent levels. The
+    weights sum to zero, so a shift shared by every class (which softmax
+    ignores) cancels out.
+    """
+    n_classes = contributions.shape[0]
+    weights = np.arange(n_classes) - (n_classes - 1) / 2
+    return weights @ contributions[:, :-1]
+
+
+def _triage_result(triage_level: int, probabilities: np.ndarray, contributions: np.ndarray) -> dict:
     confidence = int(round(float(np.max(probabilities)) * 100))
 
     # Map triage level to risk level and base priority score range
@@ -56,4 +161,8 @@ def predict_triage(features: np.ndarray) -> dict:
         "priority_score": priority_score,
         "confidence": confidence,
         "triage_level": triage_level,
+        "feature_contributions": {
+            name: round(float(value), 4)
+            for name, value in zip(FEATURE_NAMES, _severity_contributions(contributions))
+        },
     }
@@ -0,0 +1,48 @@
+"""Historical analytics endpoints served from the pre-aggregated rollup tables."""
+
+from datetime import date, datetime, timedelta
+from fastapi import APIRouter, Query
+from app.db.supabase_client import table_select
+
+router = APIRouter()
+
+
+@router.get("/analytics/daily")
+async def get_daily_trends(days: int = Query(30, ge=1, le=366)):
+    """Daily patient volume, risk mix and wait-time trend for the last N days."""
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+    return table_select("daily_stats", {
+        "stat_date": f"gte.{since}",
+        "order": "stat_date.asc",
+    })
+
+
+@router.get("/analytics/hourly")
+async def get_hourly_stats(stat_date: date | None = None):
+    """Hour-by-hour arrivals and risk mix for one day (defaults to today)."""
+    day = (stat_date or datetime.utcnow().date()).isoformat()
+    return table_select("hourly_stats", {
+        "stat_date": f"eq.{day}",
+        "order": "stat_hour.asc",
+    })
+
+
+@router.get("/analytics/departments")
+async def get_department_performance(days: int = Query(7, ge=1, le=366)):
+    """Per-department throughput and time-to-treatment for the last N days."""
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+    return table_select("department_performance", {
+        "stat_date": f"gte.{since}",
+        "order": "stat_date.asc,department_id.asc",
+    })
+
+
+@router.get("/analytics/snapshots/{department_id}")
+async def get_department_snapshots(department_id: str, hours: int = Query(24, ge=1, le=24 * 14)):
+    """Occupancy and wait-time snapshots for one department over the last N hours."""
+    since = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+    return table_select("department_snapshots", {
+        "department_id": f"eq.{department_id}",
+        "recorded_at": f"gte.{since}",
+        "order": "recorded_at.asc",
+    })
@@ -0,0 +1,154 @@
+"""Debug endpoints: profiling toggle and tracemalloc snapshots.
+
+Only served when DEBUG_TOKEN is set, and every call must send it as
+`X-Debug-Token`. Otherwise these routes answer 404 as if they did not exist.
+"""
+
+import os
+import resource
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException
+from pydantic import BaseModel
+
+from app.utils.profiler import DEBUG_PROFILE_DIR, debug_enabled, profiling_settings, token_valid
+
+MAX_SNAPSHOTS = 10
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "10"))
+
+_snapshots: OrderedDict[int, dict] = OrderedDict()
+_next_snapshot_id = 1
+
+
+def require_debug_token(x_debug_token: str | None = Header(default=None)):
+    if not debug_enabled():
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token_valid(x_debug_token):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
+
+router = APIRouter(prefix="/debug", dependencies=[Depends(require_debug_token)])
+
+
+class ProfilingToggle(BaseModel):
+    sample_rate: float  # 0 disables sampling; header-triggered profiles still work
+    path_prefix: str = "/api"
+
+
+def rss_bytes() -> int:
+    """Current resident set size (falls back to peak RSS off Linux)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _stat_row(stat) -> dict:
+    frame = stat.traceback[0]
+    return {
+        "location": f"{frame.filename}:{frame.lineno}",
+        "size_kb": round(stat.size / 1024, 1),
+        "count": stat.count,
+        **({"size_diff_kb": round(stat.size_diff / 1024, 1), "count_diff": stat.count_diff}
+           if hasattr(stat, "size_diff") else {}),
+    }
+
+
+# --- profiling ---
+
+@router.get("/profiling")
+async def get_profiling():
+    """Current sampling settings and the most recent profile files."""
+    files = sorted(os.listdir(DEBUG_PROFILE_DIR), reverse=True)[:20] if os.path.isdir(DEBUG_PROFILE_DIR) else []
+    return {**profiling_settings.to_dict(), "recent_profiles": files}
+
+
+@router.post("/profiling")
+async def set_profiling(toggle: ProfilingToggle):
+    """Profile a share of requests under `path_prefix` without the request header."""
+    if not 0 <= toggle.sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="sample_rate must be between 0 and 1")
+    profiling_settings.sample_rate = toggle.sample_rate
+    profiling_settings.path_prefix = toggle.path_prefix
+    return profiling_settings.to_dict()
+
+
+# --- memory ---
+
+@router.get("/memory")
+async def memory_status():
+    """RSS, tracemalloc state and stored snapshot ids."""
+    current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+    return {
+        "rss_mb": round(rss_bytes() / (1024 * 1024), 1),
+        "tracing": tracemalloc.is_tracing(),
+        "traced_current_mb": round(current / (1024 * 1024), 1),
+        "traced_peak_mb": round(peak / (1024 * 1024), 1),
+        "snapshots": [{"id": k, "taken_at": v["taken_at"], "rss_mb": v["rss_mb"]} for k, v in _snapshots.items()],
+    }
+
+
+@router.post("/memory/start")
+async def memory_start():
+    """Start tracing allocations. Tracing slows the worker; stop it when done."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    return await memory_status()
+
+
+@router.post("/memory/stop")
+async def memory_stop():
+    """Stop tracing and drop stored snapshots."""
+    tracemalloc.stop()
+    _snapshots.clear()
+    return await memory_status()
+
+
+@router.post("/memory/snapshot")
+async def memory_snapshot(top: int = 20):
+    """Take a snapshot and return its largest allocation sites."""
+    global _next_snapshot_id
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=409, detail="Tracing is off; POST /debug/memory/start first")
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    snapshot_id = _next_snapshot_id
+    _next_snapshot_id += 1
+    _snapshots[snapshot_id] = {
+        "snapshot": snapshot,
+        "taken_at": datetime.now().isoformat(),
+        "rss_mb": round(rss_bytes() / (1024 * 1024), 1),
+    }
+    while len(_snapshots) > MAX_SNAPSHOTS:
+        _snapshots.popitem(last=False)
+
+    return {
+        "id": snapshot_id,
+        "rss_mb": _snapshots[snapshot_id]["rss_mb"],
+        "top": [_stat_row(s) for s in snapshot.statistics("lineno")[:top]],
+    }
+
+
+@router.get("/memory/diff")
+async def memory_diff(base: int, target: int | None = None, top: int = 20):
+    """Allocation growth between two snapshots (target defaults to the latest)."""
+    if target is None and _snapshots:
+        target = next(reversed(_snapshots))
+    if base not in _snapshots or target not in _snapshots:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    old, new = _snapshots[base], _snapshots[target]
+    stats = new["snapshot"].compare_to(old["snapshot"], "lineno")
+    return {
+        "base": base,
+        "target": target,
+        "rss_diff_mb": round(new["rss_mb"] - old["rss_mb"], 1),
+        "top": [_stat_row(s) for s in stats[:top]],
+    }
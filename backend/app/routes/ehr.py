@@ -1,128 +1,122 @@
-"""EHR document parsing endpoint."""
+"""EHR document parsing endpoints."""
 
-import re
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from docx import Document
+import asyncio
 import io
+import json
+import os
+import zipfile
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.services.ehr_pool import EHR_PARSE_WORKERS, parse_in_pool
+from app.services.ehr_import import create_job, get_job, list_items, list_jobs, requeue_job, start_job
 
 router = APIRouter()
 
+MAX_EHR_BYTES = int(os.getenv("MAX_EHR_BYTES", str(10 * 1024 * 1024)))
+MAX_BULK_BYTES = int(os.getenv("MAX_BULK_BYTES", str(200 * 1024 * 1024)))
+MAX_BULK_FILES = int(os.getenv("MAX_BULK_FILES", "1000"))
+# Total uncompressed size of the documents taken out of zip archives in one upload
+MAX_BULK_INFLATED_BYTES = int(os.getenv("MAX_BULK_INFLATED_BYTES", str(500 * 1024 * 1024)))
+
+READ_CHUNK_BYTES = 64 * 1024
+
+
+async def read_upload(file: UploadFile, limit: int) -> bytes:
+    """Read an upload in chunks, rejecting it as soon as it exceeds `limit` bytes."""
+    chunks = []
+    size = 0
+    while chunk := await file.read(READ_CHUNK_BYTES):
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(
+                status_code=413,
+                detail=f"{file.filename} exceeds the {limit // (1024 * 1024)} MB limit",
+            )
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _too_many_files() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"At most {MAX_BULK_FILES} documents per upload")
 
-def celsius_to_fahrenheit(temp_c: float) -> float:
-    """Convert Celsius to Fahrenheit."""
-    return temp_c * 9 / 5 + 32
 
+def _too_much_inflated() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Archives expand past the {MAX_BULK_INFLATED_BYTES // (1024 * 1024)} MB limit",
+    )
 
-def parse_ehr_docx(file_bytes: bytes) -> dict:
-    """Parse a .docx EHR document and extract structured patient data.
 
-    Expected format (from sample Patient_Record_1.docx):
-    - Title paragraph: "Patient Record #N"
-    - Table 0 (Demographics): Age, Gender rows
-    - Table 1 (Vitals): BP Systolic, BP Diastolic, Heart Rate, Temperature, SpO2, Respiratory Rate
-    - Table 2 (Clinical): Symptoms (comma-separated), Conditions (comma-separated)
-    - Patient Notes paragraph after "Patient Notes" heading
+def read_zip_docx(zip_bytes: bytes, max_files: int, max_bytes: int) -> list[tuple[str, bytes | None]]:
+    """(filename, bytes) for each .docx in a zip, within the upload's remaining file and size budget.
+
+    Members are counted and their declared sizes summed before anything is
+    inflated; declared sizes can lie, so inflation is capped too. Members over
+    the per-file limit come back as (filename, None). Blocking: run in a thread.
     """
-    doc = Document(io.BytesIO(file_bytes))
-
-    result = {
-        "name": "",
-        "age": 0,
-        "gender": "",
-        "blood_pressure_systolic": None,
-        "blood_pressure_diastolic": None,
-        "heart_rate": None,
-        "temperature": None,
-        "oxygen_saturation": None,
-        "respiratory_rate": None,
-        "symptoms": [],
-        "conditions": [],
-        "notes": "",
-    }
-
-    # Extract patient name from title if present
-    for para in doc.paragraphs:
-        if para.style.name == "Title" and para.text.strip():
-            result["name"] = para.text.strip()
-            break
-
-    # Extract notes from paragraphs after "Patient Notes" heading
-    capture_notes = False
-    for para in doc.paragraphs:
-        if "patient notes" in para.text.lower() and para.style.name.startswith("Heading"):
-            capture_notes = True
-            continue
-        if capture_notes and para.text.strip():
-            result["notes"] = para.text.strip()
-            capture_notes = False
-
-    # Parse tables
-    for table in doc.tables:
-        for row in table.rows:
-            cells = [cell.text.strip() for cell in row.cells]
-            if len(cells) < 2:
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+        members = [
+            info for info in zf.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(".docx") and "__MACOSX" not in info.filename
+        ]
+        if len(members) > max_files:
+            raise _too_many_files()
+        if sum(info.file_size for info in members if info.file_size <= MAX_EHR_BYTES) > max_bytes:
+            raise _too_much_inflated()
+
+        documents = []
+        inflated = 0
+        for info in members:
+            if info.file_size > MAX_EHR_BYTES:
+                documents.append((info.filename, None))
+                continue
+            with zf.open(info) as member:
+                data = member.read(MAX_EHR_BYTES + 1)
+            if len(data) > MAX_EHR_BYTES:
+                documents.append((info.filename, None))
                 continue
+            inflated += len(data)
+            if inflated > max_bytes:
+                raise _too_much_inflated()
+            documents.append((info.filename, data))
+    return documents
 
-            label = cells[0].lower()
-            value = cells[1].strip()
-
-            # Demographics
-            if label == "age":
-                try:
-                    result["age"] = int(value)
-                except ValueError:
-                    pass
-            elif label == "gender":
-                result["gender"] = value.lower()
-
-            # Vitals
-            elif "systolic" in label:
-                try:
-                    result["blood_pressure_systolic"] = int(float(value))
-                except ValueError:
-                    pass
-            elif "diastolic" in label:
-                try:
-                    result["blood_pressure_diastolic"] = int(float(value))
-                except ValueError:
-                    pass
-            elif "heart rate" in label:
-                try:
-                    result["heart_rate"] = int(float(value))
-                except ValueError:
-                    pass
-            elif "temperature" in label:
-                try:
-                    temp = float(value)
-                    # Check unit - if in Celsius (< 50), convert to Fahrenheit
-                    unit = cells[2].strip().upper() if len(cells) > 2 else ""
-                    if "C" in unit or temp < 50:
-                        temp = celsius_to_fahrenheit(temp)
-                    result["temperature"] = round(temp, 1)
-                except (ValueError, IndexError):
-                    pass
-            elif "oxygen" in label or "spo2" in label:
-                try:
-                    result["oxygen_saturation"] = int(float(value))
-                except ValueError:
-                    pass
-            elif "respiratory" in label:
-                try:
-                    result["respiratory_rate"] = int(float(value))
-                except ValueError:
-                    pass
-
-            # Clinical
-            elif "symptom" in label:
-                symptoms = [s.strip() for s in value.split(",") if s.strip()]
-                result["symptoms"] = symptoms
-            elif "condition" in label:
-                conditions = [c.strip() for c in value.split(",") if c.strip()]
-                result["conditions"] = conditions
-            elif "name" in label and "patient" in label:
-                result["name"] = value
-
-    return result
+
+async def collect_documents(files: list[UploadFile]) -> list[tuple[str, bytes | None]]:
+    """Read uploaded .docx files and .zip archives into (filename, bytes) pairs.
+
+    Zip members over the per-file limit come back as (filename, None).
+    """
+    documents: list[tuple[str, bytes | None]] = []
+    total = 0
+    inflated = 0
+    for file in files:
+        name = file.filename or ""
+        if name.lower().endswith(".zip"):
+            zip_bytes = await read_upload(file, MAX_BULK_BYTES - total)
+            total += len(zip_bytes)
+            try:
+                members = await asyncio.to_thread(
+                    read_zip_docx, zip_bytes, MAX_BULK_FILES - len(documents), MAX_BULK_INFLATED_BYTES - inflated,
+                )
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"{name} is not a valid zip archive")
+            inflated += sum(len(data) for _, data in members if data is not None)
+            documents.extend(members)
+        elif name.lower().endswith(".docx"):
+            data = await read_upload(file, min(MAX_EHR_BYTES, MAX_BULK_BYTES - total))
+            total += len(data)
+            documents.append((name, data))
+        else:
+            raise HTTPException(status_code=400, detail=f"{name}: only .docx and .zip files are supported")
+
+        if len(documents) > MAX_BULK_FILES:
+            raise _too_many_files()
+
+    if not documents:
+        raise HTTPException(status_code=400, detail="No .docx documents found in upload")
+    return documents
 
 
 @router.post("/parse-ehr")
@@ -135,12 +129,97 @@ async def parse_ehr(file: UploadFile = File(...)):
             detail="Only .docx files are supported. Please upload a Word document.",
         )
 
+    file_bytes = await read_upload(file, MAX_EHR_BYTES)
     try:
-        file_bytes = await file.read()
-        parsed_data = parse_ehr_docx(file_bytes)
+        parsed_data = await parse_in_pool(file_bytes)
         return parsed_data
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail="Timed out parsing EHR document",
+        )
     except Exception as e:
         raise HTTPException(
             status_code=422,
             detail=f"Failed to parse EHR document: {str(e)}",
         )
+
+
+@router.post("/parse-ehr/bulk")
+async def parse_ehr_bulk(files: list[UploadFile] = File(...)):
+    """Parse many EHR documents in parallel, streaming NDJSON results as each completes.
+
+    Accepts several .docx files and/or .zip archives of .docx files. Each
+    output line is {"filename", "ok", "data"} or {"filename", "ok": false, "error"}.
+    """
+    documents = await collect_documents(files)
+
+    async def parse_one(name: str, data: bytes | None, slots: asyncio.Semaphore) -> dict:
+        if data is None:
+            return {"filename": name, "ok": False, "error": "File too large"}
+        async with slots:
+            try:
+                return {"filename": name, "ok": True, "data": await parse_in_pool(data)}
+            except asyncio.TimeoutError:
+                return {"filename": name, "ok": False, "error": "Timed out"}
+            except Exception as e:
+                return {"filename": name, "ok": False, "error": str(e)}
+
+    async def stream():
+        # Keep the pool busy with at most two documents per parse worker in flight
+        slots = asyncio.Semaphore(EHR_PARSE_WORKERS * 2)
+        tasks = [asyncio.create_task(parse_one(name, data, slots)) for name, data in documents]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@router.post("/ehr/import", status_code=202)
+async def start_ehr_import(files: list[UploadFile] = File(...)):
+    """Import EHR documents end to end: parse, triage and save each as a patient.
+
+    Accepts the same uploads as /parse-ehr/bulk. Returns the job at once;
+    follow it with GET /ehr/import/{job_id}.
+    """
+    documents = await collect_documents(files)
+    try:
+        job = await asyncio.to_thread(create_job, documents)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create import job: {str(e)}")
+    start_job(job["id"])
+    return job
+
+
+@router.get("/ehr/import")
+async def list_ehr_imports(limit: int = 20):
+    """Recent import jobs, newest first."""
+    return await asyncio.to_thread(list_jobs, limit)
+
+
+@router.get("/ehr/import/{job_id}")
+async def get_ehr_import(job_id: str):
+    """Status and progress of an import job."""
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+
+@router.get("/ehr/import/{job_id}/items")
+async def get_ehr_import_items(job_id: str, status: str | None = None):
+    """Per-document outcome of an import job, optionally filtered by status."""
+    return await asyncio.to_thread(list_items, job_id, status)
+
+
+@router.post("/ehr/import/{job_id}/resume")
+async def resume_ehr_import(job_id: str):
+    """Restart a stopped import job from its pending documents."""
+    if not await asyncio.to_thread(requeue_job, job_id):
+        raise HTTPException(status_code=409, detail="Import job is finished or does not exist")
+    start_job(job_id)
+    return await asyncio.to_thread(get_job, job_id)
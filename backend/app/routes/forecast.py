@@ -0,0 +1,19 @@
+"""Bed-occupancy forecast endpoints."""
+
+import asyncio
+from fastapi import APIRouter, HTTPException, Query
+from app.services.occupancy_forecast import forecast_occupancy
+
+router = APIRouter()
+
+
+@router.get("/forecast/occupancy")
+async def get_occupancy_forecast(
+    days: int = Query(7, ge=1, le=14),
+    scenarios: int = Query(2000, ge=100, le=20000),
+):
+    """Simulated occupied beds per department for the next N days, with p10/p50/p90 bands."""
+    try:
+        return await asyncio.to_thread(forecast_occupancy, days, scenarios)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Forecast failed: {str(e)}")
@@ -1,7 +1,11 @@
 """Patient, dashboard, and department data endpoints."""
 
+from datetime import datetime
 from fastapi import APIRouter, HTTPException
 from app.db.supabase_client import table_select, table_select_one, table_update
+from app.services.triage_queue import QUEUE_STATUSES, get_queue, queue_entry_from_row
+from app.services.wait_estimator import get_wait_estimator
+from app.utils.department_mapper import DEPT_ID_TO_NAME
 
 router = APIRouter()
 
@@ -82,23 +86,73 @@ async def update_patient_status(patient_code: str, body: dict):
     )
     if not result:
         raise HTTPException(status_code=404, detail="Patient not found")
+
+    # Stamp the open triage so time-to-treatment can be rolled up
+    stamp_column = {"attended": "attended_at", "discharged": "discharged_at"}.get(status)
+    if stamp_column:
+        table_update(
+            "triage_results",
+            {"patient_id": f"eq.{result[0]['id']}", stamp_column: "is.null"},
+            {stamp_column: datetime.utcnow().isoformat()},
+        )
+
+    queue = get_queue()
+    if status in QUEUE_STATUSES:
+        # Re-queue a patient sent back to waiting, using their latest triage
+        row = table_select_one("v_triage_queue", {
+            "patient_code": f"eq.{patient_code}",
+            "order": "triage_time.desc",
+            "limit": "1",
+        })
+        if row:
+            entry = queue_entry_from_row(row)
+            queue.push(entry)
+            get_wait_estimator().add(
+                patient_code, entry["department_id"], entry["priority_score"], arrival=False,
+            )
+    else:
+        queue.remove(patient_code)
+        get_wait_estimator().remove(patient_code, served=status == "attended")
     return result[0]
 
 
 @router.get("/dashboard")
 async def get_dashboard():
-    """Fetch dashboard KPIs, risk distribution, and department load."""
-    kpis = table_select("v_dashboard_kpis")
-    risk_dist = table_select("v_risk_distribution")
-    dept_load = table_select("v_department_load")
+    """Fetch dashboard KPIs, risk distribution, and department load.
+
+    Today's counts come from the daily_stats rollup (app/services/rollup.py),
+    so they trail new triages by up to a rollup cycle; waits and department
+    load come from the live queue. Nothing here scans triage_results.
+    """
+    today = table_select_one("daily_stats", {
+        "select": "total_patients,high_risk_count,medium_risk_count,low_risk_count",
+        "stat_date": f"eq.{datetime.utcnow().date().isoformat()}",
+    }) or {}
+    alerts = table_select("alerts", {"select": "id", "is_resolved": "eq.false"})
+
+    kpis = {
+        "total_patients_today": today.get("total_patients") or 0,
+        "high_risk_count": today.get("high_risk_count") or 0,
+        # Expected remaining wait from live queue state, not the stored estimates
+        "avg_waiting_time": get_wait_estimator().average_wait(),
+        "active_alerts": len(alerts),
+    }
+    risk_dist = [
+        {"risk_level": risk, "count": today.get(f"{risk}_risk_count") or 0}
+        for risk in ("high", "medium", "low")
+    ]
+    queue = get_queue()
+    dept_load = sorted(
+        (
+            {"department_name": name, "patient_count": queue.depth(dept_id)}
+            for dept_id, name in DEPT_ID_TO_NAME.items()
+        ),
+        key=lambda d: d["patient_count"],
+        reverse=True,
+    )
 
     return {
-        "kpis": kpis[0] if kpis else {
-            "total_patients_today": 0,
-            "high_risk_count": 0,
-            "avg_waiting_time": 0,
-            "active_alerts": 0,
-        },
+        "kpis": kpis,
         "risk_distribution": risk_dist,
         "department_load": dept_load,
     }
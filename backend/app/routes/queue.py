@@ -0,0 +1,30 @@
+"""Live triage queue endpoints served from the in-memory priority queue."""
+
+from fastapi import APIRouter, HTTPException, Query
+from app.services.triage_queue import get_queue
+from app.services.wait_estimator import get_wait_estimator
+
+router = APIRouter()
+
+
+@router.get("/queue")
+async def get_triage_queue(department: str | None = None, limit: int | None = Query(None, ge=1)):
+    """Waiting patients in the order they should be seen, optionally per department."""
+    return get_queue().ordered(department, limit)
+
+
+@router.get("/queue/next")
+async def get_next_patient(department: str | None = None):
+    """The next patient to see in a department (or across the whole hospital)."""
+    patient = get_queue().peek(department)
+    if not patient:
+        raise HTTPException(status_code=404, detail="No patients waiting")
+    return patient
+
+
+@router.get("/queue/waits")
+async def get_wait_estimates(department: str | None = None):
+    """Queue depth, arrival/service rates and expected wait per priority class."""
+    estimator = get_wait_estimator()
+    departments = [department] if department else estimator.departments()
+    return [estimator.department_waits(d) for d in departments]
@@ -1,20 +1,35 @@
 """Resources API: Beds & Labs."""
 
+import httpx
 from fastapi import APIRouter, HTTPException
-from app.db.supabase_client import table_select, table_select_one, table_insert, table_update
+from app.db.supabase_client import rpc, table_select, table_update
+from app.services import bed_index
+from app.services.bed_index import BedConflict, get_bed_index
+from app.services.bed_allocator import allocate_beds
+from app.services.lab_scheduler import LabNotFound, LabUnavailable, get_lab_scheduler, load_lab_scheduler
 
 router = APIRouter()
 
 # --- Beds ---
 
 @router.get("/beds")
-async def get_beds(department_id: str = None):
-    """List beds, optionally filtered by department."""
-    params = {"order": "bed_number.asc"}
+async def get_beds(department_id: str = None, available: bool = False):
+    """List beds from the availability index, optionally filtered by department."""
+    index = get_bed_index()
+    if available and department_id:
+        return index.free_beds(department_id)
+    beds = index.beds(department_id)
+    if available:
+        beds = [b for b in beds if not b.get("is_occupied")]
+    return beds
+
+@router.get("/beds/availability")
+async def get_bed_availability(department_id: str = None):
+    """Total and free bed counts per department."""
+    index = get_bed_index()
     if department_id:
-        params["department_id"] = f"eq.{department_id}"
-    
-    return table_select("beds", params)
+        return {"department_id": department_id, "free": index.free_count(department_id)}
+    return index.availability()
 
 @router.post("/beds/assign")
 async def assign_bed(body: dict):
@@ -25,43 +40,185 @@ async def assign_bed(body: dict):
     if not bed_id or not patient_id:
         raise HTTPException(status_code=400, detail="bed_id and patient_id required")
 
-    # 1. Update bed status
-    bed = table_update("beds", {"id": f"eq.{bed_id}"}, {
-        "is_occupied": True,
-        "current_patient_id": patient_id
-    })
+    try:
+        bed = bed_index.assign_bed(bed_id, patient_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Bed not found")
+    except BedConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
-    if not bed:
+    return {"status": "assigned", "bed": bed}
+
+@router.post("/beds/release")
+async def release_bed(body: dict):
+    """Free a bed and close its assignment."""
+    bed_id = body.get("bed_id")
+    if not bed_id:
+        raise HTTPException(status_code=400, detail="bed_id required")
+
+    try:
+        bed = bed_index.release_bed(bed_id, body.get("patient_id"))
+    except KeyError:
         raise HTTPException(status_code=404, detail="Bed not found")
+    except BedConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-    # 2. Add to history
-    table_insert("bed_assignments", {
-        "bed_id": bed_id,
-        "patient_id": patient_id
-    })
-    
-    return {"status": "assigned", "bed": bed[0]}
+    return {"status": "released", "bed": bed}
+
+@router.post("/beds/transfer")
+async def transfer_bed(body: dict):
+    """Move a patient to another bed."""
+    patient_id = body.get("patient_id")
+    to_bed_id = body.get("to_bed_id")
+    if not patient_id or not to_bed_id:
+        raise HTTPException(status_code=400, detail="patient_id and to_bed_id required")
+
+    try:
+        result = bed_index.transfer_bed(patient_id, to_bed_id, body.get("from_bed_id"))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Bed not found")
+    except BedConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return {"status": "transferred", **result}
+
+@router.post("/beds/allocate")
+async def allocate_bed(body: dict):
+    """Recommend the best free bed from a triage outcome.
+
+    Accepts one patient (`patient_id`, `department_id`, `risk_level`,
+    `estimated_los_days`) or a batch under `patients`. With `assign: true`
+    the chosen beds are also assigned atomically.
+    """
+    assign = bool(body.get("assign", False))
+    batch = "patients" in body
+    patients = body.get("patients") if batch else [body]
+
+    if not isinstance(patients, list) or not patients:
+        raise HTTPException(status_code=400, detail="patients must be a non-empty list")
+    for p in patients:
+        if not p.get("department_id") or not p.get("risk_level"):
+            raise HTTPException(status_code=400, detail="department_id and risk_level required")
+        if assign and not p.get("patient_id"):
+            raise HTTPException(status_code=400, detail="patient_id required to assign")
+
+    results = allocate_beds(patients, assign=assign)
+    return {"allocations": results} if batch else results[0]
 
 # --- Labs ---
 
 @router.get("/labs")
 async def get_labs():
-    """List all labs and their availability."""
+    """List all labs with their next free urgent and routine slots."""
+    labs = get_lab_scheduler().labs()
+    if labs:
+        return labs
+
+    # Fallback to the plain labs table if the scheduler has not loaded
     return table_select("labs", {"order": "name.asc"})
 
+@router.get("/labs/{lab_id}/availability")
+async def get_lab_availability(lab_id: str):
+    """Next free slots and seats left in the current slot for one lab."""
+    try:
+        return get_lab_scheduler().availability(lab_id)
+    except LabUnavailable as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+def _schedule_labs(orders: list[dict]) -> list[dict]:
+    """Reserve slots for lab orders and book them in one all-or-nothing call.
+
+    The database turns the batch down if another worker filled one of the
+    slots first; the calendars are then reloaded and the orders tried once more.
+    """
+    scheduler = get_lab_scheduler()
+    for attempt in range(2):
+        try:
+            reservations = scheduler.reserve(orders)
+        except LabNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except LabUnavailable as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+        try:
+            bookings = rpc("book_lab_slots", {"p_bookings": [
+                {
+                    "lab_id": r["lab_id"],
+                    "patient_id": r["patient_id"],
+                    "scheduled_at": r["scheduled_at"],
+                    "risk_level": r["risk_level"],
+                }
+                for r in reservations
+            ]})
+        except httpx.HTTPStatusError as e:
+            scheduler.cancel(reservations)
+            if e.response.status_code != 409:
+                raise
+            if attempt:
+                raise HTTPException(status_code=409, detail="Lab slots filled up meanwhile, please try again")
+            load_lab_scheduler()
+            continue
+        except Exception:
+            scheduler.cancel(reservations)
+            raise
+
+        for reservation, booking in zip(reservations, bookings):
+            scheduler.confirm(reservation, booking["id"])
+        return bookings
+
 @router.post("/labs/book")
 async def book_lab(body: dict):
-    """Book a lab test."""
+    """Book a lab test into the earliest feasible slot."""
     lab_id = body.get("lab_id")
     patient_id = body.get("patient_id")
     
     if not lab_id or not patient_id:
         raise HTTPException(status_code=400, detail="lab_id and patient_id required")
 
-    booking = table_insert("lab_bookings", {
-        "lab_id": lab_id,
+    bookings = _schedule_labs([{
         "patient_id": patient_id,
-        "status": "pending"
-    })
+        "risk_level": body.get("risk_level", "low"),
+        "lab_ids": [lab_id],
+    }])
     
-    return {"status": "booked", "booking": booking}
+    return {"status": "booked", "booking": bookings[0]}
+
+@router.post("/labs/book-panel")
+async def book_lab_panel(body: dict):
+    """Book a patient's whole lab panel, or several panels under `panels`.
+
+    Panels are scheduled highest risk first and a patient's tests never
+    overlap in time.
+    """
+    batch = "panels" in body
+    orders = body.get("panels") if batch else [body]
+
+    if not isinstance(orders, list) or not orders:
+        raise HTTPException(status_code=400, detail="panels must be a non-empty list")
+    for order in orders:
+        if not order.get("patient_id") or not order.get("lab_ids"):
+            raise HTTPException(status_code=400, detail="patient_id and lab_ids required")
+
+    bookings = _schedule_labs(orders)
+    return {"status": "booked", "bookings": bookings}
+
+@router.patch("/labs/bookings/{booking_id}")
+async def update_lab_booking(booking_id: str, body: dict):
+    """Mark a booking completed or cancelled; cancelling frees its slot."""
+    status = body.get("status")
+    if status not in ("completed", "cancelled"):
+        raise HTTPException(status_code=400, detail="Invalid status")
+
+    data = {"status": status}
+    if body.get("result_summary"):
+        data["result_summary"] = body["result_summary"]
+    rows = table_update("lab_bookings", {"id": f"eq.{booking_id}"}, data)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Booking not found")
+
+    scheduler = get_lab_scheduler()
+    if status == "cancelled":
+        scheduler.release_booking(booking_id)
+    else:
+        scheduler.forget_booking(booking_id)
+    return rows[0]
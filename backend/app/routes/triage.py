@@ -1,28 +1,62 @@
 """Triage API endpoint."""
 
-import uuid
+import asyncio
 import logging
-import json
 import os
-from datetime import datetime
-from fastapi import APIRouter
+import time
+from datetime import date, datetime, timedelta
+from fastapi import APIRouter, Header, HTTPException, Query, Response
 from pydantic import BaseModel
 
-from app.schemas.patient import PatientIntakeRequest, TriageResponse, ContributingFactor, TopDisease
+from app.schemas.patient import (
+    PatientIntakeRequest,
+    TriageResponse,
+    RetriageResponse,
+    VitalsUpdateRequest,
+    ContributingFactor,
+    TopDisease,
+    ExtractedSymptom,
+)
 from app.models.triage_model import predict_triage
 from app.models.disease_model import predict_disease, get_symptom_columns
+from app.models.los_model import predict_los
 from app.utils.feature_engineering import (
     prepare_triage_features,
     prepare_symptom_features,
     compute_contributing_factors,
 )
-from app.utils.department_mapper import map_disease_to_department
-from app.db.supabase_client import table_insert
+from app.utils.department_mapper import DEPT_ID_TO_NAME, DEPT_NAME_TO_ID, map_disease_to_department
+from app.utils.symptom_extractor import extract_symptoms
+from app.db.supabase_client import (
+    rpc,
+    table_insert,
+    table_select,
+    table_select_one,
+    table_update,
+)
+from app.services.triage_queue import QUEUE_STATUSES, get_queue
+from app.services.wait_estimator import get_wait_estimator
+from app.services.feedback_log import get_feedback_log
+from app.services.idempotency import get_idempotency_store
+from app.services.model_refresh import refresh_status, refresh_triage_model
+from app.services.patient_codes import new_patient_code
+from app.utils.metrics import counter, stage_timer
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Latency budget for one triage; stages still running past it finish in the background
+TRIAGE_DEADLINE_MS = int(os.getenv("TRIAGE_DEADLINE_MS", "1500"))
+MIN_DEADLINE_MS = 100
+MAX_DEADLINE_MS = 30000
+# Most of the remaining budget a non-critical stage may use before it is left pending
+STAGE_MAX_MS = {"disease_model": 500, "los_model": 150}
+# Department used until a pending disease prediction lands
+PROVISIONAL_DEPARTMENT = {"high": "Emergency"}
+
+_background: set[asyncio.Task] = set()
+
 
 class FeedbackRequest(BaseModel):
     patient_id: str
@@ -31,79 +65,157 @@ class FeedbackRequest(BaseModel):
     corrected_priority: str | None = None
 
 
-# Map department_mapper output names to Supabase department IDs
-DEPT_NAME_TO_ID = {
-    "Emergency": "emergency",
-    "Emergency Medicine": "emergency",
-    "Cardiology": "cardiology",
-    "Neurology": "neurology",
-    "Orthopedics": "orthopedics",
-    "General Medicine": "general",
-    "Pediatrics": "pediatrics",
-    "Ophthalmology": "ophthalmology",
-    "Pulmonology": "pulmonology",
-    "Dermatology": "dermatology",
-    "Gastroenterology": "gastroenterology",
-    "ENT": "ent",
-    "Nephrology": "nephrology",
-    "Oncology": "oncology",
-    "Endocrinology": "endocrinology",
-    "Psychiatry": "psychiatry",
-    "Urology": "urology",
-    "Gynecology": "gynecology",
-    "Hematology": "hematology",
-    "Infectious Disease": "infectious-disease",
-    "Rheumatology": "rheumatology",
-}
+class Deadline:
+    """Time left out of a request's latency budget."""
 
+    def __init__(self, budget_ms: int):
+        self.expires = time.perf_counter() + budget_ms / 1000
 
-@router.post("/triage", response_model=TriageResponse)
-async def run_triage(request: PatientIntakeRequest):
-    """Run AI triage analysis on patient intake data."""
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.perf_counter())
 
-    # Count chronic conditions
-    chronic_count = len([c for c in request.conditions if c.lower() != "none"])
 
-    # --- Model 1: Triage Level Prediction ---
-    triage_features = prepare_triage_features(
+def _timed(stage: str, fn, *args, **kwargs):
+    with stage_timer(stage):
+        return fn(*args, **kwargs)
+
+
+async def _run_stage(stage: str, deadline: Deadline, timings: dict, fn, *args, **kwargs):
+    """Run a blocking stage in a thread under the remaining budget.
+
+    Returns (result, None), or (None, task) if the stage overran. The task keeps
+    running so the stage can still be completed after the response is sent.
+    """
+    budget = deadline.remaining()
+    if stage in STAGE_MAX_MS:
+        budget = min(budget, STAGE_MAX_MS[stage] / 1000)
+    start = time.perf_counter()
+    task = asyncio.ensure_future(asyncio.to_thread(_timed, stage, fn, *args, **kwargs))
+    await asyncio.wait({task}, timeout=budget)
+    timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+    if task.done():
+        return task.result(), None
+    return None, task
+
+
+def _disease_stage(request: PatientIntakeRequest) -> tuple[list[dict], dict]:
+    symptom_columns = get_symptom_columns()
+    # Symptoms mentioned in free text count alongside the checked ones
+    extracted = extract_symptoms({"notes": request.notes, "transcript": request.transcript}, symptom_columns)
+    symptom_features = prepare_symptom_features(request.symptoms, symptom_columns, extracted)
+    return extracted, predict_disease(symptom_features)
+
+
+def _los(request: PatientIntakeRequest, risk_level: str, predicted_disease: str) -> dict:
+    return predict_los(
+        risk_level=risk_level,
+        predicted_disease=predicted_disease,
         age=request.age,
         heart_rate=request.heart_rate,
         systolic_bp=request.blood_pressure_systolic,
         oxygen_saturation=request.oxygen_saturation,
         temperature_f=request.temperature,
-        chronic_disease_count=chronic_count,
     )
-    triage_result = predict_triage(triage_features)
 
-    # --- Model 2: Disease Prediction ---
-    symptom_columns = get_symptom_columns()
-    symptom_features = prepare_symptom_features(request.symptoms, symptom_columns)
-    disease_result = predict_disease(symptom_features)
 
-    # --- Map disease to department ---
-    department = map_disease_to_department(disease_result["predicted_disease"])
-    department_id = DEPT_NAME_TO_ID.get(department, "general")
+def _combined_confidence(triage_result: dict, disease_result: dict | None) -> int:
+    if disease_result is None:
+        return int(triage_result["confidence"])
+    return int(triage_result["confidence"] * 0.6 + disease_result["disease_confidence"] * 0.4)
 
-    # --- Compute contributing factors ---
-    factors = compute_contributing_factors(
-        heart_rate=request.heart_rate,
-        systolic_bp=request.blood_pressure_systolic,
-        diastolic_bp=request.blood_pressure_diastolic,
-        temperature_f=request.temperature,
-        oxygen_saturation=request.oxygen_saturation,
-        respiratory_rate=request.respiratory_rate,
-        age=request.age,
+
+@router.post("/triage", response_model=TriageResponse)
+async def run_triage(
+    request: PatientIntakeRequest,
+    response: Response,
+    idempotency_key: str | None = Header(default=None),
+    x_deadline_ms: int | None = Header(default=None),
+):
+    """Run AI triage analysis on patient intake data.
+
+    The risk level always comes back, and the patient is always saved before
+    the response is sent. The disease and length-of-stay models degrade: if
+    they do not finish within the deadline (`X-Deadline-Ms`, default
+    TRIAGE_DEADLINE_MS) they are reported as pending in `stages` and
+    completed in the background.
+
+    With an `Idempotency-Key` header, a retried submission gets the original
+    response back (marked `Idempotent-Replayed: true`) instead of creating a
+    second patient.
+    """
+    deadline_ms = min(max(x_deadline_ms or TRIAGE_DEADLINE_MS, MIN_DEADLINE_MS), MAX_DEADLINE_MS)
+    if not idempotency_key:
+        result, _ = await triage_intake(request, deadline_ms)
+        return result
+    body, replayed = await get_idempotency_store().run(
+        f"triage:{idempotency_key}", request, lambda: triage_intake(request, deadline_ms)
     )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return body
+
 
-    # --- Estimate waiting time ---
-    if triage_result["priority_score"] >= 80:
-        waiting_time = 5
-    elif triage_result["priority_score"] >= 60:
-        waiting_time = 15
-    elif triage_result["priority_score"] >= 40:
-        waiting_time = 30
+async def triage_intake(request: PatientIntakeRequest, deadline_ms: int = TRIAGE_DEADLINE_MS) -> tuple[TriageResponse, bool]:
+    """Triage and persist one intake within `deadline_ms`.
+
+    Returns the response and whether it is final, i.e. saved, so an
+    idempotent retry must not run it again.
+    """
+    deadline = Deadline(deadline_ms)
+    started = time.perf_counter()
+    timings: dict[str, float] = {}
+    stages: dict[str, str] = {}
+
+    # Count chronic conditions
+    chronic_count = len([c for c in request.conditions if c.lower() != "none"])
+
+    # --- Model 1: Triage Level Prediction (critical: always awaited) ---
+    with stage_timer("triage_features"):
+        triage_features = prepare_triage_features(
+            age=request.age,
+            heart_rate=request.heart_rate,
+            systolic_bp=request.blood_pressure_systolic,
+            oxygen_saturation=request.oxygen_saturation,
+            temperature_f=request.temperature,
+            chronic_disease_count=chronic_count,
+        )
+    with stage_timer("triage_model"):
+        triage_result = predict_triage(triage_features)
+    timings["triage_model"] = round((time.perf_counter() - started) * 1000, 1)
+    stages["triage_model"] = "done"
+    risk_level = triage_result["risk_level"]
+
+    # --- Model 2: Disease Prediction ---
+    disease, disease_task = await _run_stage("disease_model", deadline, timings, _disease_stage, request)
+    if disease_task is None:
+        extracted, disease_result = disease
+        stages["disease_model"] = "done"
+        with stage_timer("department_mapping"):
+            department = map_disease_to_department(disease_result["predicted_disease"])
     else:
-        waiting_time = 45
+        extracted, disease_result = [], None
+        stages["disease_model"] = "pending"
+        department = PROVISIONAL_DEPARTMENT.get(risk_level, "General Medicine")
+    department_id = DEPT_NAME_TO_ID.get(department, "general")
+
+    # --- Compute contributing factors ---
+    with stage_timer("contributing_factors"):
+        factors = compute_contributing_factors(
+            heart_rate=request.heart_rate,
+            systolic_bp=request.blood_pressure_systolic,
+            diastolic_bp=request.blood_pressure_diastolic,
+            temperature_f=request.temperature,
+            oxygen_saturation=request.oxygen_saturation,
+            respiratory_rate=request.respiratory_rate,
+            age=request.age,
+            feature_contributions=triage_result["feature_contributions"],
+            chronic_disease_count=chronic_count,
+        )
+
+    # --- Estimate waiting time from live queue state ---
+    wait_estimator = get_wait_estimator()
+    with stage_timer("wait_estimate"):
+        waiting_time = wait_estimator.estimate_wait(department_id, triage_result["priority_score"])
 
     vitals = {
         "bloodPressure": f"{request.blood_pressure_systolic or 'N/A'}/{request.blood_pressure_diastolic or 'N/A'}",
@@ -113,96 +225,428 @@ async def run_triage(request: PatientIntakeRequest):
         "respiratoryRate": str(request.respiratory_rate or "N/A"),
     }
 
-    # --- Model 3: Length of Stay Prediction ---
-    from app.models.los_model import predict_los
-    los_result = predict_los(
-        risk_level=triage_result["risk_level"],
-        predicted_disease=disease_result["predicted_disease"],
+    # --- Model 3: Length of Stay Prediction (without the disease while it is pending) ---
+    predicted_disease = disease_result["predicted_disease"] if disease_result else ""
+    los_result, los_task = await _run_stage("los_model", deadline, timings, _los, request, risk_level, predicted_disease)
+    if los_task is not None:
+        stages["los_model"] = "pending"
+        los_result = {"estimated_los_days": None, "los_confidence": None}
+    else:
+        stages["los_model"] = "degraded" if disease_result is None else "done"
+
+    combined_confidence = _combined_confidence(triage_result, disease_result)
+    patient_code = new_patient_code()
+
+    # --- Persist to Supabase ---
+    queue_entry = {
+        "patient_code": patient_code,
+        "name": request.name,
+        "age": request.age,
+        "gender": request.gender,
+        "risk_level": risk_level,
+        "priority_score": triage_result["priority_score"],
+        "predicted_disease": predicted_disease or None,
+        "department_id": department_id,
+        "department_name": department,
+        "waiting_time": waiting_time,
+        "arrival": datetime.utcnow(),
+    }
+    triage_row = {
+        "risk_level": risk_level,
+        "priority_score": triage_result["priority_score"],
+        "triage_level": triage_result["triage_level"],
+        "confidence": combined_confidence,
+        "predicted_disease": predicted_disease or None,
+        "disease_confidence": disease_result["disease_confidence"] if disease_result else None,
+        "department_id": department_id,
+        "waiting_time": waiting_time,
+        "estimated_los_days": los_result["estimated_los_days"],
+        "los_confidence": los_result["los_confidence"],
+    }
+    # Never left pending: the response hands out patient_code, so it must be saved first
+    persist_start = time.perf_counter()
+    try:
+        triage_id = await asyncio.to_thread(
+            _timed, "persist", _persist, request, patient_code, triage_row, factors, queue_entry
+        )
+        stages["persist"] = "done"
+    except Exception as e:
+        logger.error(f"Failed to persist triage to Supabase: {e}")
+        # Non-fatal: still return the AI result even if DB save fails
+        triage_id = None
+        stages["persist"] = "failed"
+    timings["persist"] = round((time.perf_counter() - persist_start) * 1000, 1)
+
+    pending = [stage for stage, status in stages.items() if status in ("pending", "degraded")]
+    if pending and triage_id is not None:
+        logger.warning(f"Triage {patient_code} returned at {deadline_ms} ms deadline with {', '.join(pending)} pending or degraded")
+        task = asyncio.create_task(_complete_pending(
+            request, triage_result, queue_entry, triage_id, disease_task, los_task,
+        ))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+    timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    result = TriageResponse(
+        patient_id=patient_code,
+        name=request.name,
         age=request.age,
-        vitals=vitals
+        gender=request.gender,
+        risk_level=risk_level,
+        priority_score=triage_result["priority_score"],
+        department=department,
+        confidence=combined_confidence,
+        predicted_disease=predicted_disease or None,
+        top_diseases=[TopDisease(**d) for d in (disease_result or {}).get("top_diseases", [])],
+        contributing_factors=[ContributingFactor(**f) for f in factors],
+        extracted_symptoms=[ExtractedSymptom(**m) for m in extracted],
+        waiting_time=waiting_time,
+        estimated_los_days=los_result["estimated_los_days"],
+        los_confidence=los_result["los_confidence"],
+        vitals=vitals,
+        stages=stages,
+        timings_ms=timings,
     )
+    return result, stages["persist"] == "done"
+
+
+def _persist(request: PatientIntakeRequest, patient_code: str, triage_row: dict, factors: list[dict], queue_entry: dict) -> str:
+    """Save the patient, intake, triage and factors, then queue the patient. Returns the triage row id."""
+    # 1. Insert patient
+    patient_row = table_insert("patients", {
+        "patient_code": patient_code,
+        "name": request.name,
+        "age": request.age,
+        "gender": request.gender,
+        "status": "waiting",
+    })
+    patient_id = patient_row["id"]
+
+    # 2. Insert patient intake
+    intake_row = table_insert("patient_intakes", {
+        "patient_id": patient_id,
+        "blood_pressure_systolic": request.blood_pressure_systolic,
+        "blood_pressure_diastolic": request.blood_pressure_diastolic,
+        "heart_rate": request.heart_rate,
+        "temperature": request.temperature,
+        "oxygen_saturation": request.oxygen_saturation,
+        "respiratory_rate": request.respiratory_rate,
+        "symptoms": request.symptoms,
+        "conditions": request.conditions,
+        "notes": request.notes,
+        "intake_method": "manual",
+    })
+
+    # 3. Insert triage result
+    saved = table_insert("triage_results", {"patient_id": patient_id, "intake_id": intake_row["id"], **triage_row})
+
+    # 4. Insert contributing factors
+    for i, f in enumerate(factors):
+        table_insert("contributing_factors", {
+            "triage_id": saved["id"],
+            "name": f["name"],
+            "value": f["value"],
+            "impact": f["impact"],
+            "is_positive": f["isPositive"],
+            "sort_order": i,
+        })
 
-    # --- Combine confidence from both models ---
-    combined_confidence = int(
-        triage_result["confidence"] * 0.6 + disease_result["disease_confidence"] * 0.4
-    )
+    logger.info(f"Saved triage for patient {patient_code} (DB id: {patient_id})")
 
-    patient_code = f"P-{uuid.uuid4().hex[:4].upper()}"
+    get_queue().push(queue_entry)
+    get_wait_estimator().add(patient_code, queue_entry["department_id"], queue_entry["priority_score"])
+    return saved["id"]
 
-    # --- Persist to Supabase ---
+
+async def _complete_pending(
+    request: PatientIntakeRequest,
+    triage_result: dict,
+    queue_entry: dict,
+    triage_id: str,
+    disease_task: asyncio.Task | None,
+    los_task: asyncio.Task | None,
+):
+    """Finish stages that overran the deadline and fold their results into the saved triage."""
+    patient_code = queue_entry["patient_code"]
     try:
-        # 1. Insert patient
-        patient_row = table_insert("patients", {
-            "patient_code": patient_code,
-            "name": request.name,
-            "age": request.age,
-            "gender": request.gender,
-            "status": "waiting",
-        })
-        patient_id = patient_row["id"]
+        update = {}
+        if disease_task is not None:
+            _, disease_result = await disease_task
+            department = map_disease_to_department(disease_result["predicted_disease"])
+            department_id = DEPT_NAME_TO_ID.get(department, "general")
+            if los_task is not None:
+                await los_task  # computed without the disease; superseded below
+            los_result = await asyncio.to_thread(_los, request, triage_result["risk_level"], disease_result["predicted_disease"])
+            waiting_time = get_wait_estimator().estimate_wait(department_id, triage_result["priority_score"])
+            update = {
+                "predicted_disease": disease_result["predicted_disease"],
+                "disease_confidence": disease_result["disease_confidence"],
+                "confidence": _combined_confidence(triage_result, disease_result),
+                "department_id": department_id,
+                "waiting_time": waiting_time,
+                **los_result,
+            }
+            if department_id != queue_entry["department_id"]:
+                get_queue().push({
+                    **queue_entry,
+                    "predicted_disease": disease_result["predicted_disease"],
+                    "department_id": department_id,
+                    "department_name": department,
+                    "waiting_time": waiting_time,
+                })
+                get_wait_estimator().add(patient_code, department_id, triage_result["priority_score"], arrival=False)
+        elif los_task is not None:
+            update = await los_task
+        if update:
+            await asyncio.to_thread(table_update, "triage_results", {"id": f"eq.{triage_id}"}, update)
+        logger.info(f"Completed deferred triage stages for patient {patient_code}")
+    except Exception as e:
+        logger.error(f"Failed to complete deferred triage stages for patient {patient_code}: {e}")
+
+
+# --- Repeat vitals ---
+
+VITAL_FIELDS = (
+    "blood_pressure_systolic", "blood_pressure_diastolic", "heart_rate",
+    "temperature", "oxygen_saturation", "respiratory_rate",
+)
+RISK_RANK = {"low": 0, "medium": 1, "high": 2}
+
+RISK_CHANGES = counter("triage_risk_changes_total", "Re-triages that changed a patient's risk class", ("from", "to"))
+
+
+def _latest_triage(patient_code: str) -> dict | None:
+    """Latest triage for a patient, with the patient and the intake it was based on (one round trip)."""
+    return table_select_one("triage_results", {
+        "select": "*,patient:patients!inner(*),intake:patient_intakes(*)",
+        "patient.patient_code": f"eq.{patient_code}",
+        "order": "created_at.desc",
+        "limit": "1",
+    })
+
+
+def _same_symptoms(a: list[str] | None, b: list[str] | None) -> bool:
+    return {s.strip().lower() for s in a or []} == {s.strip().lower() for s in b or []}
+
 
-        # 2. Insert patient intake
-        intake_row = table_insert("patient_intakes", {
+def _save_retriage(patient_id: str, triage_id: str, request: PatientIntakeRequest, triage_row: dict, factors: list[dict]):
+    """Append the new intake, update the triage in place and replace its contributing factors, atomically."""
+    rpc("save_retriage", {
+        "p_triage_id": triage_id,
+        "p_intake": {
             "patient_id": patient_id,
-            "blood_pressure_systolic": request.blood_pressure_systolic,
-            "blood_pressure_diastolic": request.blood_pressure_diastolic,
-            "heart_rate": request.heart_rate,
-            "temperature": request.temperature,
-            "oxygen_saturation": request.oxygen_saturation,
-            "respiratory_rate": request.respiratory_rate,
+            **{field: getattr(request, field) for field in VITAL_FIELDS},
             "symptoms": request.symptoms,
             "conditions": request.conditions,
             "notes": request.notes,
-            "intake_method": "manual",
-        })
-
-        # 3. Insert triage result
-        triage_row = table_insert("triage_results", {
-            "patient_id": patient_id,
-            "intake_id": intake_row["id"],
-            "risk_level": triage_result["risk_level"],
-            "priority_score": triage_result["priority_score"],
-            "triage_level": triage_result["triage_level"],
-            "confidence": combined_confidence,
-            "predicted_disease": disease_result["predicted_disease"],
-            "department_id": department_id,
-            "waiting_time": waiting_time,
-            "estimated_los_days": los_result["estimated_los_days"],
-            "los_confidence": los_result["los_confidence"],
-        })
-
-        # 4. Insert contributing factors
-        for i, f in enumerate(factors):
-            table_insert("contributing_factors", {
-                "triage_id": triage_row["id"],
+            "intake_method": "repeat_vitals",
+        },
+        "p_triage": triage_row,
+        "p_factors": [
+            {
                 "name": f["name"],
                 "value": f["value"],
                 "impact": f["impact"],
                 "is_positive": f["isPositive"],
                 "sort_order": i,
-            })
+            }
+            for i, f in enumerate(factors)
+        ],
+    })
+
+
+def _emit_risk_change(patient: dict, previous: str, current: str, priority_score: int):
+    """Record a risk class change: metric, log line and a dashboard alert."""
+    RISK_CHANGES.inc(previous, current)
+    escalated = RISK_RANK.get(current, 0) > RISK_RANK.get(previous, 0)
+    message = (
+        f"{patient['name']} ({patient['patient_code']}) "
+        f"{'escalated' if escalated else 'de-escalated'} from {previous} to {current} risk "
+        f"on repeat vitals (priority {priority_score})"
+    )
+    logger.warning(message)
+    try:
+        table_insert("alerts", {
+            "message": message[:500],
+            "alert_type": "critical" if current == "high" else "warning" if escalated else "info",
+        })
+    except Exception as e:
+        logger.error(f"Failed to record risk change alert: {e}")
+
+
+@router.post("/patients/{patient_code}/vitals", response_model=RetriageResponse)
+async def retriage_vitals(patient_code: str, update: VitalsUpdateRequest):
+    """Re-triage a waiting patient from repeat vitals.
+
+    Appends a new intake and re-runs the triage model, contributing factors
+    and LOS. The stored disease prediction is reused unless the symptoms
+    changed or new notes were given. The patient's triage is updated in place,
+    so they keep their place in the queue at the new priority. A change of
+    risk class raises a dashboard alert. If the new triage cannot be saved,
+    nothing else changes and the request fails with 503.
+    """
+    started = time.perf_counter()
+    timings: dict[str, float] = {}
+    stages: dict[str, str] = {}
+
+    with stage_timer("retriage_load"):
+        previous = await asyncio.to_thread(_latest_triage, patient_code)
+    timings["load"] = round((time.perf_counter() - started) * 1000, 1)
+    if previous is None:
+        raise HTTPException(status_code=404, detail="Patient not found or not yet triaged")
+    patient, intake = previous["patient"], previous["intake"] or {}
+    if patient.get("status") not in QUEUE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Patient is {patient.get('status')}, not waiting")
+
+    # Vitals that were not re-taken keep their last reading
+    request = PatientIntakeRequest(
+        name=patient["name"],
+        age=patient["age"],
+        gender=patient["gender"],
+        **{field: getattr(update, field) if getattr(update, field) is not None else intake.get(field) for field in VITAL_FIELDS},
+        symptoms=update.symptoms if update.symptoms is not None else intake.get("symptoms") or [],
+        conditions=intake.get("conditions") or [],
+        notes=update.notes,
+    )
+    chronic_count = len([c for c in request.conditions if c.lower() != "none"])
 
-        logger.info(f"Saved triage for patient {patient_code} (DB id: {patient_id})")
+    # --- Model 1: Triage Level Prediction ---
+    stage_start = time.perf_counter()
+    with stage_timer("triage_features"):
+        triage_features = prepare_triage_features(
+            age=request.age,
+            heart_rate=request.heart_rate,
+            systolic_bp=request.blood_pressure_systolic,
+            oxygen_saturation=request.oxygen_saturation,
+            temperature_f=request.temperature,
+            chronic_disease_count=chronic_count,
+        )
+    with stage_timer("triage_model"):
+        triage_result = predict_triage(triage_features)
+    timings["triage_model"] = round((time.perf_counter() - stage_start) * 1000, 1)
+    stages["triage_model"] = "done"
+    risk_level = triage_result["risk_level"]
+
+    # --- Model 2: Disease Prediction, only if the symptoms changed ---
+    disease_reused = (
+        previous.get("predicted_disease") is not None
+        and _same_symptoms(request.symptoms, intake.get("symptoms"))
+        and not update.notes.strip()
+    )
+    if disease_reused:
+        extracted = []
+        disease_result = {
+            "predicted_disease": previous["predicted_disease"],
+            # Rows saved before disease_confidence existed only have the combined confidence
+            "disease_confidence": previous.get("disease_confidence") or previous["confidence"],
+            "top_diseases": [],
+        }
+        department_id = previous.get("department_id") or "general"
+        department = DEPT_ID_TO_NAME.get(department_id, "General Medicine")
+        stages["disease_model"] = "reused"
+    else:
+        stage_start = time.perf_counter()
+        extracted, disease_result = await asyncio.to_thread(_timed, "disease_model", _disease_stage, request)
+        timings["disease_model"] = round((time.perf_counter() - stage_start) * 1000, 1)
+        department = map_disease_to_department(disease_result["predicted_disease"])
+        department_id = DEPT_NAME_TO_ID.get(department, "general")
+        stages["disease_model"] = "done"
+
+    # --- Contributing factors, wait and LOS for the new vitals ---
+    stage_start = time.perf_counter()
+    with stage_timer("contributing_factors"):
+        factors = compute_contributing_factors(
+            heart_rate=request.heart_rate,
+            systolic_bp=request.blood_pressure_systolic,
+            diastolic_bp=request.blood_pressure_diastolic,
+            temperature_f=request.temperature,
+            oxygen_saturation=request.oxygen_saturation,
+            respiratory_rate=request.respiratory_rate,
+            age=request.age,
+            feature_contributions=triage_result["feature_contributions"],
+            chronic_disease_count=chronic_count,
+        )
+    wait_estimator = get_wait_estimator()
+    waiting_time = wait_estimator.estimate_wait(department_id, triage_result["priority_score"])
+    with stage_timer("los_model"):
+        los_result = _los(request, risk_level, disease_result["predicted_disease"])
+    timings["factors_and_los"] = round((time.perf_counter() - stage_start) * 1000, 1)
+    combined_confidence = _combined_confidence(triage_result, disease_result)
+
+    # --- Update the triage in place ---
+    previous_risk = previous["risk_level"]
+    risk_changed = risk_level != previous_risk
+    triage_row = {
+        "risk_level": risk_level,
+        "priority_score": triage_result["priority_score"],
+        "triage_level": triage_result["triage_level"],
+        "confidence": combined_confidence,
+        "predicted_disease": disease_result["predicted_disease"],
+        "disease_confidence": disease_result["disease_confidence"],
+        "department_id": department_id,
+        "waiting_time": waiting_time,
+        "estimated_los_days": los_result["estimated_los_days"],
+        "los_confidence": los_result["los_confidence"],
+    }
+    if RISK_RANK.get(risk_level, 0) > RISK_RANK.get(previous_risk, 0):
+        triage_row["is_escalated"] = True
+    stage_start = time.perf_counter()
+    try:
+        with stage_timer("persist"):
+            await asyncio.to_thread(_save_retriage, patient["id"], previous["id"], request, triage_row, factors)
     except Exception as e:
-        logger.error(f"Failed to persist triage to Supabase: {e}")
-        # Non-fatal: still return the AI result even if DB save fails
+        # The queue, wait estimate and alerts must not show a risk that was never stored
+        logger.error(f"Failed to persist re-triage for {patient_code}: {e}")
+        raise HTTPException(status_code=503, detail="Re-triage could not be saved")
+    stages["persist"] = "done"
+    timings["persist"] = round((time.perf_counter() - stage_start) * 1000, 1)
+
+    # Same arrival, new priority: the patient keeps the waiting time already accrued
+    queued = get_queue().get(patient_code)
+    if queued is not None:
+        get_queue().push({
+            **queued,
+            "risk_level": risk_level,
+            "priority_score": triage_result["priority_score"],
+            "predicted_disease": disease_result["predicted_disease"],
+            "department_id": department_id,
+            "department_name": department,
+            "waiting_time": waiting_time,
+        })
+        wait_estimator.add(patient_code, department_id, triage_result["priority_score"], arrival=False)
+    if risk_changed:
+        await asyncio.to_thread(_emit_risk_change, patient, previous_risk, risk_level, triage_result["priority_score"])
 
-    return TriageResponse(
+    timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    return RetriageResponse(
         patient_id=patient_code,
         name=request.name,
         age=request.age,
         gender=request.gender,
-        risk_level=triage_result["risk_level"],
+        risk_level=risk_level,
         priority_score=triage_result["priority_score"],
         department=department,
         confidence=combined_confidence,
         predicted_disease=disease_result["predicted_disease"],
         top_diseases=[TopDisease(**d) for d in disease_result.get("top_diseases", [])],
         contributing_factors=[ContributingFactor(**f) for f in factors],
+        extracted_symptoms=[ExtractedSymptom(**m) for m in extracted],
         waiting_time=waiting_time,
         estimated_los_days=los_result["estimated_los_days"],
         los_confidence=los_result["los_confidence"],
-        vitals=vitals,
+        vitals={
+            "bloodPressure": f"{request.blood_pressure_systolic or 'N/A'}/{request.blood_pressure_diastolic or 'N/A'}",
+            "heartRate": str(request.heart_rate or "N/A"),
+            "temperature": str(request.temperature or "N/A"),
+            "oxygenSaturation": str(request.oxygen_saturation or "N/A"),
+            "respiratoryRate": str(request.respiratory_rate or "N/A"),
+        },
+        stages=stages,
+        timings_ms=timings,
+        previous_risk_level=previous_risk,
+        previous_priority_score=previous["priority_score"],
+        risk_changed=risk_changed,
+        disease_reused=disease_reused,
     )
 
 
@@ -210,17 +654,73 @@ async def run_triage(request: PatientIntakeRequest):
 async def submit_feedback(feedback: FeedbackRequest):
     """Log user feedback for error analysis."""
 
-    # In a real production app, this would go to a database.
-    # For the hackathon/demo, we'll append to a local JSONL file.
     log_entry = feedback.dict()
     log_entry["timestamp"] = datetime.now().isoformat()
 
-    file_path = "feedback_log.json"
-
     try:
-        with open(file_path, "a") as f:
-            f.write(json.dumps(log_entry) + "\n")
+        # Returns once the entry is fsynced, batched with concurrent submissions
+        await get_feedback_log().append(log_entry)
     except Exception as e:
-        print(f"Error writing feedback: {e}")
+        logger.error(f"Error writing feedback: {e}")
+        raise HTTPException(status_code=503, detail="Feedback could not be saved")
 
     return {"status": "success", "message": "Feedback received"}
+
+
+@router.get("/feedback")
+async def list_feedback(
+    patient_id: str | None = None,
+    feedback_type: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Logged feedback from every worker, newest first, filtered by patient and/or type via the log indexes."""
+    return await asyncio.to_thread(get_feedback_log().query, patient_id, feedback_type, limit)
+
+
+@router.get("/feedback/stats")
+async def feedback_stats(days: int = Query(7, ge=1, le=366)):
+    """Feedback counts by type over the last `days` days, and as a share of triages."""
+    since = (date.today() - timedelta(days=days - 1)).isoformat()
+    daily = await asyncio.to_thread(get_feedback_log().daily_counts, since)
+
+    by_type: dict[str, int] = {}
+    for counts in daily.values():
+        for feedback_type, n in counts.items():
+            by_type[feedback_type] = by_type.get(feedback_type, 0) + n
+
+    total_triaged = None
+    try:
+        rows = await asyncio.to_thread(table_select, "daily_stats", {
+            "select": "total_patients",
+            "stat_date": f"gte.{since}",
+        })
+        total_triaged = sum(r.get("total_patients") or 0 for r in rows)
+    except Exception as e:
+        logger.error(f"Failed to load triage totals for feedback stats: {e}")
+
+    return {
+        "since": since,
+        "total_feedback": sum(by_type.values()),
+        "by_type": by_type,
+        "daily": {day: dict(counts) for day, counts in sorted(daily.items())},
+        "total_triaged": total_triaged,
+        "error_rate": {
+            feedback_type: round(n / total_triaged, 4) for feedback_type, n in by_type.items()
+        } if total_triaged else None,
+    }
+
+
+@router.get("/models/triage/refresh")
+async def triage_refresh_status():
+    """Current refreshed-model version, pending corrections and the last refresh outcome."""
+    return await asyncio.to_thread(refresh_status)
+
+
+@router.post("/models/triage/refresh")
+async def trigger_triage_refresh():
+    """Refresh the triage model from feedback now, even below the usual sample threshold."""
+    try:
+        return await asyncio.to_thread(refresh_triage_model, True)
+    except Exception as e:
+        logger.error(f"Triage model refresh failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Model refresh failed: {str(e)}")
@@ -1,35 +1,76 @@
 """Voice processing API."""
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
-import time
-import random
+import os
+from fastapi import APIRouter, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect
+
+from app.services.transcription import AsyncTranscription
 
 router = APIRouter()
 
+MAX_VOICE_BYTES = int(os.getenv("MAX_VOICE_BYTES", str(25 * 1024 * 1024)))
+VOICE_CHUNK_BYTES = 32 * 1024
+
+
 @router.post("/voice/process")
-async def process_voice(file: UploadFile = File(...)):
+async def process_voice(file: UploadFile = File(...), language: str = "en-US"):
+    """Transcribe an uploaded audio file.
+
+    The upload is streamed to the transcription backend in chunks rather than
+    read whole. Use the /voice/stream WebSocket to receive partial transcripts.
     """
-    Process uploaded audio file and return transcribed text.
-    Currently mocked to avoid dependency issues with speech_recognition/pydub
-    on the user's local environment if not installed.
+    try:
+        transcription = AsyncTranscription(language)
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    size = 0
+    while chunk := await file.read(VOICE_CHUNK_BYTES):
+        size += len(chunk)
+        if size > MAX_VOICE_BYTES:
+            raise HTTPException(status_code=413, detail="Audio file is too large")
+        await transcription.feed(chunk)
+
+    if not size:
+        raise HTTPException(status_code=400, detail="Empty audio file")
+    return await transcription.finish()
+
+
+@router.websocket("/voice/stream")
+async def stream_voice(websocket: WebSocket, language: str = "en-US"):
+    """Live transcription over a WebSocket.
+
+    The client sends audio as binary frames and a text frame "end" when done.
+    The server replies with {"type": "partial", "text"} as the transcript
+    grows and a closing {"type": "final", "text", "confidence", "detected_language"}.
     """
-    # Simulate processing delay
-    time.sleep(1.5)
-    
-    # In a real app, we would save 'file' and pass it to Whisper or Google Speech API
-    # content = await file.read()
-    
-    # Mock responses based on typical triage inputs
-    mock_transcriptions = [
-        "I have a severe headache and I've been feeling dizzy since this morning.",
-        "My chest hurts when I breathe deeply, and I have a dry cough.",
-        "I fell down the stairs and my right ankle is very swollen and painful.",
-        "I've had a high fever for two days and I'm shivering constantly.",
-        "My stomach has been hurting really bad after I ate dinner last night."
-    ]
-    
-    return {
-        "text": random.choice(mock_transcriptions),
-        "confidence": round(random.uniform(0.85, 0.99), 2),
-        "detected_language": "en-US"
-    }
+    await websocket.accept()
+    try:
+        transcription = AsyncTranscription(language)
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1011)
+        return
+
+    size = 0
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                size += len(message["bytes"])
+                if size > MAX_VOICE_BYTES:
+                    await websocket.send_json({"type": "error", "detail": "Audio stream is too large"})
+                    await websocket.close(code=1009)
+                    return
+                partial = await transcription.feed(message["bytes"])
+                if partial is not None:
+                    await websocket.send_json({"type": "partial", "text": partial})
+            elif message.get("text") is not None:
+                if message["text"].strip() == "end":
+                    break
+
+        await websocket.send_json({"type": "final", **await transcription.finish()})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
@@ -15,6 +15,28 @@ class PatientIntakeRequest(BaseModel):
     symptoms: list[str] = []
     conditions: list[str] = []
     notes: str = ""
+    transcript: str = ""  # voice intake transcript, if any
+
+
+class VitalsUpdateRequest(BaseModel):
+    # Repeat vitals for a patient already triaged; unset vitals keep their last reading
+    blood_pressure_systolic: Optional[int] = None
+    blood_pressure_diastolic: Optional[int] = None
+    heart_rate: Optional[int] = None
+    temperature: Optional[float] = None  # in °F
+    oxygen_saturation: Optional[int] = None
+    respiratory_rate: Optional[int] = None
+    symptoms: Optional[list[str]] = None  # None keeps the previous intake's symptoms
+    notes: str = ""
+
+
+class ExtractedSymptom(BaseModel):
+    symptom: str  # model symptom column
+    source: str  # "notes" or "transcript"
+    text: str  # matched text as written
+    start: int
+    end: int
+    negated: bool
 
 
 class ContributingFactor(BaseModel):
@@ -38,10 +60,20 @@ class TriageResponse(BaseModel):
     priority_score: int  # 0-100
     department: str
     confidence: int  # 0-100
-    predicted_disease: str
+    predicted_disease: Optional[str]  # None while the disease stage is pending
     top_diseases: list[TopDisease] = []
     contributing_factors: list[ContributingFactor]
+    extracted_symptoms: list[ExtractedSymptom] = []
     waiting_time: int  # estimated minutes
-    estimated_los_days: int  # AI predicted length of stay
-    los_confidence: float  # 0.0 - 1.0
+    estimated_los_days: Optional[int]  # AI predicted length of stay; None while pending
+    los_confidence: Optional[float]  # 0.0 - 1.0
     vitals: dict  # pass back the vitals for display
+    stages: dict[str, str] = {}  # stage -> "done", "pending", "degraded" or "failed"
+    timings_ms: dict[str, float] = {}  # time spent per stage within the deadline, plus "total"
+
+
+class RetriageResponse(TriageResponse):
+    previous_risk_level: str
+    previous_priority_score: int
+    risk_changed: bool
+    disease_reused: bool  # stored disease prediction kept because the symptoms did not change
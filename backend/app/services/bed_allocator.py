@@ -0,0 +1,137 @@
+"""Pick free beds for triaged patients from the live bed index.
+
+Candidates are tried in order: the predicted department, then its overflow
+departments. Critical-care beds are held back from overflow for high-risk
+patients, who try them straight after their own department; a patient
+triaged to critical care can always use its beds. Lookups only touch the
+in-memory index, so a recommendation costs microseconds; batches are
+allocated sickest-first so scarce beds go to the patients who need them.
+When assigning, a patient whose assignment fails (Supabase unreachable,
+bed gone from the index) is reported as unassigned with the error, and
+the rest of the batch carries on.
+"""
+
+import logging
+
+import httpx
+
+from app.db.resilience import CircuitOpenError
+from app.services import bed_index
+from app.services.bed_index import BedConflict, PatientHasBed, get_bed_index
+
+logger = logging.getLogger(__name__)
+
+# Departments whose beds are reserved for high-risk patients (is_emergency in db_schema.sql)
+CRITICAL_CARE_DEPARTMENTS = ("emergency",)
+
+# Where to look when a department is full, in order of preference
+OVERFLOW_DEPARTMENTS = {
+    "cardiology": ["general"],
+    "neurology": ["general"],
+    "pulmonology": ["general", "infectious-disease"],
+    "infectious-disease": ["pulmonology", "general"],
+    "orthopedics": ["general"],
+    "pediatrics": ["general"],
+    "gastroenterology": ["general"],
+    "nephrology": ["urology", "general"],
+    "urology": ["nephrology", "general"],
+    "oncology": ["hematology", "general"],
+    "hematology": ["oncology", "general"],
+    "emergency": ["general"],
+}
+DEFAULT_OVERFLOW = ["general"]
+
+RISK_ORDER = {"high": 0, "medium": 1, "low": 2}
+
+
+def candidate_departments(department_id: str, risk_level: str) -> list[str]:
+    """Departments to search for a bed, most preferred first."""
+    high_risk = risk_level == "high"
+    order = [department_id]
+    if high_risk:
+        order += CRITICAL_CARE_DEPARTMENTS
+    order += OVERFLOW_DEPARTMENTS.get(department_id, DEFAULT_OVERFLOW)
+
+    seen = set()
+    candidates = []
+    for dept in order:
+        # A patient triaged to critical care may use its beds; others may not overflow into them
+        overflow_into_critical = dept != department_id and dept in CRITICAL_CARE_DEPARTMENTS
+        if dept in seen or (not high_risk and overflow_into_critical):
+            continue
+        seen.add(dept)
+        candidates.append(dept)
+    return candidates
+
+
+def recommend_bed(department_id: str, risk_level: str, exclude: set | None = None) -> tuple[dict, str] | None:
+    """Return (bed, department_id) for the best free bed, or None if none fit."""
+    index = get_bed_index()
+    for dept in candidate_departments(department_id, risk_level):
+        bed = index.next_free(dept, exclude or set())
+        if bed is not None:
+            return bed, dept
+    return None
+
+
+def allocate_beds(patients: list[dict], assign: bool = False) -> list[dict]:
+    """Recommend (and optionally assign) one bed per patient.
+
+    Each patient needs `patient_id`, `department_id` and `risk_level`;
+    `estimated_los_days` breaks ties so longer stays are placed first.
+    Results come back in the same order as the input.
+    """
+    order = sorted(
+        range(len(patients)),
+        key=lambda i: (
+            RISK_ORDER.get(patients[i].get("risk_level"), 3),
+            -(patients[i].get("estimated_los_days") or 0),
+        ),
+    )
+
+    taken: set[str] = set()
+    results: list[dict | None] = [None] * len(patients)
+    for i in order:
+        patient = patients[i]
+        department_id = patient.get("department_id") or "general"
+        risk_level = patient.get("risk_level") or "low"
+        result = {
+            "patient_id": patient.get("patient_id"),
+            "requested_department_id": department_id,
+            "status": "unavailable",
+            "bed": None,
+            "department_id": None,
+            "is_overflow": False,
+        }
+
+        while True:
+            pick = recommend_bed(department_id, risk_level, taken)
+            if pick is None:
+                break
+            bed, dept = pick
+            taken.add(bed["id"])
+            if assign:
+                try:
+                    bed = bed_index.assign_bed(bed["id"], patient["patient_id"])
+                except PatientHasBed as e:
+                    taken.discard(bed["id"])
+                    result.update(status="unassigned", error=str(e))
+                    break
+                except BedConflict:
+                    # Lost the bed to another worker; try the next one
+                    continue
+                except (httpx.HTTPError, CircuitOpenError, KeyError) as e:
+                    # The bed stays out of this batch: the write may have landed
+                    logger.error(f"Could not assign bed {bed['id']} to {patient['patient_id']}: {e!r}")
+                    result.update(status="unassigned", error=str(e) or type(e).__name__)
+                    break
+            result.update(
+                status="assigned" if assign else "recommended",
+                bed=bed,
+                department_id=dept,
+                is_overflow=dept != department_id,
+            )
+            break
+
+        results[i] = result
+    return results
@@ -0,0 +1,329 @@
+"""In-memory bed availability index with transactional writes to Supabase.
+
+Free beds are kept per department in insertion-ordered dicts used as sets,
+so counting, listing and taking a free bed are O(1). Every bed move goes
+through one database function (db_schema_bed_moves.sql) that checks the
+bed's current state, changes `beds` and writes the `bed_assignments`
+history in a single transaction. Two workers racing for the same bed cannot
+both win: the loser gets a 409, refreshes that bed from the database and
+reports a conflict.
+
+Each API worker holds its own index, loaded on startup and resynced every
+BED_INDEX_RESYNC_SECONDS to pick up changes made by other workers.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+
+import httpx
+
+from app.db.supabase_client import SUPABASE_URL, rpc, table_select, table_select_one
+
+logger = logging.getLogger(__name__)
+
+BED_INDEX_RESYNC_SECONDS = int(os.getenv("BED_INDEX_RESYNC_SECONDS", "60"))
+
+_task: asyncio.Task | None = None
+
+
+class BedConflict(Exception):
+    """The bed was not in the expected state when we tried to change it."""
+
+
+class PatientHasBed(BedConflict):
+    """The patient already holds a bed; move them with transfer_bed instead."""
+
+
+def _occupant(row: dict) -> tuple:
+    return bool(row.get("is_occupied")), row.get("current_patient_id")
+
+
+class BedIndex:
+    def __init__(self):
+        self._beds: dict[str, dict] = {}
+        self._free: dict[str, dict[str, None]] = {}  # department_id -> ordered set of free bed ids
+        self._by_patient: dict[str, str] = {}        # patient_id -> bed_id
+        self._lock = threading.Lock()
+        # Bumped whenever any bed's occupant changes (admission, discharge,
+        # transfer), including changes picked up from other workers by a resync
+        self.version = 0
+
+    # --- index maintenance ---
+
+    def load(self, rows: list[dict]):
+        """Replace the index contents with a full `beds` table read."""
+        with self._lock:
+            before = {b: _occupant(row) for b, row in self._beds.items()}
+            self._beds.clear()
+            self._free.clear()
+            self._by_patient.clear()
+            for row in sorted(rows, key=lambda r: r.get("bed_number") or ""):
+                self._set(row)
+            if {b: _occupant(row) for b, row in self._beds.items()} != before:
+                self.version += 1
+
+    def _set(self, row: dict):
+        bed_id = row["id"]
+        old = self._beds.get(bed_id)
+        if old is not None:
+            self._free.get(old["department_id"], {}).pop(bed_id, None)
+            old_patient = old.get("current_patient_id")
+            if old_patient and self._by_patient.get(old_patient) == bed_id:
+                del self._by_patient[old_patient]
+
+        if old is not None and _occupant(old) != _occupant(row):
+            self.version += 1
+        self._beds[bed_id] = row
+        free = self._free.setdefault(row["department_id"], {})
+        if row.get("is_occupied"):
+            if row.get("current_patient_id"):
+                self._by_patient[row["current_patient_id"]] = bed_id
+        else:
+            free[bed_id] = None
+
+    def update(self, row: dict):
+        with self._lock:
+            self._set(row)
+
+    # --- queries ---
+
+    def get(self, bed_id: str) -> dict | None:
+        return self._beds.get(bed_id)
+
+    def bed_for_patient(self, patient_id: str) -> dict | None:
+        bed_id = self._by_patient.get(patient_id)
+        return self._beds.get(bed_id) if bed_id else None
+
+    def free_count(self, department_id: str) -> int:
+        return len(self._free.get(department_id, {}))
+
+    def free_beds(self, department_id: str, limit: int | None = None) -> list[dict]:
+        with self._lock:
+            ids = self._free.get(department_id, {})
+            if limit is not None:
+                ids = list(ids)[:limit]
+            return [self._beds[b] for b in ids]
+
+    def next_free(self, department_id: str, exclude: set | frozenset = frozenset()) -> dict | None:
+        """First free bed in a department not in `exclude`; O(len(exclude))."""
+        with self._lock:
+            for bed_id in self._free.get(department_id, {}):
+                if bed_id not in exclude:
+                    return self._beds[bed_id]
+        return None
+
+    def beds(self, department_id: str | None = None) -> list[dict]:
+        with self._lock:
+            rows = [b for b in self._beds.values() if not department_id or b["department_id"] == department_id]
+        return sorted(rows, key=lambda r: r.get("bed_number") or "")
+
+    def availability(self) -> list[dict]:
+        """Total and free beds per department."""
+        totals: dict[str, int] = {}
+        with self._lock:
+            for bed in self._beds.values():
+                totals[bed["department_id"]] = totals.get(bed["department_id"], 0) + 1
+            return [
+                {"department_id": dept, "total": total, "free": len(self._free.get(dept, {}))}
+                for dept, total in sorted(totals.items())
+            ]
+
+    # --- local reservations ---
+
+    def claim(self, bed_id: str) -> dict:
+        """Take a free bed out of the free list before the remote write.
+
+        Stops two requests on this worker from chasing the same bed; the
+        database CAS still arbitrates between workers.
+        """
+        with self._lock:
+            bed = self._beds.get(bed_id)
+            if bed is None:
+                raise KeyError(bed_id)
+            free = self._free.get(bed["department_id"], {})
+            if bed_id not in free:
+                raise BedConflict(f"Bed {bed.get('bed_number', bed_id)} is not free")
+            del free[bed_id]
+            return bed
+
+    def unclaim(self, bed_id: str):
+        with self._lock:
+            bed = self._beds.get(bed_id)
+            if bed is not None and not bed.get("is_occupied"):
+                self._free.setdefault(bed["department_id"], {})[bed_id] = None
+
+
+_index: BedIndex | None = None
+
+
+def get_bed_index() -> BedIndex:
+    """Return the process-wide bed index."""
+    global _index
+    if _index is None:
+        _index = BedIndex()
+    return _index
+
+
+def load_bed_index() -> int:
+    """(Re)load the bed index from the `beds` table. Returns the bed count."""
+    rows = table_select("beds", {"order": "bed_number.asc"})
+    get_bed_index().load(rows)
+    return len(rows)
+
+
+def _refresh_bed(bed_id: str):
+    row = table_select_one("beds", {"id": f"eq.{bed_id}"})
+    if row:
+        get_bed_index().update(row)
+
+
+# --- Atomic operations ---
+
+def _bed_move(function: str, args: dict) -> list[dict]:
+    """Call a bed move function, turning its 409/404 answers into BedConflict/KeyError."""
+    try:
+        return rpc(function, args)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 409:
+            try:
+                error = e.response.json()
+            except ValueError:
+                error = {}
+            message = error.get("message") or e.response.text
+            # Raised by occupy_bed's check, or by the unique indexes on a concurrent occupy
+            if error.get("hint") == "patient_has_bed" or error.get("code") == "23505":
+                raise PatientHasBed(message) from e
+            raise BedConflict(message) from e
+        if e.response.status_code == 404:
+            raise KeyError(args.get("p_bed_id") or args.get("p_to_bed_id")) from e
+        raise
+
+
+def _claim(bed_id: str):
+    index = get_bed_index()
+    try:
+        index.claim(bed_id)
+    except (KeyError, BedConflict):
+        # This worker's view may be stale (the bed was added or freed by another
+        # worker); re-read it and try once more. The database is the authority.
+        _refresh_bed(bed_id)
+        if index.get(bed_id) is None:
+            raise KeyError(bed_id)
+        index.claim(bed_id)
+
+
+def _occupy(bed_id: str, patient_id: str) -> dict:
+    """Occupy a free bed and open its assignment history row, in one transaction."""
+    index = get_bed_index()
+    _claim(bed_id)
+    try:
+        rows = _bed_move("occupy_bed", {"p_bed_id": bed_id, "p_patient_id": patient_id})
+    except BedConflict:
+        # Another worker got there first
+        _refresh_bed(bed_id)
+        raise
+    except Exception:
+        index.unclaim(bed_id)
+        raise
+    bed = rows[0]
+    index.update(bed)
+    return bed
+
+
+def _vacate(bed_id: str, patient_id: str) -> dict:
+    """Free an occupied bed and close its open assignment, in one transaction."""
+    try:
+        rows = _bed_move("vacate_bed", {"p_bed_id": bed_id, "p_patient_id": patient_id})
+    except BedConflict:
+        _refresh_bed(bed_id)
+        raise
+    get_bed_index().update(rows[0])
+    return rows[0]
+
+
+def assign_bed(bed_id: str, patient_id: str) -> dict:
+    """Assign a free bed to a patient.
+
+    Raises BedConflict if the bed is taken, PatientHasBed if the patient
+    already holds one (the database checks too; this index may be stale).
+    """
+    held = get_bed_index().bed_for_patient(patient_id)
+    if held is not None:
+        raise PatientHasBed(f"Patient already holds bed {held.get('bed_number', held['id'])}")
+    return _occupy(bed_id, patient_id)
+
+
+def release_bed(bed_id: str, patient_id: str | None = None) -> dict:
+    """Free a bed held by `patient_id` (or by whoever currently holds it)."""
+    if patient_id is None:
+        bed = get_bed_index().get(bed_id)
+        if bed is None or not bed.get("current_patient_id"):
+            _refresh_bed(bed_id)
+            bed = get_bed_index().get(bed_id)
+        if bed is None:
+            raise KeyError(bed_id)
+        if not bed.get("current_patient_id"):
+            raise BedConflict("Bed is not occupied")
+        patient_id = bed["current_patient_id"]
+    return _vacate(bed_id, patient_id)
+
+
+def transfer_bed(patient_id: str, to_bed_id: str, from_bed_id: str | None = None) -> dict:
+    """Move a patient to another bed. Both beds change in one transaction, or neither does."""
+    index = get_bed_index()
+    from_bed = index.get(from_bed_id) if from_bed_id else index.bed_for_patient(patient_id)
+    if from_bed is None:
+        raise BedConflict("Patient has no current bed")
+
+    _claim(to_bed_id)
+    try:
+        released, to_bed = _bed_move("transfer_bed", {
+            "p_patient_id": patient_id,
+            "p_from_bed_id": from_bed["id"],
+            "p_to_bed_id": to_bed_id,
+        })
+    except BedConflict:
+        _refresh_bed(from_bed["id"])
+        _refresh_bed(to_bed_id)
+        raise
+    except Exception:
+        index.unclaim(to_bed_id)
+        raise
+    index.update(released)
+    index.update(to_bed)
+    return {"from_bed": released, "to_bed": to_bed}
+
+
+# --- Resync loop ---
+
+async def _resync_forever():
+    while True:
+        await asyncio.sleep(BED_INDEX_RESYNC_SECONDS)
+        try:
+            await asyncio.to_thread(load_bed_index)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Bed index resync failed: {e}")
+
+
+def start_bed_index_resync():
+    """Periodically reload the bed index (no-op without Supabase)."""
+    global _task
+    if not SUPABASE_URL:
+        return
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_resync_forever())
+
+
+async def stop_bed_index_resync():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
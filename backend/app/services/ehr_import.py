@@ -0,0 +1,614 @@
+"""Resumable EHR import jobs: parse → triage → persist.
+
+An import job turns a batch of uploaded .docx records into triaged, queued
+patients. Documents flow through three stages joined by bounded queues, so a
+slow stage (usually persistence) makes the earlier ones wait instead of
+buffering the whole upload in memory:
+
+    parse    EHR_PARSE_WORKERS concurrent parses in the EHR process pool
+    triage   up to IMPORT_TRIAGE_BATCH records per vectorised model call
+    persist  up to IMPORT_PERSIST_BATCH records per bulk insert
+
+Uploaded files are kept under EHR_IMPORT_DIR and each document has a row in
+`ehr_import_items` with a pre-assigned patient_code. Only the persist stage
+writes item status, so after a crash the job resumes from the items that are
+still pending. Persisting is idempotent per patient_code, so a batch that
+was half-written before the crash is completed rather than duplicated.
+See db_schema_ehr_import.sql.
+
+Every worker tries to resume active jobs on startup, so a job only runs in
+the worker holding its lease (db_schema_ehr_import_lease.sql). The lease is
+renewed with each progress update and lapses after IMPORT_LEASE_SECONDS if
+its worker dies.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import socket
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.db.supabase_client import (
+    SUPABASE_URL,
+    table_insert,
+    table_insert_many,
+    table_select,
+    table_select_one,
+    table_update,
+    table_upsert,
+)
+from app.models.disease_model import get_symptom_columns, predict_disease_batch
+from app.models.los_model import predict_los_batch
+from app.models.triage_model import predict_triage_batch
+from app.schemas.patient import PatientIntakeRequest
+from app.services.ehr_pool import EHR_PARSE_WORKERS, parse_in_pool
+from app.services.patient_codes import new_patient_codes
+from app.services.triage_queue import get_queue
+from app.services.wait_estimator import get_wait_estimator
+from app.utils.department_mapper import DEPT_NAME_TO_ID, map_disease_to_department
+from app.utils.feature_engineering import (
+    compute_contributing_factors,
+    prepare_symptom_features,
+    prepare_triage_features,
+)
+from app.utils.symptom_extractor import extract_symptoms
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+EHR_IMPORT_DIR = os.getenv("EHR_IMPORT_DIR", os.path.join(BASE_DIR, "ehr_imports"))
+IMPORT_QUEUE_SIZE = int(os.getenv("IMPORT_QUEUE_SIZE", "64"))
+IMPORT_TRIAGE_BATCH = int(os.getenv("IMPORT_TRIAGE_BATCH", "32"))
+IMPORT_PERSIST_BATCH = int(os.getenv("IMPORT_PERSIST_BATCH", "50"))
+IMPORT_MAX_CONCURRENT_JOBS = int(os.getenv("IMPORT_MAX_CONCURRENT_JOBS", "1"))
+IMPORT_LEASE_SECONDS = int(os.getenv("IMPORT_LEASE_SECONDS", "300"))
+
+ACTIVE_STATUSES = ("queued", "running")
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_tasks: dict[str, asyncio.Task] = {}
+_progress: dict[str, dict] = {}
+_job_slots: asyncio.Semaphore | None = None
+_sweeper: asyncio.Task | None = None
+
+
+class ImportLeaseLost(Exception):
+    """Another worker has taken over the job."""
+
+
+def _job_dir(job_id: str) -> str:
+    return os.path.join(EHR_IMPORT_DIR, job_id)
+
+
+def _item_path(job_id: str, item_index: int) -> str:
+    return os.path.join(_job_dir(job_id), f"{item_index:05d}.docx")
+
+
+# --- job creation and status ---
+
+def create_job(documents: list[tuple[str, bytes | None]]) -> dict:
+    """Store uploaded documents and register a queued job. Returns the job row.
+
+    Documents given as (filename, None) were rejected at upload (e.g. too
+    large) and are recorded as failed straight away.
+    """
+    job = table_insert("ehr_import_jobs", {"status": "queued", "total": len(documents)})
+    job_id = job["id"]
+    os.makedirs(_job_dir(job_id), exist_ok=True)
+
+    # A resumed job finds its patients by code, so codes come from the
+    # allocator and never match a patient the job did not create
+    codes = new_patient_codes(len(documents))
+    items = []
+    failed = 0
+    for index, (filename, data) in enumerate(documents):
+        item = {
+            "job_id": job_id,
+            "item_index": index,
+            "filename": filename,
+            "patient_code": codes[index],
+            "status": "pending",
+        }
+        if data is None:
+            item.update(status="failed", error="File too large")
+            failed += 1
+        else:
+            with open(_item_path(job_id, index), "wb") as f:
+                f.write(data)
+        items.append(item)
+
+    for start in range(0, len(items), IMPORT_PERSIST_BATCH):
+        table_insert_many("ehr_import_items", items[start:start + IMPORT_PERSIST_BATCH])
+    if failed:
+        rows = table_update("ehr_import_jobs", {"id": f"eq.{job_id}"}, {"failed": failed})
+        job = rows[0] if rows else {**job, "failed": failed}
+    return job
+
+
+def get_job(job_id: str) -> dict | None:
+    """Job row with live stage counters when it is running in this process."""
+    job = table_select_one("ehr_import_jobs", {"id": f"eq.{job_id}"})
+    if job is None:
+        return None
+    live = _progress.get(job_id)
+    if live is not None:
+        job.update({k: live[k] for k in ("completed", "failed")})
+        job["stages"] = {k: live[k] for k in ("parsed", "triaged", "persisted")}
+    job["progress_pct"] = round((job["completed"] + job["failed"]) / job["total"] * 100, 1) if job["total"] else 100.0
+    return job
+
+
+def list_jobs(limit: int = 20) -> list[dict]:
+    return table_select("ehr_import_jobs", {"order": "created_at.desc", "limit": str(limit)})
+
+
+def list_items(job_id: str, status: str | None = None) -> list[dict]:
+    params = {"job_id": f"eq.{job_id}", "order": "item_index.asc"}
+    if status:
+        params["status"] = f"eq.{status}"
+    return table_select("ehr_import_items", params)
+
+
+# --- stage work (run in threads) ---
+
+def triage_records(records: list[dict]) -> list[dict]:
+    """Run the triage, disease and LOS models over a batch of intake dicts.
+
+    Features for the whole batch are stacked so each model is called once.
+    """
+    symptom_columns = get_symptom_columns()
+    triage_features = np.vstack([
+        prepare_triage_features(
+            age=r["age"],
+            heart_rate=r["heart_rate"],
+            systolic_bp=r["blood_pressure_systolic"],
+            oxygen_saturation=r["oxygen_saturation"],
+            temperature_f=r["temperature"],
+            chronic_disease_count=len([c for c in r["conditions"] if c.lower() != "none"]),
+        )
+        for r in records
+    ])
+    symptom_features = np.vstack([
+        prepare_symptom_features(
+            r["symptoms"], symptom_columns, extract_symptoms({"notes": r["notes"]}, symptom_columns)
+        )
+        for r in records
+    ])
+    triage_results = predict_triage_batch(triage_features)
+    disease_results = predict_disease_batch(symptom_features)
+    los_results = predict_los_batch(
+        risk_levels=[t["risk_level"] for t in triage_results],
+        predicted_diseases=[d["predicted_disease"] for d in disease_results],
+        ages=[r["age"] for r in records],
+        heart_rate=[r["heart_rate"] for r in records],
+        systolic_bp=[r["blood_pressure_systolic"] for r in records],
+        oxygen_saturation=[r["oxygen_saturation"] for r in records],
+        temperature_f=[r["temperature"] for r in records],
+    )
+
+    wait_estimator = get_wait_estimator()
+    outcomes = []
+    for r, triage_result, disease_result, los_result in zip(records, triage_results, disease_results, los_results):
+        department = map_disease_to_department(disease_result["predicted_disease"])
+        department_id = DEPT_NAME_TO_ID.get(department, "general")
+        outcomes.append({
+            "triage": triage_result,
+            "disease": disease_result,
+            "department": department,
+            "department_id": department_id,
+            "waiting_time": wait_estimator.estimate_wait(department_id, triage_result["priority_score"]),
+            "los": los_result,
+            "confidence": int(triage_result["confidence"] * 0.6 + disease_result["disease_confidence"] * 0.4),
+            "factors": compute_contributing_factors(
+                heart_rate=r["heart_rate"],
+                systolic_bp=r["blood_pressure_systolic"],
+                diastolic_bp=r["blood_pressure_diastolic"],
+                temperature_f=r["temperature"],
+                oxygen_saturation=r["oxygen_saturation"],
+                respiratory_rate=r["respiratory_rate"],
+                age=r["age"],
+                feature_contributions=triage_result["feature_contributions"],
+                chronic_disease_count=len([c for c in r["conditions"] if c.lower() != "none"]),
+            ),
+        })
+    return outcomes
+
+
+def triage_each(records: list[dict]) -> list[tuple[dict | None, str | None]]:
+    """`triage_records` one record at a time, as (outcome, error) per record."""
+    results = []
+    for record in records:
+        try:
+            results.append((triage_records([record])[0], None))
+        except Exception as e:
+            results.append((None, f"Triage failed: {e}"))
+    return results
+
+
+def _in_list(values) -> str:
+    return f"in.({','.join(values)})"
+
+
+def persist_batch(job_id: str, batch: list[tuple[dict, dict | None, dict | None, str | None]]) -> tuple[int, int]:
+    """Write a batch of (item, record, outcome, error) to the database.
+
+    Safe to repeat: patients, intakes and triages already written for an
+    item's patient_code are reused. Returns (completed, failed) counts.
+    """
+    ok = [(item, record, outcome) for item, record, outcome, error in batch if error is None]
+    codes = [item["patient_code"] for item, _, _ in ok]
+
+    patient_ids = {}
+    if codes:
+        existing = table_select("patients", {"select": "id,patient_code", "patient_code": _in_list(codes)})
+        patient_ids = {row["patient_code"]: row["id"] for row in existing}
+        new_patients = [
+            {
+                "patient_code": item["patient_code"],
+                "name": record["name"],
+                "age": record["age"],
+                "gender": record["gender"],
+                "status": "waiting",
+            }
+            for item, record, _ in ok if item["patient_code"] not in patient_ids
+        ]
+        for row in table_insert_many("patients", new_patients):
+            patient_ids[row["patient_code"]] = row["id"]
+
+    intake_ids, triaged = {}, {}
+    if patient_ids:
+        ids = _in_list(patient_ids.values())
+        intake_ids = {
+            row["patient_id"]: row["id"]
+            for row in table_select("patient_intakes", {"select": "id,patient_id", "patient_id": ids})
+        }
+        triaged = {
+            row["patient_id"]: row["id"]
+            for row in table_select("triage_results", {"select": "id,patient_id", "patient_id": ids})
+        }
+
+    new_intakes = [
+        {
+            "patient_id": patient_ids[item["patient_code"]],
+            "blood_pressure_systolic": record["blood_pressure_systolic"],
+            "blood_pressure_diastolic": record["blood_pressure_diastolic"],
+            "heart_rate": record["heart_rate"],
+            "temperature": record["temperature"],
+            "oxygen_saturation": record["oxygen_saturation"],
+            "respiratory_rate": record["respiratory_rate"],
+            "symptoms": record["symptoms"],
+            "conditions": record["conditions"],
+            "notes": record["notes"],
+            "intake_method": "ehr_upload",
+        }
+        for item, record, _ in ok if patient_ids[item["patient_code"]] not in intake_ids
+    ]
+    for row in table_insert_many("patient_intakes", new_intakes):
+        intake_ids[row["patient_id"]] = row["id"]
+
+    to_triage = [(item, record, outcome) for item, record, outcome in ok if patient_ids[item["patient_code"]] not in triaged]
+    triage_rows = table_insert_many("triage_results", [
+        {
+            "patient_id": patient_ids[item["patient_code"]],
+            "intake_id": intake_ids[patient_ids[item["patient_code"]]],
+            "risk_level": outcome["triage"]["risk_level"],
+            "priority_score": outcome["triage"]["priority_score"],
+            "triage_level": outcome["triage"]["triage_level"],
+            "confidence": outcome["confidence"],
+            "predicted_disease": outcome["disease"]["predicted_disease"],
+            "disease_confidence": outcome["disease"]["disease_confidence"],
+            "department_id": outcome["department_id"],
+            "waiting_time": outcome["waiting_time"],
+            "estimated_los_days": outcome["los"]["estimated_los_days"],
+            "los_confidence": outcome["los"]["los_confidence"],
+        }
+        for item, record, outcome in to_triage
+    ])
+    triage_ids = {**triaged, **{row["patient_id"]: row["id"] for row in triage_rows}}
+    # Triages written just before a crash may still be missing their factors
+    with_factors = set()
+    if triaged:
+        with_factors = {
+            row["triage_id"]
+            for row in table_select("contributing_factors", {
+                "select": "triage_id",
+                "triage_id": _in_list(triaged.values()),
+            })
+        }
+    table_insert_many("contributing_factors", [
+        {
+            "triage_id": triage_ids[patient_ids[item["patient_code"]]],
+            "name": f["name"],
+            "value": f["value"],
+            "impact": f["impact"],
+            "is_positive": f["isPositive"],
+            "sort_order": i,
+        }
+        for item, _, outcome in ok
+        if triage_ids[patient_ids[item["patient_code"]]] not in with_factors
+        for i, f in enumerate(outcome["factors"])
+    ])
+
+    table_upsert("ehr_import_items", [
+        {
+            "job_id": job_id,
+            "item_index": item["item_index"],
+            "filename": item["filename"],
+            "patient_code": item["patient_code"],
+            "status": "failed" if error else "done",
+            "error": error,
+        }
+        for item, _, _, error in batch
+    ], on_conflict="job_id,item_index")
+
+    # Newly triaged patients join the live queue like manual intakes
+    queue = get_queue()
+    wait_estimator = get_wait_estimator()
+    for item, record, outcome in to_triage:
+        queue.push({
+            "patient_code": item["patient_code"],
+            "name": record["name"],
+            "age": record["age"],
+            "gender": record["gender"],
+            "risk_level": outcome["triage"]["risk_level"],
+            "priority_score": outcome["triage"]["priority_score"],
+            "predicted_disease": outcome["disease"]["predicted_disease"],
+            "department_id": outcome["department_id"],
+            "department_name": outcome["department"],
+            "waiting_time": outcome["waiting_time"],
+        })
+        wait_estimator.add(item["patient_code"], outcome["department_id"], outcome["triage"]["priority_score"])
+
+    return len(ok), len(batch) - len(ok)
+
+
+# --- pipeline ---
+
+async def _take_batch(queue: asyncio.Queue, size: int) -> tuple[list, bool]:
+    """Wait for one entry, then take whatever else is ready up to `size`.
+
+    Returns (batch, done) where done means the upstream sentinel was seen.
+    """
+    first = await queue.get()
+    if first is None:
+        return [], True
+    batch = [first]
+    while len(batch) < size:
+        try:
+            entry = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            break
+        if entry is None:
+            return batch, True
+        batch.append(entry)
+    return batch, False
+
+
+def _read_item(job_id: str, item_index: int) -> bytes:
+    with open(_item_path(job_id, item_index), "rb") as f:
+        return f.read()
+
+
+async def _run_pipeline(job_id: str, items: list[dict]):
+    progress = _progress[job_id]
+    pending: asyncio.Queue = asyncio.Queue(maxsize=IMPORT_QUEUE_SIZE)
+    parsed: asyncio.Queue = asyncio.Queue(maxsize=IMPORT_QUEUE_SIZE)
+    triaged: asyncio.Queue = asyncio.Queue(maxsize=IMPORT_QUEUE_SIZE)
+
+    async def feed():
+        for item in items:
+            await pending.put(item)
+        for _ in range(EHR_PARSE_WORKERS):
+            await pending.put(None)
+
+    async def parse_worker():
+        while (item := await pending.get()) is not None:
+            try:
+                data = await asyncio.to_thread(_read_item, job_id, item["item_index"])
+                record = PatientIntakeRequest(**await parse_in_pool(data)).dict()
+                if not record["name"]:
+                    record["name"] = os.path.splitext(os.path.basename(item["filename"]))[0]
+                progress["parsed"] += 1
+                await parsed.put((item, record))
+            except asyncio.TimeoutError:
+                await triaged.put((item, None, None, "Timed out parsing document"))
+            except Exception as e:
+                await triaged.put((item, None, None, f"Failed to parse: {e}"))
+
+    async def parse_stage():
+        await asyncio.gather(*(parse_worker() for _ in range(EHR_PARSE_WORKERS)))
+        await parsed.put(None)
+
+    async def triage_stage():
+        done = False
+        while not done:
+            batch, done = await _take_batch(parsed, IMPORT_TRIAGE_BATCH)
+            if not batch:
+                continue
+            try:
+                outcomes = await asyncio.to_thread(triage_records, [record for _, record in batch])
+                for (item, record), outcome in zip(batch, outcomes):
+                    await triaged.put((item, record, outcome, None))
+                progress["triaged"] += len(batch)
+            except Exception as e:
+                # Retry record by record so only the records that fail are marked failed
+                logger.warning(f"Import {job_id}: triage batch failed ({e}); retrying one record at a time")
+                results = await asyncio.to_thread(triage_each, [record for _, record in batch])
+                for (item, record), (outcome, error) in zip(batch, results):
+                    if error:
+                        logger.error(f"Import {job_id}: {error}")
+                    await triaged.put((item, None if error else record, outcome, error))
+                progress["triaged"] += sum(1 for _, error in results if error is None)
+        await triaged.put(None)
+
+    async def persist_stage():
+        done = False
+        while not done:
+            batch, done = await _take_batch(triaged, IMPORT_PERSIST_BATCH)
+            if not batch:
+                continue
+            # Database errors propagate: the job stops and resumes from its pending items
+            completed, failed = await asyncio.to_thread(persist_batch, job_id, batch)
+            progress["persisted"] += completed
+            progress["completed"] += completed
+            progress["failed"] += failed
+            await asyncio.to_thread(_update_owned_job, job_id, {
+                "completed": progress["completed"],
+                "failed": progress["failed"],
+                "updated_at": datetime.utcnow().isoformat(),
+            })
+
+    stages = [asyncio.create_task(coro) for coro in (feed(), parse_stage(), triage_stage(), persist_stage())]
+    try:
+        await asyncio.gather(*stages)
+    finally:
+        for task in stages:
+            task.cancel()
+
+
+def _lease_expiry() -> str:
+    return (datetime.utcnow() + timedelta(seconds=IMPORT_LEASE_SECONDS)).isoformat()
+
+
+def claim_job(job_id: str) -> dict | None:
+    """Take the job's lease and mark it running. Returns the job, or None if another worker holds it."""
+    rows = table_update("ehr_import_jobs", {
+        "id": f"eq.{job_id}",
+        "status": _in_list(ACTIVE_STATUSES),
+        "or": f"(owner.is.null,owner.eq.{WORKER_ID},lease_expires_at.lt.{datetime.utcnow().isoformat()})",
+    }, {"status": "running", "owner": WORKER_ID, "lease_expires_at": _lease_expiry()})
+    return rows[0] if rows else None
+
+
+def _update_owned_job(job_id: str, data: dict, release: bool = False) -> dict:
+    """Update a job this worker holds, renewing (or releasing) the lease."""
+    lease = {"owner": None, "lease_expires_at": None} if release else {"lease_expires_at": _lease_expiry()}
+    rows = table_update("ehr_import_jobs", {"id": f"eq.{job_id}", "owner": f"eq.{WORKER_ID}"}, {**data, **lease})
+    if not rows:
+        raise ImportLeaseLost(f"Import {job_id} was taken over by another worker")
+    return rows[0]
+
+
+async def _run_job(job_id: str):
+    global _job_slots
+    if _job_slots is None:
+        _job_slots = asyncio.Semaphore(IMPORT_MAX_CONCURRENT_JOBS)
+    try:
+        async with _job_slots:
+            job = await asyncio.to_thread(claim_job, job_id)
+            if job is None:
+                logger.info(f"Import {job_id}: running in another worker")
+                return
+            items = await asyncio.to_thread(list_items, job_id, "pending")
+            _progress[job_id] = {
+                "parsed": 0, "triaged": 0, "persisted": 0,
+                "completed": job["completed"], "failed": job["failed"],
+            }
+            if not job.get("started_at"):
+                await asyncio.to_thread(_update_owned_job, job_id, {"started_at": datetime.utcnow().isoformat()})
+            logger.info(f"Import {job_id}: {len(items)} of {job['total']} documents to process")
+
+            await _run_pipeline(job_id, items)
+
+            progress = _progress[job_id]
+            await asyncio.to_thread(_update_owned_job, job_id, {
+                "status": "completed",
+                "completed": progress["completed"],
+                "failed": progress["failed"],
+                "finished_at": datetime.utcnow().isoformat(),
+            }, True)
+            await asyncio.to_thread(shutil.rmtree, _job_dir(job_id), True)
+            logger.info(f"Import {job_id}: done, {progress['completed']} imported, {progress['failed']} failed")
+    except asyncio.CancelledError:
+        # Shutdown: the job stays 'running' and is resumed by the next worker to start
+        raise
+    except ImportLeaseLost as e:
+        logger.warning(str(e))
+    except Exception as e:
+        logger.error(f"Import {job_id} stopped: {e}")
+        try:
+            await asyncio.to_thread(_update_owned_job, job_id, {"status": "failed", "error": str(e)}, True)
+        except Exception:
+            pass
+    finally:
+        _progress.pop(job_id, None)
+        _tasks.pop(job_id, None)
+
+
+def requeue_job(job_id: str) -> bool:
+    """Mark a stopped job as queued again. Returns False if it finished or is unknown."""
+    rows = table_update(
+        "ehr_import_jobs",
+        {"id": f"eq.{job_id}", "status": "in.(failed,queued,running)"},
+        {"status": "queued", "error": None},
+    )
+    return bool(rows)
+
+
+def start_job(job_id: str) -> bool:
+    """Run a job in the background. Returns False if it is already running here."""
+    if job_id in _tasks:
+        return False
+    _tasks[job_id] = asyncio.create_task(_run_job(job_id))
+    return True
+
+
+async def resume_import_jobs() -> int:
+    """Restart jobs left queued or running by a previous process, then keep sweeping for orphans."""
+    global _sweeper
+    if not SUPABASE_URL:
+        return 0
+    started = await _resume_active_jobs()
+    if _sweeper is None or _sweeper.done():
+        _sweeper = asyncio.create_task(_sweep_forever())
+    return started
+
+
+async def _resume_active_jobs() -> int:
+    try:
+        jobs = await asyncio.to_thread(table_select, "ehr_import_jobs", {
+            "select": "id",
+            "status": f"in.({','.join(ACTIVE_STATUSES)})",
+            # Unowned, or held by a worker that stopped renewing its lease
+            "or": f"(owner.is.null,lease_expires_at.lt.{datetime.utcnow().isoformat()})",
+            "order": "created_at.asc",
+        })
+    except Exception as e:
+        logger.error(f"Failed to load EHR import jobs: {e}")
+        return 0
+    started = sum(start_job(job["id"]) for job in jobs)
+    if started:
+        logger.info(f"Resuming {started} EHR import jobs")
+    return started
+
+
+async def _sweep_forever():
+    # Pick up jobs whose worker died without releasing the lease
+    while True:
+        await asyncio.sleep(IMPORT_LEASE_SECONDS)
+        await _resume_active_jobs()
+
+
+async def stop_import_jobs():
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.cancel()
+        await asyncio.gather(_sweeper, return_exceptions=True)
+        _sweeper = None
+    job_ids = list(_tasks)
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if job_ids:
+        # Let the next worker to start resume these jobs without waiting for the leases to lapse
+        try:
+            await asyncio.to_thread(table_update, "ehr_import_jobs", {
+                "id": _in_list(job_ids),
+                "owner": f"eq.{WORKER_ID}",
+            }, {"owner": None, "lease_expires_at": None})
+        except Exception as e:
+            logger.warning(f"Could not release EHR import leases: {e}")
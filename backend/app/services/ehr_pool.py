@@ -0,0 +1,102 @@
+"""Process pool for EHR document parsing.
+
+Documents are parsed in worker processes with a per-document timeout so a
+large upload never blocks the event loop. A timed-out parse is reported as
+failed and the pool is recycled: its processes are killed, so a hung parse
+cannot keep holding a slot, and a fresh pool takes new work. Parses that
+were running in the killed pool are retried once on the new one, as are
+parses hit by a worker crashing for any other reason.
+
+Parsed results are cached in the API process by SHA-256 of the file bytes,
+so re-uploading the same record skips the pool entirely.
+"""
+
+import asyncio
+import copy
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.utils.ehr_parser import parse_ehr_docx, parse_ehr_document
+
+logger = logging.getLogger(__name__)
+
+EHR_PARSE_WORKERS = int(os.getenv("EHR_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+EHR_PARSE_TIMEOUT_SECONDS = float(os.getenv("EHR_PARSE_TIMEOUT_SECONDS", "15"))
+EHR_PARSE_CACHE_SIZE = int(os.getenv("EHR_PARSE_CACHE_SIZE", "1024"))
+# "stream" (default) or "docx" to force the python-docx parser
+EHR_PARSER = os.getenv("EHR_PARSER", "stream")
+
+_pool: ProcessPoolExecutor | None = None
+_cache: OrderedDict[str, dict] = OrderedDict()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Return the shared EHR parsing process pool."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=EHR_PARSE_WORKERS)
+    return _pool
+
+
+def _recycle(pool: ProcessPoolExecutor):
+    """Kill a pool's worker processes and stop handing it new work."""
+    global _pool
+    if _pool is pool:
+        _pool = None
+    # The executor has no public way to stop a running task
+    for process in list((pool._processes or {}).values()):
+        process.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _cache_get(key: str) -> dict | None:
+    parsed = _cache.get(key)
+    if parsed is None:
+        return None
+    _cache.move_to_end(key)
+    return copy.deepcopy(parsed)
+
+
+def _cache_put(key: str, parsed: dict):
+    _cache[key] = copy.deepcopy(parsed)
+    _cache.move_to_end(key)
+    while len(_cache) > EHR_PARSE_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+async def parse_in_pool(file_bytes: bytes, timeout: float = EHR_PARSE_TIMEOUT_SECONDS) -> dict:
+    """Parse one .docx in the pool. Raises asyncio.TimeoutError past `timeout`."""
+    key = hashlib.sha256(file_bytes).hexdigest()
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    parser = parse_ehr_docx if EHR_PARSER == "docx" else parse_ehr_document
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        pool = get_pool()
+        try:
+            parsed = await asyncio.wait_for(loop.run_in_executor(pool, parser, file_bytes), timeout)
+            break
+        except asyncio.TimeoutError:
+            logger.warning(f"EHR parse timed out after {timeout}s; recycling the parse pool")
+            _recycle(pool)
+            raise
+        except BrokenProcessPool:
+            # Killed by another document's timeout, or a worker died
+            _recycle(pool)
+            if attempt:
+                raise
+    _cache_put(key, parsed)
+    return parsed
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,499 @@
+"""Append-only clinician feedback log with group commit, rotation and an index.
+
+Entries are appended as JSON lines to the active segment under
+FEEDBACK_LOG_DIR. A single writer task drains a queue of pending entries,
+writes the whole batch and fsyncs once, then acknowledges every caller
+(group commit). So one slow disk flush is shared by all feedback submitted
+meanwhile, and nothing touches the disk on the event loop.
+
+The active segment is rotated once it passes FEEDBACK_SEGMENT_BYTES or
+FEEDBACK_SEGMENT_SECONDS. Sealed segments are gzip-compressed and get a
+small sidecar index (`.idx.json`) of line offsets by patient_id and
+feedback_type, plus per-day counts. On startup only the sidecars and the
+active segment are read. Queries go straight to the matching lines, and
+aggregates come from the counts without rescanning the log.
+
+Segments have a single writer, so each API worker process writes to its own
+`worker-<n>` subdirectory of FEEDBACK_LOG_DIR. On startup a worker takes the
+lowest-numbered subdirectory no other process holds a lock on, so restarts
+reuse the same directories. Queries and daily counts cover every worker:
+this worker's own segments through its in-memory indexes, the others'
+through their sidecars plus a scan of their active segment. The model
+refresh reads every worker's feedback with `log_dirs` and `read_after`.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import defaultdict
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+FEEDBACK_LOG_DIR = os.getenv("FEEDBACK_LOG_DIR", os.path.join(BASE_DIR, "feedback_logs"))
+FEEDBACK_SEGMENT_BYTES = int(os.getenv("FEEDBACK_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+FEEDBACK_SEGMENT_SECONDS = int(os.getenv("FEEDBACK_SEGMENT_SECONDS", str(24 * 3600)))
+FEEDBACK_COMMIT_INTERVAL_MS = int(os.getenv("FEEDBACK_COMMIT_INTERVAL_MS", "20"))
+FEEDBACK_COMMIT_MAX = int(os.getenv("FEEDBACK_COMMIT_MAX", "512"))
+# Pre-existing single-file log written before segments existed; imported once
+LEGACY_LOG_PATH = "feedback_log.json"
+
+INDEXED_FIELDS = ("patient_id", "feedback_type")
+LOCK_NAME = ".writer.lock"
+
+
+def _segment_name(seq: int) -> str:
+    return f"feedback-{seq:06d}.jsonl"
+
+
+def _segment_seqs(directory: str) -> list[int]:
+    return sorted({
+        int(name[len("feedback-"):len("feedback-") + 6])
+        for name in os.listdir(directory)
+        if name.startswith("feedback-") and (name.endswith(".jsonl") or name.endswith(".jsonl.gz"))
+    })
+
+
+def _index_path(directory: str, seq: int) -> str:
+    return os.path.join(directory, f"feedback-{seq:06d}.idx.json")
+
+
+def _open_segment(directory: str, seq: int):
+    try:
+        return open(os.path.join(directory, _segment_name(seq)), "rb")
+    except FileNotFoundError:
+        return gzip.open(os.path.join(directory, _segment_name(seq) + ".gz"), "rb")
+
+
+def _try_lock(f) -> bool:
+    """Take an exclusive, non-blocking lock on an open file; released when the process exits."""
+    try:
+        if os.name == "nt":
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _read_forward(f, offsets: list[int]) -> list[dict]:
+    """Entries at ascending `offsets`; only ever seeks forward, which gzip does cheaply."""
+    entries = []
+    for offset in offsets:
+        f.seek(offset)
+        entries.append(json.loads(f.readline()))
+    return entries
+
+
+class SegmentIndex:
+    """Line offsets by indexed field value, plus counts per day and type."""
+
+    def __init__(self, seq: int):
+        self.seq = seq
+        self.offsets: dict[str, dict[str, list[int]]] = {f: defaultdict(list) for f in INDEXED_FIELDS}
+        self.daily: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.count = 0
+
+    def add(self, entry: dict, offset: int):
+        for field in INDEXED_FIELDS:
+            self.offsets[field][str(entry.get(field))].append(offset)
+        day = str(entry.get("timestamp", ""))[:10]
+        self.daily[day][str(entry.get("feedback_type"))] += 1
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        return {"seq": self.seq, "count": self.count, "offsets": self.offsets, "daily": self.daily}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SegmentIndex":
+        index = cls(data["seq"])
+        for field in INDEXED_FIELDS:
+            index.offsets[field].update(data["offsets"].get(field, {}))
+        for day, counts in data["daily"].items():
+            index.daily[day].update(counts)
+        index.count = data["count"]
+        return index
+
+
+class FeedbackLog:
+    def __init__(self, root: str = FEEDBACK_LOG_DIR):
+        self.root = root
+        self.directory: str | None = None  # this process's worker-<n> subdirectory, set by open()
+        self._lock_file = None
+        self.sealed: list[SegmentIndex] = []
+        self.active: SegmentIndex | None = None
+        self._file = None
+        self._size = 0
+        self._opened_at = 0.0
+        self._pending: asyncio.Queue | None = None
+        self._writer: asyncio.Task | None = None
+        self._lock = threading.Lock()  # guards the indexes against concurrent queries
+        # Other workers' segments: sidecars by path (sealed, so never change)
+        # and each directory's active segment indexed up to a byte offset
+        self._other_sealed: dict[str, SegmentIndex] = {}
+        self._other_active: dict[str, tuple[SegmentIndex, int]] = {}
+        self._other_lock = threading.Lock()
+
+    # --- paths ---
+
+    def _path(self, seq: int, compressed: bool = False) -> str:
+        return os.path.join(self.directory, _segment_name(seq) + (".gz" if compressed else ""))
+
+    def _index_path(self, seq: int) -> str:
+        return _index_path(self.directory, seq)
+
+    # --- startup (blocking) ---
+
+    def _claim_directory(self):
+        """Lock the first worker-<n> subdirectory not held by another process."""
+        n = 0
+        while True:
+            directory = os.path.join(self.root, f"worker-{n}")
+            os.makedirs(directory, exist_ok=True)
+            f = open(os.path.join(directory, LOCK_NAME), "a")
+            if _try_lock(f):
+                self.directory = directory
+                self._lock_file = f
+                return
+            f.close()
+            n += 1
+
+    def open(self):
+        """Claim a directory, load sealed indexes, reindex the active segment and import old logs."""
+        self._claim_directory()
+        seqs = _segment_seqs(self.directory)
+        if not seqs and self.directory.endswith("worker-0") and _segment_seqs(self.root):
+            # Segments written before per-worker directories
+            for name in os.listdir(self.root):
+                if name.startswith("feedback-"):
+                    shutil.move(os.path.join(self.root, name), os.path.join(self.directory, name))
+            seqs = _segment_seqs(self.directory)
+            logger.info(f"Moved {len(seqs)} feedback segments into {self.directory}")
+        for seq in seqs[:-1]:
+            self.sealed.append(self._load_sealed(seq))
+
+        if os.path.exists(LEGACY_LOG_PATH) and not seqs:
+            shutil.move(LEGACY_LOG_PATH, self._path(0))
+            seqs = [0]
+            logger.info(f"Imported legacy {LEGACY_LOG_PATH} as feedback segment 0")
+
+        seq = seqs[-1] if seqs else 1
+        if os.path.exists(self._path(seq, compressed=True)):
+            # Crashed after sealing, before the next segment was opened
+            self.sealed.append(self._load_sealed(seq))
+            seq += 1
+        self._open_active(seq)
+
+    def _load_sealed(self, seq: int) -> SegmentIndex:
+        try:
+            with open(self._index_path(seq)) as f:
+                return SegmentIndex.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            # Missing or damaged sidecar: rebuild it from the segment itself
+            index = self._scan(seq)
+            if not os.path.exists(self._path(seq, compressed=True)):
+                self._compress(seq)
+            self._write_index(index)
+            return index
+
+    def _scan(self, seq: int) -> SegmentIndex:
+        index = SegmentIndex(seq)
+        with _open_segment(self.directory, seq) as f:
+            offset = 0
+            for line in f:
+                try:
+                    index.add(json.loads(line), offset)
+                except ValueError:
+                    pass  # torn last line from a crash mid-write
+                offset += len(line)
+        return index
+
+    def _open_active(self, seq: int):
+        path = self._path(seq)
+        self.active = self._scan(seq) if os.path.exists(path) else SegmentIndex(seq)
+        self._file = open(path, "ab")
+        self._size = self._file.tell()
+        self._opened_at = time.time()
+
+    # --- writing ---
+
+    async def start(self):
+        await asyncio.to_thread(self.open)
+        self._pending = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_forever())
+
+    async def append(self, entry: dict):
+        """Append an entry. Returns once it is durably on disk."""
+        done = asyncio.get_running_loop().create_future()
+        await self._pending.put((entry, done))
+        await done
+
+    async def _write_forever(self):
+        stopping = False
+        while not stopping:
+            first = await self._pending.get()
+            if first is None:
+                return
+            batch = [first]
+            # Let concurrent submissions join this commit
+            deadline = time.monotonic() + FEEDBACK_COMMIT_INTERVAL_MS / 1000
+            while len(batch) < FEEDBACK_COMMIT_MAX:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._pending.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                await asyncio.to_thread(self._commit, [entry for entry, _ in batch])
+            except Exception as e:
+                logger.error(f"Feedback commit failed: {e}")
+                for _, done in batch:
+                    if not done.done():
+                        done.set_exception(e)
+                continue
+            for _, done in batch:
+                if not done.done():
+                    done.set_result(None)
+
+    def _commit(self, entries: list[dict]):
+        if self._size >= FEEDBACK_SEGMENT_BYTES or (
+            self._size and time.time() - self._opened_at >= FEEDBACK_SEGMENT_SECONDS
+        ):
+            self._rotate()
+        lines = [(json.dumps(entry) + "\n").encode() for entry in entries]
+        self._file.write(b"".join(lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        with self._lock:
+            for entry, line in zip(entries, lines):
+                self.active.add(entry, self._size)
+                self._size += len(line)
+
+    def _rotate(self):
+        self._file.close()
+        sealed = self.active
+        self._compress(sealed.seq)
+        self._write_index(sealed)
+        with self._lock:
+            self.sealed.append(sealed)
+            self._open_active(sealed.seq + 1)
+        logger.info(f"Rotated feedback log: sealed segment {sealed.seq} ({sealed.count} entries)")
+
+    def _compress(self, seq: int):
+        src = self._path(seq)
+        tmp = self._path(seq, compressed=True) + ".tmp"
+        with open(src, "rb") as f_in, gzip.open(tmp, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.replace(tmp, self._path(seq, compressed=True))
+        os.remove(src)
+
+    def _write_index(self, index: SegmentIndex):
+        tmp = self._index_path(index.seq) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(index.to_dict(), f)
+        os.replace(tmp, self._index_path(index.seq))
+
+    async def stop(self):
+        """Commit everything already submitted, then close the active segment."""
+        if self._writer is not None:
+            await self._pending.put(None)
+            await self._writer
+            self._writer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    # --- queries (blocking, run in a thread) ---
+
+    def _other_indexes(self, directory: str) -> list[SegmentIndex]:
+        """Indexes of another worker's segments, oldest first."""
+        indexes = []
+        seqs = _segment_seqs(directory)
+        for seq in seqs:
+            path = _index_path(directory, seq)
+            index = self._other_sealed.get(path)
+            if index is None and os.path.exists(path):
+                try:
+                    with open(path) as f:
+                        index = self._other_sealed[path] = SegmentIndex.from_dict(json.load(f))
+                except (OSError, ValueError, KeyError):
+                    index = None  # being rewritten; scan the segment instead
+            if index is None:
+                index = self._scan_other(directory, seq, last=seq == seqs[-1])
+            indexes.append(index)
+        return indexes
+
+    def _scan_other(self, directory: str, seq: int, last: bool) -> SegmentIndex:
+        """Index another worker's segment that has no sidecar, up to its last complete line.
+
+        The active segment is indexed incrementally from where the previous
+        query stopped, since its writer may still be appending to it.
+        """
+        index, start = self._other_active.get(directory, (None, 0))
+        if index is None or index.seq != seq:
+            index, start = SegmentIndex(seq), 0
+        with _open_segment(directory, seq) as f:
+            f.seek(start)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        offset = start
+        for line in complete.splitlines(keepends=True):
+            try:
+                index.add(json.loads(line), offset)
+            except ValueError:
+                pass
+            offset += len(line)
+        if last:
+            self._other_active[directory] = (index, offset)
+        return index
+
+    def _all_indexes(self) -> list[tuple[str, list[SegmentIndex]]]:
+        """(directory, indexes oldest first) for this worker and every other one."""
+        with self._lock:
+            own = [*self.sealed, self.active]
+        directories = [(self.directory, own)]
+        with self._other_lock:
+            for directory in log_dirs(self.root):
+                if directory != self.directory:
+                    directories.append((directory, self._other_indexes(directory)))
+        return directories
+
+    def query(self, patient_id: str | None = None, feedback_type: str | None = None, limit: int = 100) -> list[dict]:
+        """Entries matching the filters across every worker, newest first."""
+        results = []
+        for directory, indexes in self._all_indexes():
+            plan = []
+            with self._lock, self._other_lock:
+                for index in reversed(indexes):
+                    offsets = None
+                    for field, value in (("patient_id", patient_id), ("feedback_type", feedback_type)):
+                        if value is None:
+                            continue
+                        matched = set(index.offsets[field].get(value, ()))
+                        offsets = matched if offsets is None else offsets & matched
+                    if offsets is None:
+                        # No filter: every line in the segment
+                        offsets = {o for values in index.offsets["feedback_type"].values() for o in values}
+                    if offsets:
+                        plan.append((index.seq, sorted(offsets)))
+
+            # This worker's newest `limit`, so the merge below sees every
+            # entry that can make the overall newest `limit`
+            found = []
+            for seq, offsets in plan:
+                # Newest first overall, but read each segment forward: seeking
+                # backwards in a gzip segment decompresses it again from the start
+                with _open_segment(directory, seq) as f:
+                    found.extend(reversed(_read_forward(f, offsets[-(limit - len(found)):])))
+                if len(found) >= limit:
+                    break
+            results.extend(found)
+        results.sort(key=lambda entry: str(entry.get("timestamp", "")), reverse=True)
+        return results[:limit]
+
+    def daily_counts(self, since: str | None = None) -> dict[str, dict[str, int]]:
+        """{date: {feedback_type: count}} across every worker for dates on or after `since` (YYYY-MM-DD)."""
+        totals: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        directories = self._all_indexes()
+        with self._lock, self._other_lock:
+            for _, indexes in directories:
+                for index in indexes:
+                    for day, counts in index.daily.items():
+                        if since is None or day >= since:
+                            for feedback_type, n in counts.items():
+                                totals[day][feedback_type] += n
+        return totals
+
+
+def log_dirs(root: str = FEEDBACK_LOG_DIR) -> list[str]:
+    """Every worker's feedback directory under `root`."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        os.path.join(root, name) for name in os.listdir(root)
+        if name.startswith("worker-") and os.path.isdir(os.path.join(root, name))
+    )
+
+
+def read_after(directory: str, position: tuple[int, int] | None,
+               feedback_type: str | None = None) -> tuple[list[dict], tuple[int, int]]:
+    """Entries in one worker's directory past `position`, oldest first, and the position after them.
+
+    A position is (segment seq, byte offset within the uncompressed segment).
+    Sealed segments are read through their sidecar index; the active one,
+    which another process may be appending to, up to its last complete line.
+    """
+    seq, start = position or (0, 0)
+    entries = []
+    for s in _segment_seqs(directory):
+        if s < seq:
+            continue
+        if s > seq:
+            seq, start = s, 0
+        index_path = _index_path(directory, s)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                index = SegmentIndex.from_dict(json.load(f))
+            values = index.offsets["feedback_type"]
+            groups = [values.get(feedback_type, ())] if feedback_type else values.values()
+            offsets = sorted(o for group in groups for o in group if o >= start)
+            with gzip.open(os.path.join(directory, _segment_name(s) + ".gz"), "rb") as f:
+                entries.extend(_read_forward(f, offsets))
+            seq, start = s + 1, 0
+            continue
+        try:
+            with open(os.path.join(directory, _segment_name(s)), "rb") as f:
+                f.seek(start)
+                data = f.read()
+        except FileNotFoundError:
+            break  # sealed just now; picked up through its index next time
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if feedback_type is None or entry.get("feedback_type") == feedback_type:
+                entries.append(entry)
+        start += len(complete)
+    return entries, (seq, start)
+
+
+_log: FeedbackLog | None = None
+
+
+def get_feedback_log() -> FeedbackLog:
+    """Return the process-wide feedback log."""
+    global _log
+    if _log is None:
+        _log = FeedbackLog()
+    return _log
+
+
+async def start_feedback_log():
+    await get_feedback_log().start()
+
+
+async def stop_feedback_log():
+    if _log is not None:
+        await _log.stop()
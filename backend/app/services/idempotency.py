@@ -0,0 +1,215 @@
+"""Idempotency keys: replay the stored response for a retried request.
+
+A client sends `Idempotency-Key: <uuid>` with a POST. The first request with
+a key runs normally and its response is stored, both in a bounded in-memory
+LRU and in the `idempotency_keys` table (db_schema_idempotency.sql). A retry
+with the same key and body inside IDEMPOTENCY_TTL_SECONDS gets that response
+back without running the handler again. The same key with a different body
+is rejected with 422.
+
+Duplicates that arrive while the original is still running wait for it
+rather than racing it. On this worker they await the original's future.
+Across workers, the first request claims the key by inserting its row;
+the others find the claim and poll until the response is stored.
+
+If the original fails, its claim is released so a retry can run again. A
+response is only stored when the handler reports it as final.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import httpx
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+from app.db.supabase_client import SUPABASE_URL, table_insert, table_select_one, table_update
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# How long a duplicate waits for an original running on another worker
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+POLL_SECONDS = 0.2
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStore:
+    def __init__(self):
+        self._responses: OrderedDict[str, tuple[float, str, dict]] = OrderedDict()  # key -> (stored at, hash, body)
+        self._inflight: dict[str, tuple[str, asyncio.Future]] = {}
+
+    # --- memory ---
+
+    def _cached(self, key: str) -> tuple[str, dict] | None:
+        entry = self._responses.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > IDEMPOTENCY_TTL_SECONDS:
+            del self._responses[key]
+            return None
+        self._responses.move_to_end(key)
+        return entry[1], entry[2]
+
+    def _remember(self, key: str, request_hash: str, body: dict):
+        self._responses[key] = (time.time(), request_hash, body)
+        self._responses.move_to_end(key)
+        while len(self._responses) > IDEMPOTENCY_CACHE_SIZE:
+            self._responses.popitem(last=False)
+
+    # --- database (blocking) ---
+
+    def _claim(self, key: str, request_hash: str) -> dict | None:
+        """Claim the key. Returns None if we own it now, else the existing row."""
+        try:
+            table_insert("idempotency_keys", {"key": key, "request_hash": request_hash, "status": "processing"})
+            return None
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 409:
+                raise
+        # Taken: reclaim it if the previous use has expired
+        cutoff = (datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)).isoformat()
+        rows = table_update(
+            "idempotency_keys",
+            {"key": f"eq.{key}", "created_at": f"lt.{cutoff}"},
+            {"request_hash": request_hash, "status": "processing", "response": None,
+             "created_at": datetime.utcnow().isoformat(), "completed_at": None},
+        )
+        if rows:
+            return None
+        return table_select_one("idempotency_keys", {"key": f"eq.{key}"})
+
+    def _complete(self, key: str, body: dict):
+        table_update(
+            "idempotency_keys",
+            {"key": f"eq.{key}"},
+            {"status": "completed", "response": body, "completed_at": datetime.utcnow().isoformat()},
+        )
+
+    def _release(self, key: str):
+        # Leave it expired rather than deleting, so the next claim takes it over
+        table_update(
+            "idempotency_keys",
+            {"key": f"eq.{key}", "status": "eq.processing"},
+            {"status": "failed", "created_at": datetime(1970, 1, 1).isoformat()},
+        )
+
+    # --- flow ---
+
+    async def run(self, key: str, payload, handler) -> tuple[dict, bool]:
+        """Run `handler` once per key. Returns (response body, replayed).
+
+        `handler` is an async callable returning (response, final); only final
+        responses are stored for replay.
+        """
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key too long")
+        request_hash = hashlib.sha256(
+            json.dumps(jsonable_encoder(payload), sort_keys=True).encode()
+        ).hexdigest()
+
+        cached = self._cached(key)
+        if cached is not None:
+            return self._replay(cached, request_hash), True
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            if inflight[0] != request_hash:
+                raise _mismatch()
+            return await asyncio.shield(inflight[1]), True
+
+        done = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (request_hash, done)
+        try:
+            body, replayed = await self._run_claimed(key, request_hash, handler)
+            done.set_result(body)
+            return body, replayed
+        except asyncio.CancelledError:
+            done.cancel()
+            raise
+        except Exception as e:
+            done.set_exception(e)
+            done.exception()  # mark retrieved when no duplicate was waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _run_claimed(self, key: str, request_hash: str, handler) -> tuple[dict, bool]:
+        use_db = bool(SUPABASE_URL)
+        if use_db:
+            try:
+                existing = await asyncio.to_thread(self._claim, key, request_hash)
+            except Exception as e:
+                logger.warning(f"Idempotency store unavailable, deduplicating on this worker only: {e}")
+                use_db = False
+                existing = None
+            if existing is not None:
+                return await self._await_other_worker(key, request_hash, existing), True
+
+        try:
+            response, final = await handler()
+        except BaseException:
+            if use_db:
+                await asyncio.to_thread(_quietly, self._release, key)
+            raise
+        body = jsonable_encoder(response)
+        if final:
+            self._remember(key, request_hash, body)
+            if use_db:
+                await asyncio.to_thread(_quietly, self._complete, key, body)
+        elif use_db:
+            await asyncio.to_thread(_quietly, self._release, key)
+        return body, False
+
+    async def _await_other_worker(self, key: str, request_hash: str, row: dict) -> dict:
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            if row["request_hash"] != request_hash:
+                raise _mismatch()
+            if row["status"] == "completed":
+                self._remember(key, request_hash, row["response"])
+                return row["response"]
+            if row["status"] != "processing" or time.monotonic() > deadline:
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is still being processed or failed; retry later",
+                )
+            await asyncio.sleep(POLL_SECONDS)
+            row = await asyncio.to_thread(table_select_one, "idempotency_keys", {"key": f"eq.{key}"})
+            if row is None:
+                raise HTTPException(status_code=409, detail="Idempotency-Key was released; retry")
+
+    def _replay(self, cached: tuple[str, dict], request_hash: str) -> dict:
+        stored_hash, body = cached
+        if stored_hash != request_hash:
+            raise _mismatch()
+        return body
+
+
+def _mismatch() -> HTTPException:
+    return HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+
+
+def _quietly(fn, *args):
+    try:
+        fn(*args)
+    except Exception as e:
+        logger.error(f"Idempotency store update failed: {e}")
+
+
+_store: IdempotencyStore | None = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Return the process-wide idempotency store."""
+    global _store
+    if _store is None:
+        _store = IdempotencyStore()
+    return _store
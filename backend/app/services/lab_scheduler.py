@@ -0,0 +1,324 @@
+"""Capacity-aware lab slot scheduler backed by `lab_bookings`.
+
+Each lab has a calendar of fixed-length slots (`slot_minutes`) that hold up
+to `capacity_per_slot` patients. Bookings counts are kept in memory per slot,
+together with two "next free slot" pointers:
+
+- `next_urgent`: earliest slot with any seat left (used by high-risk patients)
+- `next_routine`: earliest slot a routine booking may take. Within the next
+  URGENT_HORIZON_MINUTES one seat per slot is held back for high-risk patients.
+
+Every slot between now and a pointer is known to be full, so the pointers
+only move forward as slots fill and jump back when a booking is cancelled.
+Availability is therefore answered in O(1) and booking is amortised O(1).
+
+Each API worker holds its own calendars, loaded on startup from pending
+bookings (see db_schema_lab_scheduling.sql) and resynced every
+LAB_SCHEDULER_RESYNC_SECONDS. The calendars only choose slots: bookings are
+created by `book_lab_slots()` (db_schema_lab_capacity.sql), which gives
+each booking a numbered seat of its slot, so the database never lets a slot
+take more than its capacity, whatever each worker's calendars say.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from app.db.supabase_client import SUPABASE_URL, table_select
+
+logger = logging.getLogger(__name__)
+
+LAB_SCHEDULER_RESYNC_SECONDS = int(os.getenv("LAB_SCHEDULER_RESYNC_SECONDS", "60"))
+
+DEFAULT_SLOT_MINUTES = 15
+DEFAULT_CAPACITY_PER_SLOT = 2
+URGENT_HORIZON_MINUTES = int(os.getenv("LAB_URGENT_HORIZON_MINUTES", "60"))
+
+RISK_ORDER = {"high": 0, "medium": 1, "low": 2}
+
+EPOCH = datetime(1970, 1, 1)
+
+_task: asyncio.Task | None = None
+
+
+class LabUnavailable(Exception):
+    """The lab is switched off or unknown."""
+
+
+class LabNotFound(LabUnavailable):
+    """No lab with this id."""
+
+
+def _parse_ts(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+class LabCalendar:
+    def __init__(self, lab: dict, now: datetime | None = None):
+        self.lab = lab
+        self.slot_minutes = lab.get("slot_minutes") or DEFAULT_SLOT_MINUTES
+        self.capacity = lab.get("capacity_per_slot") or DEFAULT_CAPACITY_PER_SLOT
+        self.reserve = 1 if self.capacity > 1 else 0
+        self.horizon_slots = -(-URGENT_HORIZON_MINUTES // self.slot_minutes)
+        self.counts: dict[int, int] = {}
+        self.now_slot = self.slot_of(now or datetime.utcnow())
+        self.next_urgent = self.now_slot
+        self.next_routine = self.now_slot
+
+    # --- slot arithmetic ---
+
+    def slot_of(self, when: datetime) -> int:
+        return int((when - EPOCH).total_seconds() // (self.slot_minutes * 60))
+
+    def slot_start(self, slot: int) -> datetime:
+        return EPOCH + timedelta(minutes=slot * self.slot_minutes)
+
+    def limit(self, slot: int, urgent: bool) -> int:
+        """Seats a booking of this urgency may fill in `slot`."""
+        if urgent or slot >= self.now_slot + self.horizon_slots:
+            return self.capacity
+        return self.capacity - self.reserve
+
+    # --- pointer maintenance ---
+
+    def sync(self, now: datetime | None = None):
+        """Move the calendar to the current slot, dropping past slots."""
+        slot = self.slot_of(now or datetime.utcnow())
+        if slot <= self.now_slot:
+            return
+        if slot - self.now_slot > len(self.counts):
+            self.counts = {s: n for s, n in self.counts.items() if s >= slot}
+        else:
+            for past in range(self.now_slot, slot):
+                self.counts.pop(past, None)
+        self.now_slot = slot
+        self.next_urgent = self._advance(max(self.next_urgent, slot), urgent=True)
+        self.next_routine = self._advance(max(self.next_routine, slot), urgent=False)
+
+    def _advance(self, slot: int, urgent: bool) -> int:
+        while self.counts.get(slot, 0) >= self.limit(slot, urgent):
+            slot += 1
+        return slot
+
+    def earliest(self, urgent: bool, not_before: int | None = None, busy: list | None = None) -> int:
+        """Earliest slot with room, at or after `not_before`, clear of `busy` intervals."""
+        slot = self.next_urgent if urgent else self.next_routine
+        if not_before is not None and not_before > slot:
+            slot = self._advance(not_before, urgent)
+        while busy and self._overlaps(slot, busy):
+            slot = self._advance(slot + 1, urgent)
+        return slot
+
+    def _overlaps(self, slot: int, busy: list) -> bool:
+        start = self.slot_start(slot)
+        end = start + timedelta(minutes=self.slot_minutes)
+        return any(start < b_end and b_start < end for b_start, b_end in busy)
+
+    def book(self, slot: int):
+        self.counts[slot] = self.counts.get(slot, 0) + 1
+        if slot == self.next_urgent:
+            self.next_urgent = self._advance(slot, urgent=True)
+        if slot == self.next_routine:
+            self.next_routine = self._advance(slot, urgent=False)
+
+    def release(self, slot: int):
+        if slot not in self.counts:
+            return
+        self.counts[slot] -= 1
+        if not self.counts[slot]:
+            del self.counts[slot]
+        if slot >= self.now_slot:
+            self.next_urgent = min(self.next_urgent, slot)
+            if self.counts.get(slot, 0) < self.limit(slot, urgent=False):
+                self.next_routine = min(self.next_routine, slot)
+
+    def availability(self) -> dict:
+        return {
+            "lab_id": self.lab["id"],
+            "slot_minutes": self.slot_minutes,
+            "capacity_per_slot": self.capacity,
+            "next_urgent_slot": self.slot_start(self.next_urgent).isoformat(),
+            "next_routine_slot": self.slot_start(self.next_routine).isoformat(),
+            "free_now": max(self.capacity - self.counts.get(self.now_slot, 0), 0),
+        }
+
+
+class LabScheduler:
+    def __init__(self):
+        self._calendars: dict[str, LabCalendar] = {}
+        self._bookings: dict[str, tuple[str, int, str]] = {}  # booking_id -> (lab_id, slot, patient_id)
+        self._busy: dict[str, dict[str, tuple]] = {}          # patient_id -> booking_id -> (start, end)
+        self._lock = threading.Lock()
+
+    def load(self, labs: list[dict], bookings: list[dict]):
+        """Replace calendars with the labs table and pending future bookings."""
+        with self._lock:
+            self._calendars = {lab["id"]: LabCalendar(lab) for lab in labs}
+            self._bookings.clear()
+            self._busy.clear()
+            for b in bookings:
+                calendar = self._calendars.get(b.get("lab_id"))
+                if calendar is None or not b.get("scheduled_at"):
+                    continue
+                slot = calendar.slot_of(_parse_ts(b["scheduled_at"]))
+                if slot < calendar.now_slot:
+                    continue
+                calendar.book(slot)
+                self._track(b["id"], calendar, slot, b["patient_id"])
+
+    def _track(self, booking_id: str, calendar: LabCalendar, slot: int, patient_id: str):
+        start = calendar.slot_start(slot)
+        self._bookings[booking_id] = (calendar.lab["id"], slot, patient_id)
+        self._busy.setdefault(patient_id, {})[booking_id] = (start, start + timedelta(minutes=calendar.slot_minutes))
+
+    def _calendar(self, lab_id: str) -> LabCalendar:
+        calendar = self._calendars.get(lab_id)
+        if calendar is None:
+            raise LabNotFound(f"Lab {lab_id} not found")
+        if calendar.lab.get("is_available") is False:
+            raise LabUnavailable(f"Lab {lab_id} is not available")
+        calendar.sync()
+        return calendar
+
+    # --- queries ---
+
+    def labs(self) -> list[dict]:
+        with self._lock:
+            rows = []
+            for calendar in self._calendars.values():
+                calendar.sync()
+                rows.append({**calendar.lab, **calendar.availability()})
+            return sorted(rows, key=lambda r: r.get("name") or "")
+
+    def availability(self, lab_id: str) -> dict:
+        with self._lock:
+            return self._calendar(lab_id).availability()
+
+    # --- reservations ---
+
+    def reserve(self, orders: list[dict]) -> list[dict]:
+        """Hold the earliest feasible slots for a batch of lab panels.
+
+        Each order is {patient_id, risk_level, lab_ids}. Orders are served
+        highest risk first; a patient's own bookings never overlap. Returns
+        one reservation per (patient, lab), to be persisted and then passed
+        to `confirm` (or `cancel` if persistence fails).
+        """
+        ranked = sorted(orders, key=lambda o: RISK_ORDER.get(o.get("risk_level"), 3))
+        reservations = []
+        with self._lock:
+            try:
+                for order in ranked:
+                    urgent = order.get("risk_level") == "high"
+                    busy = [iv for iv in self._busy.get(order["patient_id"], {}).values()]
+                    calendars = [self._calendar(lab_id) for lab_id in dict.fromkeys(order["lab_ids"])]
+                    # Book the most contended labs first so the others fit around them
+                    calendars.sort(key=lambda c: c.earliest(urgent), reverse=True)
+                    for calendar in calendars:
+                        slot = calendar.earliest(urgent, busy=busy)
+                        calendar.book(slot)
+                        start = calendar.slot_start(slot)
+                        busy.append((start, start + timedelta(minutes=calendar.slot_minutes)))
+                        reservations.append({
+                            "lab_id": calendar.lab["id"],
+                            "patient_id": order["patient_id"],
+                            "risk_level": order.get("risk_level") or "low",
+                            "slot": slot,
+                            "scheduled_at": start.isoformat(),
+                        })
+            except Exception:
+                for r in reservations:
+                    self._calendars[r["lab_id"]].release(r["slot"])
+                raise
+        return reservations
+
+    def confirm(self, reservation: dict, booking_id: str):
+        """Attach a persisted booking id to a reservation."""
+        with self._lock:
+            calendar = self._calendars[reservation["lab_id"]]
+            self._track(booking_id, calendar, reservation["slot"], reservation["patient_id"])
+
+    def cancel(self, reservations: list[dict]):
+        """Give back slots held by reservations that were never persisted."""
+        with self._lock:
+            for r in reservations:
+                self._calendars[r["lab_id"]].release(r["slot"])
+
+    def release_booking(self, booking_id: str) -> bool:
+        """Free the slot of a cancelled booking. Returns False if unknown."""
+        with self._lock:
+            entry = self._bookings.pop(booking_id, None)
+            if entry is None:
+                return False
+            lab_id, slot, patient_id = entry
+            self._busy.get(patient_id, {}).pop(booking_id, None)
+            calendar = self._calendars.get(lab_id)
+            if calendar is not None:
+                calendar.release(slot)
+            return True
+
+    def forget_booking(self, booking_id: str):
+        """Stop tracking a completed booking without freeing its slot."""
+        with self._lock:
+            entry = self._bookings.pop(booking_id, None)
+            if entry is not None:
+                self._busy.get(entry[2], {}).pop(booking_id, None)
+
+
+_scheduler: LabScheduler | None = None
+
+
+def get_lab_scheduler() -> LabScheduler:
+    """Return the process-wide lab scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LabScheduler()
+    return _scheduler
+
+
+def load_lab_scheduler() -> int:
+    """Load labs and upcoming pending bookings. Returns the number of labs."""
+    labs = table_select("labs", {"order": "name.asc"})
+    bookings = table_select("lab_bookings", {
+        "select": "id,lab_id,patient_id,scheduled_at",
+        "status": "eq.pending",
+        "scheduled_at": f"gte.{datetime.utcnow().isoformat()}",
+    })
+    get_lab_scheduler().load(labs, bookings)
+    logger.info(f"Loaded {len(labs)} lab calendars with {len(bookings)} upcoming bookings")
+    return len(labs)
+
+
+# --- Resync loop ---
+
+async def _resync_forever():
+    while True:
+        await asyncio.sleep(LAB_SCHEDULER_RESYNC_SECONDS)
+        try:
+            await asyncio.to_thread(load_lab_scheduler)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Lab scheduler resync failed: {e}")
+
+
+def start_lab_scheduler_resync():
+    """Periodically reload lab calendars (no-op without Supabase)."""
+    global _task
+    if not SUPABASE_URL:
+        return
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_resync_forever())
+
+
+async def stop_lab_scheduler_resync():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,324 @@
+"""Incremental triage model refresh from clinician feedback.
+
+`incorrect_priority` feedback that names a `corrected_priority` becomes a
+labelled training sample: the vitals of the patient's intake at the time of
+the correction with the corrected triage level. Once MODEL_REFRESH_MIN_SAMPLES new corrections have come in,
+the current XGBoost model is warm-started with MODEL_REFRESH_ROUNDS extra
+boosting rounds. Training data is the corrections (weighted up) plus a replay
+slice of the original training set, so the model does not drift away from it.
+
+The candidate is scored on the held-out set saved by training/train_triage.py.
+It is published only if accuracy and log-loss stay within
+MODEL_REFRESH_TOLERANCE of both the current model and the originally trained
+one (saved with the held-out set), so small regressions cannot compound over
+a run of refreshes. Each refresh adds trees, so once the model would pass
+MODEL_REFRESH_MAX_TREES refreshes stop until the model is retrained.
+Publishing atomically replaces
+saved_models/triage_model.joblib (the previous model is kept as
+triage_model.prev.joblib), and every worker's `triage_model.get_model`
+picks it up on its next reload check.
+
+Corrections are read from every worker's feedback log (see
+app/services/feedback_log.py). The refresh state keeps a read position per
+worker log, so a refresh only reads feedback logged since the last one, and
+no worker's corrections are skipped whichever worker runs the refresh.
+
+`wrong_diagnosis` feedback carries no corrected label, so it is not used.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+from sklearn.metrics import accuracy_score, log_loss
+from xgboost import XGBClassifier
+
+from app.db.supabase_client import SUPABASE_URL, table_select
+from app.models import triage_model
+from app.services.feedback_log import log_dirs, read_after
+from app.utils.feature_engineering import prepare_triage_features
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.path.dirname(triage_model.MODEL_PATH)
+REFRESH_DATA_PATH = os.path.join(MODEL_DIR, "triage_refresh_data.npz")
+STATE_PATH = os.path.join(MODEL_DIR, "triage_refresh_state.json")
+LOCK_PATH = os.path.join(MODEL_DIR, ".triage_refresh.lock")
+PREVIOUS_MODEL_PATH = os.path.join(MODEL_DIR, "triage_model.prev.joblib")
+
+MODEL_REFRESH_INTERVAL_SECONDS = int(os.getenv("MODEL_REFRESH_INTERVAL_SECONDS", "300"))
+MODEL_REFRESH_MIN_SAMPLES = int(os.getenv("MODEL_REFRESH_MIN_SAMPLES", "20"))
+MODEL_REFRESH_ROUNDS = int(os.getenv("MODEL_REFRESH_ROUNDS", "20"))
+MODEL_REFRESH_TOLERANCE = float(os.getenv("MODEL_REFRESH_TOLERANCE", "0.005"))
+MODEL_REFRESH_MAX_TREES = int(os.getenv("MODEL_REFRESH_MAX_TREES", "500"))
+FEEDBACK_SAMPLE_WEIGHT = float(os.getenv("FEEDBACK_SAMPLE_WEIGHT", "5"))
+LOCK_STALE_SECONDS = 3600
+
+CORRECTED_LEVELS = {"low": 0, "medium": 1, "high": 2, "critical": 3, "0": 0, "1": 1, "2": 2, "3": 3}
+
+_task: asyncio.Task | None = None
+_last_result: dict | None = None
+
+
+# --- state ---
+
+def load_state() -> dict:
+    try:
+        with open(STATE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"last_feedback_ts": "", "feedback_positions": {}, "version": 0, "history": []}
+
+
+def _save_state(state: dict):
+    tmp = STATE_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, STATE_PATH)
+
+
+def _acquire_lock() -> bool:
+    """Cross-process lock so only one worker refreshes at a time."""
+    try:
+        fd = os.open(LOCK_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        if time.time() - os.path.getmtime(LOCK_PATH) < LOCK_STALE_SECONDS:
+            return False
+        os.remove(LOCK_PATH)
+        return _acquire_lock()
+    os.write(fd, str(os.getpid()).encode())
+    os.close(fd)
+    return True
+
+
+def _release_lock():
+    try:
+        os.remove(LOCK_PATH)
+    except FileNotFoundError:
+        pass
+
+
+# --- samples ---
+
+def pending_corrections(state: dict) -> tuple[list[dict], dict]:
+    """Priority corrections logged since the state's positions, oldest first, and the new positions."""
+    positions = state.get("feedback_positions") or {}
+    # State from before per-worker positions: fall back to the timestamp watermark once
+    since = "" if positions else state.get("last_feedback_ts", "")
+    corrections, after = [], {}
+    for directory in log_dirs():
+        source = os.path.basename(directory)
+        entries, position = read_after(directory, positions.get(source), "incorrect_priority")
+        after[source] = list(position)
+        corrections.extend(
+            e for e in entries
+            if e.get("timestamp", "") > since
+            and str(e.get("corrected_priority") or "").strip().lower() in CORRECTED_LEVELS
+        )
+    return sorted(corrections, key=lambda e: e["timestamp"]), after
+
+
+def _in_list(values) -> str:
+    return f"in.({','.join(values)})"
+
+
+def _intake_at(intakes: list[dict], timestamp: str) -> dict | None:
+    """The intake the patient's triage stood on at `timestamp`; `intakes` newest first.
+
+    A re-triage adds an intake, so the latest one may postdate the
+    correction. If every intake looks newer (clock skew between the app and
+    the database), the first one is the closest guess.
+    """
+    at = datetime.fromisoformat(timestamp)
+    for intake in intakes:
+        if datetime.fromisoformat(intake["created_at"]) <= at:
+            return intake
+    return intakes[-1] if intakes else None
+
+
+def build_samples(corrections: list[dict]) -> tuple[np.ndarray, np.ndarray]:
+    """Feature rows (from the intake current when each correction was given) and corrected levels."""
+    codes = list({c["patient_id"] for c in corrections})
+    patients = {}
+    for start in range(0, len(codes), 100):
+        for row in table_select("patients", {
+            "select": "id,patient_code,age",
+            "patient_code": _in_list(codes[start:start + 100]),
+        }):
+            patients[row["patient_code"]] = row
+
+    intakes: dict[str, list[dict]] = {}
+    ids = [p["id"] for p in patients.values()]
+    for start in range(0, len(ids), 100):
+        for row in table_select("patient_intakes", {
+            "patient_id": _in_list(ids[start:start + 100]),
+            "order": "created_at.desc",
+        }):
+            intakes.setdefault(row["patient_id"], []).append(row)
+
+    X, y = [], []
+    for c in corrections:
+        patient = patients.get(c["patient_id"])
+        intake = _intake_at(intakes.get(patient["id"], []), c["timestamp"]) if patient else None
+        if intake is None:
+            continue
+        X.append(prepare_triage_features(
+            age=patient["age"],
+            heart_rate=intake.get("heart_rate"),
+            systolic_bp=intake.get("blood_pressure_systolic"),
+            oxygen_saturation=intake.get("oxygen_saturation"),
+            temperature_f=intake.get("temperature"),
+            chronic_disease_count=len([x for x in intake.get("conditions") or [] if x.lower() != "none"]),
+        )[0])
+        y.append(CORRECTED_LEVELS[str(c["corrected_priority"]).strip().lower()])
+    return np.array(X).reshape(-1, 6), np.array(y, dtype=int)
+
+
+# --- refresh ---
+
+def _score(model, X: np.ndarray, y: np.ndarray) -> dict:
+    proba = model.predict_proba(X)
+    return {
+        "accuracy": round(float(accuracy_score(y, proba.argmax(axis=1))), 4),
+        "log_loss": round(float(log_loss(y, proba, labels=list(range(proba.shape[1])))), 4),
+    }
+
+
+def _regressed(after: dict, reference: dict) -> bool:
+    return (
+        after["accuracy"] < reference["accuracy"] - MODEL_REFRESH_TOLERANCE
+        or after["log_loss"] > reference["log_loss"] + MODEL_REFRESH_TOLERANCE
+    )
+
+
+def _baseline(data, state: dict, current) -> dict:
+    """Holdout score of the originally trained model."""
+    if "baseline_accuracy" in data:
+        return {
+            "accuracy": round(float(data["baseline_accuracy"]), 4),
+            "log_loss": round(float(data["baseline_log_loss"]), 4),
+        }
+    # Refresh data saved before training recorded it: the first model refreshed from stands in
+    if "baseline" not in state:
+        state["baseline"] = _score(current, data["X_holdout"], data["y_holdout"])
+    return state["baseline"]
+
+
+def refresh_triage_model(force: bool = False) -> dict:
+    """Warm-start the triage model on new corrections; publish if it validates.
+
+    Returns a summary with status "skipped", "busy", "rejected" or "published".
+    """
+    global _last_result
+    if not _acquire_lock():
+        return {"status": "busy"}
+    try:
+        state = load_state()
+        corrections, positions = pending_corrections(state)
+        if len(corrections) < (1 if force else MODEL_REFRESH_MIN_SAMPLES):
+            return {"status": "skipped", "pending_corrections": len(corrections)}
+        if not os.path.exists(REFRESH_DATA_PATH):
+            return {"status": "skipped", "reason": "no refresh data; rerun training/train_triage.py"}
+
+        X_fb, y_fb = build_samples(corrections)
+        if not len(y_fb):
+            # Corrections for patients we no longer have intakes for
+            state["last_feedback_ts"] = corrections[-1]["timestamp"]
+            state["feedback_positions"] = positions
+            _save_state(state)
+            return {"status": "skipped", "reason": "no intake data for corrected patients"}
+        current = joblib.load(triage_model.MODEL_PATH)
+        trees = current.get_booster().num_boosted_rounds()
+        if trees + MODEL_REFRESH_ROUNDS > MODEL_REFRESH_MAX_TREES:
+            # Corrections stay pending for the model that replaces this one
+            logger.warning(f"Triage model has {trees} trees; retrain it to resume refreshes")
+            return {"status": "skipped", "reason": f"model has {trees} trees; rerun training/train_triage.py"}
+
+        data = np.load(REFRESH_DATA_PATH)
+        X_train = np.vstack([data["X_replay"], X_fb])
+        y_train = np.concatenate([data["y_replay"], y_fb])
+        weights = np.concatenate([np.ones(len(data["y_replay"])), np.full(len(y_fb), FEEDBACK_SAMPLE_WEIGHT)])
+
+        started = time.perf_counter()
+        candidate = XGBClassifier(**{**current.get_params(), "n_estimators": MODEL_REFRESH_ROUNDS})
+        candidate.fit(X_train, y_train, sample_weight=weights, xgb_model=current.get_booster())
+
+        baseline = _baseline(data, state, current)
+        before = _score(current, data["X_holdout"], data["y_holdout"])
+        after = _score(candidate, data["X_holdout"], data["y_holdout"])
+        regressed = _regressed(after, before) or _regressed(after, baseline)
+        before["feedback_accuracy"] = _score(current, X_fb, y_fb)["accuracy"]
+        after["feedback_accuracy"] = _score(candidate, X_fb, y_fb)["accuracy"]
+
+        result = {
+            "status": "rejected" if regressed else "published",
+            "corrections": len(corrections),
+            "samples": int(len(y_fb)),
+            "trees": trees + (0 if regressed else MODEL_REFRESH_ROUNDS),
+            "baseline": baseline,
+            "before": before,
+            "after": after,
+            "train_seconds": round(time.perf_counter() - started, 2),
+            "finished_at": datetime.now().isoformat(),
+        }
+        if not regressed:
+            tmp = triage_model.MODEL_PATH + ".tmp"
+            joblib.dump(candidate, tmp)
+            joblib.dump(current, PREVIOUS_MODEL_PATH)
+            os.replace(tmp, triage_model.MODEL_PATH)
+            state["version"] += 1
+            result["version"] = state["version"]
+            logger.info(f"Published triage model v{state['version']}: {before} -> {after}")
+        else:
+            logger.warning(f"Rejected refreshed triage model: {before} -> {after}")
+
+        # Either way these corrections have been considered
+        state["last_feedback_ts"] = corrections[-1]["timestamp"]
+        state["feedback_positions"] = positions
+        state["history"] = (state["history"] + [result])[-20:]
+        _save_state(state)
+        _last_result = result
+        return result
+    finally:
+        _release_lock()
+
+
+def refresh_status() -> dict:
+    state = load_state()
+    return {
+        "version": state["version"],
+        "last_feedback_ts": state["last_feedback_ts"],
+        "pending_corrections": len(pending_corrections(state)[0]),
+        "min_samples": MODEL_REFRESH_MIN_SAMPLES,
+        "last_result": _last_result or (state["history"][-1] if state["history"] else None),
+    }
+
+
+async def _run_forever():
+    while True:
+        await asyncio.sleep(MODEL_REFRESH_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(refresh_triage_model)
+        except Exception as e:
+            logger.error(f"Triage model refresh failed: {e}")
+
+
+def start_model_refresh():
+    global _task
+    if not SUPABASE_URL or MODEL_REFRESH_INTERVAL_SECONDS <= 0:
+        return
+    if _task is None:
+        _task = asyncio.create_task(_run_forever())
+
+
+async def stop_model_refresh():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
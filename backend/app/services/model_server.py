@@ -0,0 +1,191 @@
+"""Shared inference server for the triage and disease models.
+
+Loads each model once per host instead of once per API worker and serves
+every worker over a Unix socket (wire format in app/utils/model_client.py).
+Requests for the same model are batched across all connections: while one
+batch is being predicted, new requests queue up and go into the next model
+call together. So batches grow with load and add no latency when idle.
+MODEL_SERVER_BATCH_WAIT_MS can hold a batch open a little longer to trade
+latency for throughput.
+
+Run it next to the API, then point the workers at it:
+
+    python -m app.services.model_server
+    MODEL_SERVER_SOCKET=/tmp/medtriage-models.sock uvicorn app.main:app --workers 4
+
+Published triage model refreshes are picked up through
+`triage_model.get_model`, just as they are in-process.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import numpy as np
+
+from app.models import disease_model, triage_model
+from app.utils.model_client import (
+    MODEL_DISEASE, MODEL_TRIAGE, REQUEST_HEADER, RESPONSE_HEADER, STATUS_ERROR, STATUS_OK,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = "/tmp/medtriage-models.sock"
+MODEL_SERVER_MAX_BATCH = int(os.getenv("MODEL_SERVER_MAX_BATCH", "256"))
+MODEL_SERVER_BATCH_WAIT_MS = float(os.getenv("MODEL_SERVER_BATCH_WAIT_MS", "0"))
+STATS_LOG_SECONDS = 60
+
+
+class Batcher:
+    """Coalesces concurrent requests for one model into single predict calls."""
+
+    def __init__(self, name: str, predict_fn, n_features_fn):
+        self.name = name
+        self.predict_fn = predict_fn
+        self.n_features_fn = n_features_fn
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.calls = 0
+        self.rows = 0
+
+    async def submit(self, features: np.ndarray) -> tuple[np.ndarray, ...]:
+        expected = self.n_features_fn()
+        if features.shape[1] != expected:
+            raise ValueError(f"{self.name} model expects {expected} features, got {features.shape[1]}")
+        done = asyncio.get_running_loop().create_future()
+        await self.queue.put((features, done))
+        return await done
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            rows = len(batch[0][0])
+            if MODEL_SERVER_BATCH_WAIT_MS > 0:
+                deadline = time.monotonic() + MODEL_SERVER_BATCH_WAIT_MS / 1000
+                while rows < MODEL_SERVER_MAX_BATCH and (timeout := deadline - time.monotonic()) > 0:
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    batch.append(item)
+                    rows += len(item[0])
+            while rows < MODEL_SERVER_MAX_BATCH and not self.queue.empty():
+                item = self.queue.get_nowait()
+                batch.append(item)
+                rows += len(item[0])
+
+            try:
+                outputs = await asyncio.to_thread(self.predict_fn, np.vstack([features for features, _ in batch]))
+            except Exception as e:
+                for _, done in batch:
+                    if not done.done():
+                        done.set_exception(e)
+                continue
+            self.calls += 1
+            self.rows += rows
+
+            start = 0
+            for features, done in batch:
+                end = start + len(features)
+                if not done.done():
+                    done.set_result(tuple(output[start:end] for output in outputs))
+                start = end
+
+
+class ModelServer:
+    def __init__(self, path: str):
+        self.path = path
+        self.batchers = {
+            MODEL_TRIAGE: Batcher(
+                "triage", triage_model.predict_local,
+                lambda: triage_model.get_model().n_features_in_,
+            ),
+            MODEL_DISEASE: Batcher(
+                "disease", disease_model.predict_local,
+                lambda: len(disease_model.get_symptom_columns()),
+            ),
+        }
+
+    async def serve(self):
+        # Load both models before accepting connections
+        await asyncio.to_thread(triage_model.get_model)
+        await asyncio.to_thread(disease_model.get_model)
+
+        if os.path.exists(self.path):
+            os.remove(self.path)  # stale socket from a previous run
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o660)
+        tasks = [asyncio.create_task(b.run()) for b in self.batchers.values()]
+        tasks.append(asyncio.create_task(self._log_stats()))
+        logger.info(f"Model server listening on {self.path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        pending = set()
+        try:
+            while True:
+                header = await reader.readexactly(REQUEST_HEADER.size)
+                request_id, model, rows, cols = REQUEST_HEADER.unpack(header)
+                payload = await reader.readexactly(rows * cols * 4)
+                features = np.frombuffer(payload, dtype="<f4").reshape(rows, cols)
+                # Keep reading while this request waits for its batch
+                task = asyncio.create_task(self._answer(writer, write_lock, request_id, model, features))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # client went away
+        finally:
+            for task in pending:
+                task.cancel()
+            writer.close()
+
+    async def _answer(self, writer, write_lock: asyncio.Lock, request_id: int, model: int, features: np.ndarray):
+        try:
+            batcher = self.batchers.get(model)
+            if batcher is None:
+                raise ValueError(f"unknown model id {model}")
+            labels, probabilities, *extra = await batcher.submit(features)
+            extras = extra[0].reshape(len(labels), -1) if extra else np.empty((len(labels), 0))
+            frame = b"".join([
+                RESPONSE_HEADER.pack(request_id, STATUS_OK, *probabilities.shape, extras.shape[1]),
+                np.ascontiguousarray(labels, dtype="<i4").tobytes(),
+                np.ascontiguousarray(probabilities, dtype="<f8").tobytes(),
+                np.ascontiguousarray(extras, dtype="<f8").tobytes(),
+            ])
+        except Exception as e:
+            logger.error(f"Model server request {request_id} failed: {e}")
+            message = str(e).encode()
+            frame = RESPONSE_HEADER.pack(request_id, STATUS_ERROR, 0, len(message), 0) + message
+        async with write_lock:
+            writer.write(frame)
+            await writer.drain()
+
+    async def _log_stats(self):
+        while True:
+            await asyncio.sleep(STATS_LOG_SECONDS)
+            for batcher in self.batchers.values():
+                if batcher.calls:
+                    logger.info(
+                        f"{batcher.name}: {batcher.rows} rows in {batcher.calls} calls "
+                        f"(avg batch {batcher.rows / batcher.calls:.1f})"
+                    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared triage/disease inference server")
+    parser.add_argument("--socket", default=os.getenv("MODEL_SERVER_SOCKET") or DEFAULT_SOCKET)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(ModelServer(args.socket).serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,245 @@
+"""Monte Carlo bed-occupancy forecast per department.
+
+Two groups of patients drive the forecast:
+
+* current occupants, from the bed index and their open `bed_assignments`;
+* open triages in the queue that do not have a bed yet, each admitted to its
+  department today with a probability that depends on its risk level.
+
+Each patient's total stay is drawn from a log-normal distribution. Its
+median is the predicted `estimated_los_days`, and its spread widens as
+`los_confidence` drops. For occupants the draw is conditioned on the time
+already spent in the bed. Every scenario is one draw for every patient.
+Occupancy on day t counts the patients still in a bed at t. Scenarios are
+computed in blocks of at most FORECAST_MAX_CELLS scenario-patient draws with
+array operations, so thousands of scenarios take a few tens of milliseconds
+and memory stays bounded however many patients there are.
+
+A forecast is cached until the bed index sees an admission, discharge or
+transfer (its `version` changes). It also expires after
+FORECAST_CACHE_MAX_SECONDS, because stays keep elapsing and the queue changes
+without touching beds.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.db.supabase_client import table_select
+from app.services.bed_index import get_bed_index
+from app.services.rollup import parse_ts
+
+logger = logging.getLogger(__name__)
+
+FORECAST_CACHE_MAX_SECONDS = int(os.getenv("FORECAST_CACHE_MAX_SECONDS", "900"))
+FORECAST_SEED = int(os.getenv("FORECAST_SEED", "0"))
+# Scenario x patient draws held in memory at once (a few arrays of 8 bytes each)
+FORECAST_MAX_CELLS = int(os.getenv("FORECAST_MAX_CELLS", "1000000"))
+
+# Chance that a queued patient ends up admitted to a bed
+ADMISSION_PROBABILITY = {"high": 0.9, "medium": 0.5, "low": 0.15}
+# Log-normal sigma of the stay around the predicted LOS, at full and zero confidence
+LOS_SIGMA_MIN = 0.3
+LOS_SIGMA_MAX = 0.9
+# Mean extra days for occupants already past their predicted discharge
+OVERDUE_MEAN_DAYS = 1.0
+PERCENTILES = (10, 50, 90)
+
+_cache: dict[tuple, tuple[int, float, dict]] = {}
+_cache_lock = threading.Lock()
+
+
+# --- engine ---
+
+def simulate_occupancy(
+    department_idx: np.ndarray,
+    n_departments: int,
+    admit_probability: np.ndarray,
+    los_days: np.ndarray,
+    los_confidence: np.ndarray,
+    elapsed_days: np.ndarray,
+    horizon: int,
+    scenarios: int,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """Occupied beds per scenario, department and day: shape (scenarios, departments, horizon).
+
+    Day index 0 is tomorrow (t = 1 day from now). Patient arrays have one entry per patient.
+    """
+    n = len(department_idx)
+    occupancy = np.zeros((scenarios, n_departments, horizon), dtype=np.int32)
+    if n == 0:
+        return occupancy
+
+    median = np.maximum(los_days, 0.5)
+    sigma = LOS_SIGMA_MIN + (LOS_SIGMA_MAX - LOS_SIGMA_MIN) * (1 - np.clip(los_confidence, 0, 1))
+    step = max(1, FORECAST_MAX_CELLS // n)
+    for start in range(0, scenarios, step):
+        size = min(step, scenarios - start)
+        total = rng.lognormal(np.log(median), sigma, size=(size, n))
+        remaining = total - elapsed_days
+        overdue = remaining <= 0
+        remaining[overdue] = rng.exponential(OVERDUE_MEAN_DAYS, size=int(overdue.sum()))
+        admitted = rng.random((size, n)) < admit_probability
+        occupancy[start:start + size] = count_occupancy(department_idx, n_departments, admitted, remaining, horizon)
+    return occupancy
+
+
+def count_occupancy(
+    department_idx: np.ndarray,
+    n_departments: int,
+    admitted: np.ndarray,
+    remaining: np.ndarray,
+    horizon: int,
+) -> np.ndarray:
+    """Admitted patients with more than t days left, per scenario, department and day t = 1..horizon.
+
+    `admitted` and `remaining` have shape (scenarios, patients).
+    """
+    scenarios = admitted.shape[0]
+    # Number of forecast days t = 1..horizon the patient is still in bed (t < remaining)
+    days_present = np.clip(np.ceil(remaining).astype(np.int64) - 1, 0, horizon)
+    # Histogram of days_present per (scenario, department), then a reverse cumulative sum:
+    # occupancy on day t = patients with days_present >= t
+    cells = (np.arange(scenarios)[:, None] * n_departments + department_idx[None, :]) * (horizon + 1) + days_present
+    counts = np.bincount(cells[admitted], minlength=scenarios * n_departments * (horizon + 1))
+    counts = counts.reshape(scenarios, n_departments, horizon + 1)
+    at_least = np.cumsum(counts[:, :, ::-1], axis=2)[:, :, ::-1]
+    return at_least[:, :, 1:].astype(np.int32)
+
+
+def _bands(occupancy: np.ndarray, capacity: int, start: datetime) -> list[dict]:
+    """Percentile bands per day from (scenarios, horizon) occupancy."""
+    percentiles = np.percentile(occupancy, PERCENTILES, axis=0)
+    means = occupancy.mean(axis=0)
+    over = (occupancy > capacity).mean(axis=0) if capacity else np.zeros(occupancy.shape[1])
+    return [
+        {
+            "day": t + 1,
+            "date": (start + timedelta(days=t + 1)).date().isoformat(),
+            "mean": round(float(means[t]), 1),
+            **{f"p{p}": int(round(float(percentiles[i][t]))) for i, p in enumerate(PERCENTILES)},
+            "p_over_capacity": round(float(over[t]), 3),
+        }
+        for t in range(occupancy.shape[1])
+    ]
+
+
+# --- inputs ---
+
+def _in_list(values) -> str:
+    return f"in.({','.join(values)})"
+
+
+def _latest_triage(patient_ids: list[str]) -> dict[str, dict]:
+    latest = {}
+    for start in range(0, len(patient_ids), 100):
+        for row in table_select("triage_results", {
+            "select": "patient_id,risk_level,department_id,estimated_los_days,los_confidence,created_at",
+            "patient_id": _in_list(patient_ids[start:start + 100]),
+            "order": "created_at.desc",
+        }):
+            latest.setdefault(row["patient_id"], row)
+    return latest
+
+
+def load_census(now: datetime) -> dict:
+    """Patients and capacity feeding the simulation, as parallel arrays."""
+    index = get_bed_index()
+    capacity = {a["department_id"]: a["total"] for a in index.availability()}
+    occupants = {b["current_patient_id"]: b for b in index.beds() if b.get("is_occupied") and b.get("current_patient_id")}
+
+    assigned_at = {}
+    for row in table_select("bed_assignments", {"select": "patient_id,assigned_at", "discharged_at": "is.null"}):
+        assigned_at[row["patient_id"]] = row["assigned_at"]
+
+    queued = [
+        row["id"] for row in table_select("v_triage_queue", {"select": "id"})
+        if row["id"] not in occupants
+    ]
+    queued = list(dict.fromkeys(queued))
+    triages = _latest_triage(list(occupants) + queued)
+
+    departments = sorted(set(capacity) | {t["department_id"] for t in triages.values() if t.get("department_id")})
+    dept_index = {d: i for i, d in enumerate(departments)}
+    patients = []
+    for patient_id, bed in occupants.items():
+        triage = triages.get(patient_id, {})
+        since = assigned_at.get(patient_id)
+        elapsed = (now - parse_ts(since)).total_seconds() / 86400 if since else 0.0
+        patients.append((dept_index[bed["department_id"]], 1.0, triage.get("estimated_los_days"),
+                         triage.get("los_confidence"), max(elapsed, 0.0)))
+    for patient_id in queued:
+        triage = triages.get(patient_id)
+        if not triage or triage.get("department_id") not in dept_index:
+            continue
+        probability = ADMISSION_PROBABILITY.get((triage.get("risk_level") or "").lower(), 0.0)
+        patients.append((dept_index[triage["department_id"]], probability, triage.get("estimated_los_days"),
+                         triage.get("los_confidence"), 0.0))
+
+    dept, admit, los, confidence, elapsed = (list(col) for col in zip(*patients)) if patients else ([],) * 5
+    return {
+        "departments": departments,
+        "capacity": [capacity.get(d, 0) for d in departments],
+        "current": [sum(1 for b in occupants.values() if b["department_id"] == d) for d in departments],
+        "queued": len(queued),
+        "department_idx": np.array(dept, dtype=np.int64),
+        "admit_probability": np.array(admit, dtype=float),
+        # Unknown LOS or confidence: assume a 3-day stay at middling confidence
+        "los_days": np.array([3 if v is None else v for v in los], dtype=float),
+        "los_confidence": np.array([0.5 if v is None else v for v in confidence], dtype=float),
+        "elapsed_days": np.array(elapsed, dtype=float),
+    }
+
+
+# --- forecast ---
+
+def forecast_occupancy(horizon: int = 7, scenarios: int = 2000) -> dict:
+    """Per-department and hospital-wide occupancy bands for the next `horizon` days."""
+    version = get_bed_index().version
+    key = (horizon, scenarios)
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached and cached[0] == version and time.monotonic() - cached[1] < FORECAST_CACHE_MAX_SECONDS:
+        return cached[2]
+
+    now = datetime.utcnow()
+    census = load_census(now)
+    started = time.perf_counter()
+    occupancy = simulate_occupancy(
+        census["department_idx"], len(census["departments"]), census["admit_probability"],
+        census["los_days"], census["los_confidence"], census["elapsed_days"],
+        horizon, scenarios, np.random.default_rng(FORECAST_SEED),
+    )
+    simulate_ms = (time.perf_counter() - started) * 1000
+
+    result = {
+        "generated_at": now.isoformat(),
+        "horizon_days": horizon,
+        "scenarios": scenarios,
+        "patients": int(len(census["department_idx"])),
+        "queued": census["queued"],
+        "simulation_ms": round(simulate_ms, 1),
+        "hospital": {
+            "capacity": sum(census["capacity"]),
+            "current": sum(census["current"]),
+            "days": _bands(occupancy.sum(axis=1), sum(census["capacity"]), now),
+        },
+        "departments": [
+            {
+                "department_id": dept,
+                "capacity": census["capacity"][i],
+                "current": census["current"][i],
+                "days": _bands(occupancy[:, i, :], census["capacity"][i], now),
+            }
+            for i, dept in enumerate(census["departments"])
+        ],
+    }
+    with _cache_lock:
+        _cache[key] = (version, time.monotonic(), result)
+    logger.info(f"Occupancy forecast: {result['patients']} patients x {scenarios} scenarios in {simulate_ms:.1f} ms")
+    return result
@@ -0,0 +1,118 @@
+"""Unique, short patient codes from leased blocks of a database sequence.
+
+Each worker leases a block of code numbers with one `lease_patient_codes()`
+call (db_schema_patient_codes.sql) and hands the numbers out from memory. So
+allocating a code needs no round trip and cannot collide: blocks never
+overlap, whichever worker or process holds them. The next block is leased in
+the background once the current one runs low. Numbers skipped when a worker
+restarts are never reused.
+
+A number is shown as Crockford base32 (no I, L, O or U), zero-padded to five
+characters: P-00001, P-0003Z, P-1ZZZZ. That covers 33 million patients in
+five characters and 1 billion in six. Codes from before the allocator were 4
+or 8 hex digits, so the two formats cannot clash until the 34 billionth code.
+"""
+
+import logging
+import secrets
+import threading
+
+from app.db.supabase_client import rpc
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+CODE_WIDTH = 5
+# Lease the next block in the background once this share of the current one is left
+PREFETCH_AT = 0.25
+# Used only if no block can be leased: random codes of a length the sequence never produces
+FALLBACK_WIDTH = 10
+
+
+def format_code(number: int) -> str:
+    digits = []
+    while number:
+        number, r = divmod(number, 32)
+        digits.append(ALPHABET[r])
+    return "P-" + "".join(reversed(digits)).rjust(CODE_WIDTH, "0")
+
+
+def lease_block() -> tuple[int, int]:
+    """Lease a fresh block from the database: (first number, size)."""
+    rows = rpc("lease_patient_codes")
+    row = rows[0] if isinstance(rows, list) else rows
+    return int(row["block_start"]), int(row["block_size"])
+
+
+class PatientCodeAllocator:
+    def __init__(self, lease=lease_block):
+        self._lease = lease
+        self._next = 0
+        self._end = 0
+        self._size = 0
+        self._spare: tuple[int, int] | None = None
+        self._prefetching = False
+        self._lock = threading.Lock()
+
+    def allocate(self) -> str:
+        return self.allocate_many(1)[0]
+
+    def allocate_many(self, n: int) -> list[str]:
+        """`n` unused codes, in increasing order within each block."""
+        numbers = []
+        with self._lock:
+            while len(numbers) < n:
+                if self._next >= self._end:
+                    self._start_block(self._spare or self._lease())
+                    self._spare = None
+                take = min(n - len(numbers), self._end - self._next)
+                numbers.extend(range(self._next, self._next + take))
+                self._next += take
+            prefetch = (
+                self._spare is None and not self._prefetching
+                and self._end - self._next <= self._size * PREFETCH_AT
+            )
+            if prefetch:
+                self._prefetching = True
+        if prefetch:
+            threading.Thread(target=self._prefetch, name="patient-code-lease", daemon=True).start()
+        return [format_code(number) for number in numbers]
+
+    def _start_block(self, block: tuple[int, int]):
+        start, size = block
+        self._next, self._end, self._size = start, start + size, size
+
+    def _prefetch(self):
+        try:
+            block = self._lease()
+        except Exception as e:
+            logger.warning(f"Could not lease patient codes ahead of time: {e}")
+            block = None
+        with self._lock:
+            self._spare = self._spare or block
+            self._prefetching = False
+
+
+_allocator: PatientCodeAllocator | None = None
+
+
+def get_code_allocator() -> PatientCodeAllocator:
+    """Return the process-wide patient code allocator."""
+    global _allocator
+    if _allocator is None:
+        _allocator = PatientCodeAllocator()
+    return _allocator
+
+
+def new_patient_code() -> str:
+    """Allocate a patient code. If no block can be leased, returns a long random code instead."""
+    try:
+        return get_code_allocator().allocate()
+    except Exception as e:
+        logger.error(f"Patient code lease failed, using a random code: {e}")
+        return "P-" + "".join(secrets.choice(ALPHABET) for _ in range(FALLBACK_WIDTH))
+
+
+def new_patient_codes(n: int) -> list[str]:
+    """Allocate `n` patient codes at once (one lease at most per block)."""
+    return get_code_allocator().allocate_many(n)
@@ -0,0 +1,329 @@
+"""Background rollup of triage results into the reporting tables.
+
+Folds new `triage_results` rows into `hourly_stats`, `daily_stats` and
+`department_performance`, and periodically records `department_snapshots`.
+Each source stream is read incrementally past a watermark stored in
+`rollup_watermarks` (see db_schema_rollups.sql), so a cycle only touches
+rows that arrived since the previous one. Both streams page on timestamps
+the database stamps itself: new triages on `ingested_at`
+(db_schema_rollup_cursor.sql), so writes replayed from the local spool
+with an older `created_at` are still folded into the bucket of their
+`created_at`, and attended triages on `attended_recorded_at`
+(db_schema_rollup_lag.sql), so worker clock skew cannot hide them. Rows
+newer than ROLLUP_LAG_SECONDS on the database clock are left for a later
+cycle, since one that is still committing could otherwise land behind the
+watermark.
+
+Every worker runs the loop, but a cycle only runs in the worker holding the
+`rollup` lease. Each batch is committed with `rollup_apply()`
+(db_schema_rollup_apply.sql), which adds the batch's deltas and advances
+the watermark in one transaction, and only if the watermark has not moved
+since the batch was read. Discharge, escalation and transfer counts change
+after a triage is created, and a repeat-vitals re-triage changes its risk
+class and priority in place, so for the last ROLLUP_OUTCOME_DAYS days those
+are recounted on every cycle (db_schema_rollup_recount.sql) instead of
+being trusted from the fold.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from app.db.supabase_client import (
+    SUPABASE_URL,
+    rpc,
+    table_insert_many,
+    table_select,
+    table_select_one,
+)
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_INTERVAL_SECONDS = int(os.getenv("ROLLUP_INTERVAL_SECONDS", "60"))
+SNAPSHOT_INTERVAL_SECONDS = int(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "300"))
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "500"))
+ROLLUP_LEASE_SECONDS = int(os.getenv("ROLLUP_LEASE_SECONDS", str(ROLLUP_INTERVAL_SECONDS * 3)))
+ROLLUP_OUTCOME_DAYS = int(os.getenv("ROLLUP_OUTCOME_DAYS", "14"))
+ROLLUP_LAG_SECONDS = int(os.getenv("ROLLUP_LAG_SECONDS", "30"))
+
+EPOCH = "1970-01-01T00:00:00"
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+_task: asyncio.Task | None = None
+
+
+def parse_ts(value: str) -> datetime:
+    """Parse a PostgREST timestamp string into a naive datetime."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+# --- Watermarks ---
+
+def load_watermark(name: str) -> tuple[str, str | None]:
+    """Return (last_ts, last_id) for a rollup stream, or the epoch if unset."""
+    row = table_select_one("rollup_watermarks", {"name": f"eq.{name}"})
+    if not row:
+        return EPOCH, None
+    return row["last_ts"], row.get("last_id")
+
+
+def read_cutoff() -> str:
+    """Newest cursor timestamp safe to fold: the database clock minus ROLLUP_LAG_SECONDS."""
+    return rpc("rollup_cutoff", {"p_lag_seconds": ROLLUP_LAG_SECONDS})
+
+
+def fetch_after(ts_column: str, watermark: tuple[str, str | None], select: str, cutoff: str) -> list:
+    """Fetch the next batch of triage rows ordered by (ts_column, id) past the watermark and before cutoff."""
+    last_ts, last_id = watermark
+    if last_id:
+        # Rows sharing last_ts are split by id so a batch boundary never skips one
+        after = f'or({ts_column}.gt."{last_ts}",and({ts_column}.eq."{last_ts}",id.gt.{last_id}))'
+    else:
+        after = f'{ts_column}.gt."{last_ts}"'
+    return table_select("triage_results", {
+        "select": select,
+        "and": f'({after},{ts_column}.lt."{cutoff}")',
+        "order": f"{ts_column}.asc,id.asc",
+        "limit": str(ROLLUP_BATCH_SIZE),
+    })
+
+
+# --- Folding ---
+
+def _avg(total: float, n: int, digits: int = 2) -> float:
+    return round(total / n, digits) if n else 0
+
+
+def fold_created(rows: list[dict]) -> dict:
+    """Deltas for hourly_stats and daily_stats from newly created triage rows."""
+    hourly = defaultdict(lambda: {"n": 0, "high": 0, "medium": 0, "low": 0, "wait": 0.0})
+    daily = defaultdict(lambda: {"n": 0, "high": 0, "medium": 0, "low": 0, "wait": 0.0, "priority": 0.0})
+
+    for row in rows:
+        ts = parse_ts(row["created_at"])
+        day = ts.date().isoformat()
+        risk = row.get("risk_level")
+
+        h = hourly[(day, ts.hour)]
+        h["n"] += 1
+        h["wait"] += row.get("waiting_time") or 0
+        if risk in ("high", "medium", "low"):
+            h[risk] += 1
+
+        d = daily[day]
+        d["n"] += 1
+        d["wait"] += row.get("waiting_time") or 0
+        d["priority"] += row.get("priority_score") or 0
+        if risk in ("high", "medium", "low"):
+            d[risk] += 1
+
+    return {
+        "p_hourly": [
+            {
+                "stat_date": day,
+                "stat_hour": hour,
+                "total_patients": h["n"],
+                "high_risk": h["high"],
+                "medium_risk": h["medium"],
+                "low_risk": h["low"],
+                "avg_wait_time": _avg(h["wait"], h["n"]),
+            }
+            for (day, hour), h in hourly.items()
+        ],
+        "p_daily": [
+            {
+                "stat_date": day,
+                "total_patients": d["n"],
+                "high_risk_count": d["high"],
+                "medium_risk_count": d["medium"],
+                "low_risk_count": d["low"],
+                "avg_wait_time": _avg(d["wait"], d["n"]),
+                "avg_priority_score": _avg(d["priority"], d["n"]),
+            }
+            for day, d in daily.items()
+        ],
+    }
+
+
+def fold_attended(rows: list[dict]) -> dict:
+    """Deltas for department_performance from newly attended triage rows.
+
+    `avg_treatment_time` is arrival-to-attended minutes; `efficiency_pct` is the
+    share of patients attended within their estimated waiting time.
+    """
+    perf = defaultdict(lambda: {"n": 0, "minutes": 0.0, "on_time": 0})
+
+    for row in rows:
+        if not row.get("department_id"):
+            continue
+        attended = parse_ts(row["attended_at"])
+        arrived = parse_ts(row.get("arrival_time") or row["created_at"])
+        minutes = max((attended - arrived).total_seconds() / 60, 0)
+
+        p = perf[(row["department_id"], attended.date().isoformat())]
+        p["n"] += 1
+        p["minutes"] += minutes
+        if minutes <= (row.get("waiting_time") or 0):
+            p["on_time"] += 1
+
+    return {
+        "p_performance": [
+            {
+                "department_id": dept_id,
+                "stat_date": day,
+                "patients_seen": p["n"],
+                "avg_treatment_time": _avg(p["minutes"], p["n"]),
+                "efficiency_pct": _avg(p["on_time"] * 100, p["n"], 1),
+            }
+            for (dept_id, day), p in perf.items()
+        ],
+    }
+
+
+def refresh_outcomes() -> int:
+    """Recount outcomes and risk splits in daily_stats and hourly_stats for recent days."""
+    since = (datetime.utcnow().date() - timedelta(days=ROLLUP_OUTCOME_DAYS)).isoformat()
+    return rpc("rollup_refresh_outcomes", {"p_since": since})
+
+
+# --- Snapshots ---
+
+def snapshot_departments():
+    """Record one department_snapshots row per active department."""
+    departments = table_select("departments", {
+        "select": "id,total_beds",
+        "is_active": "eq.true",
+    })
+    beds = table_select("beds", {"select": "department_id", "is_occupied": "eq.true"})
+    queue = table_select("v_triage_queue", {"select": "department_id,waiting_time"})
+    doctors = table_select("doctors", {"select": "department_id", "is_available": "eq.true"})
+
+    occupied = defaultdict(int)
+    for b in beds:
+        occupied[b["department_id"]] += 1
+    waiting = defaultdict(list)
+    for q in queue:
+        waiting[q["department_id"]].append(q.get("waiting_time") or 0)
+    available = defaultdict(int)
+    for d in doctors:
+        available[d["department_id"]] += 1
+
+    now = datetime.utcnow().isoformat()
+    rows = []
+    for dept in departments:
+        dept_id = dept["id"]
+        total_beds = dept.get("total_beds") or 0
+        waits = waiting.get(dept_id, [])
+        rows.append({
+            "department_id": dept_id,
+            "occupied_beds": occupied[dept_id],
+            "capacity_pct": min(int(occupied[dept_id] / total_beds * 100), 100) if total_beds else 0,
+            "wait_time_mins": int(sum(waits) / len(waits)) if waits else 0,
+            "active_doctors": available[dept_id],
+            "patient_count": len(waits),
+            "recorded_at": now,
+        })
+
+    table_insert_many("department_snapshots", rows)
+
+
+# --- Worker ---
+
+def hold_lease() -> bool:
+    """Take or renew the rollup lease. True if this worker should run the cycle."""
+    return bool(rpc("try_worker_lease", {
+        "p_name": "rollup",
+        "p_owner": LEASE_OWNER,
+        "p_ttl_seconds": ROLLUP_LEASE_SECONDS,
+    }))
+
+
+def _drain(name: str, ts_column: str, select: str, fold, cutoff: str) -> int:
+    """Fold batches past the watermark until caught up to cutoff. Returns rows processed."""
+    watermark = load_watermark(name)
+    processed = 0
+    while True:
+        rows = fetch_after(ts_column, watermark, select, cutoff)
+        if not rows:
+            break
+        last = rows[-1]
+        committed = rpc("rollup_apply", {
+            "p_name": name,
+            "p_expected_ts": watermark[0],
+            "p_expected_id": watermark[1],
+            "p_last_ts": last[ts_column],
+            "p_last_id": last["id"],
+            **fold(rows),
+        })
+        if not committed:
+            # Another worker committed from this watermark first (the lease moved)
+            logger.warning(f"Rollup {name}: watermark moved, stopping this cycle")
+            break
+        watermark = (last[ts_column], last["id"])
+        processed += len(rows)
+        if len(rows) < ROLLUP_BATCH_SIZE:
+            break
+    return processed
+
+
+def run_rollup_once() -> dict:
+    """Run one incremental rollup cycle over both triage streams."""
+    cutoff = read_cutoff()
+    created = _drain(
+        "triage_created", "ingested_at",
+        "id,ingested_at,created_at,risk_level,priority_score,waiting_time",
+        fold_created, cutoff,
+    )
+    attended = _drain(
+        "triage_attended", "attended_recorded_at",
+        "id,attended_recorded_at,attended_at,arrival_time,created_at,department_id,waiting_time",
+        fold_attended, cutoff,
+    )
+    refresh_outcomes()
+    return {"created": created, "attended": attended}
+
+
+async def _run_forever():
+    last_snapshot = 0.0
+    while True:
+        try:
+            if await asyncio.to_thread(hold_lease):
+                counts = await asyncio.to_thread(run_rollup_once)
+                if counts["created"] or counts["attended"]:
+                    logger.info(f"Rolled up {counts['created']} new and {counts['attended']} attended triages")
+
+                if time.monotonic() - last_snapshot >= SNAPSHOT_INTERVAL_SECONDS:
+                    await asyncio.to_thread(snapshot_departments)
+                    last_snapshot = time.monotonic()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # A batch's stats and watermark commit together, so the next cycle retries it
+            logger.error(f"Rollup cycle failed: {e}")
+
+        await asyncio.sleep(ROLLUP_INTERVAL_SECONDS)
+
+
+def start_rollup_worker():
+    """Start the rollup loop on the running event loop (no-op without Supabase)."""
+    global _task
+    if not SUPABASE_URL:
+        logger.warning("SUPABASE_URL not set; rollup worker disabled")
+        return
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_run_forever())
+
+
+async def stop_rollup_worker():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
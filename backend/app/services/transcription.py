@@ -0,0 +1,146 @@
+"""Pluggable speech-to-text backends for voice intake.
+
+A backend opens one `TranscriptionSession` per recording. Audio is fed to
+the session in chunks as it arrives, and each `feed` returns the partial
+transcript so far, if it changed. `finish` returns the final result. Session
+calls are blocking and run on a shared thread pool (TRANSCRIBE_WORKERS), so
+a slow model never stalls the event loop. Calls for one session are awaited
+in order, never run concurrently.
+
+The backend is chosen with TRANSCRIBE_BACKEND. Only "local" ships: it is
+deterministic (same audio bytes, same transcript and partials) and needs no
+external service, so voice load can be benchmarked offline. A real engine
+plugs in with `register_backend`.
+"""
+
+import abc
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIBE_BACKEND = os.getenv("TRANSCRIBE_BACKEND", "local")
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "4"))
+# Simulated compute cost of the local backend, in ms per second of audio
+LOCAL_TRANSCRIBE_MS_PER_AUDIO_SECOND = float(os.getenv("LOCAL_TRANSCRIBE_MS_PER_AUDIO_SECOND", "0"))
+# 16 kHz, 16-bit mono PCM
+AUDIO_BYTES_PER_SECOND = 32000
+
+
+class TranscriptionSession(abc.ABC):
+    """Incremental transcription of one recording."""
+
+    @abc.abstractmethod
+    def feed(self, chunk: bytes) -> str | None:
+        """Consume audio. Returns the updated partial transcript, or None if unchanged."""
+
+    @abc.abstractmethod
+    def finish(self) -> dict:
+        """Flush remaining audio. Returns {text, confidence, detected_language}."""
+
+
+class LocalTranscriptionSession(TranscriptionSession):
+    """Deterministic stand-in transcriber.
+
+    The phrase is picked from a hash of the first audio bytes, and one word
+    is revealed per WORD_SECONDS of audio received, so partials arrive at a
+    realistic pace and identical recordings always transcribe identically.
+    """
+
+    PHRASES = [
+        "I have a severe headache and I've been feeling dizzy since this morning.",
+        "My chest hurts when I breathe deeply, and I have a dry cough.",
+        "I fell down the stairs and my right ankle is very swollen and painful.",
+        "I've had a high fever for two days and I'm shivering constantly.",
+        "My stomach has been hurting really bad after I ate dinner last night.",
+    ]
+    WORD_SECONDS = 0.4
+    SEED_BYTES = 4096
+
+    def __init__(self, language: str):
+        self.language = language
+        self.seed = hashlib.sha256()
+        self.seeded = 0
+        self.received = 0
+        self.revealed = 0
+
+    def _words(self) -> list[str]:
+        digest = self.seed.digest()
+        return self.PHRASES[digest[0] % len(self.PHRASES)].split()
+
+    def _simulate_compute(self, size: int):
+        if LOCAL_TRANSCRIBE_MS_PER_AUDIO_SECOND > 0:
+            time.sleep(size / AUDIO_BYTES_PER_SECOND * LOCAL_TRANSCRIBE_MS_PER_AUDIO_SECOND / 1000)
+
+    def feed(self, chunk: bytes) -> str | None:
+        if self.seeded < self.SEED_BYTES:
+            head = chunk[: self.SEED_BYTES - self.seeded]
+            self.seed.update(head)
+            self.seeded += len(head)
+        self.received += len(chunk)
+        self._simulate_compute(len(chunk))
+
+        words = self._words()
+        revealed = min(int(self.received / AUDIO_BYTES_PER_SECOND / self.WORD_SECONDS), len(words) - 1)
+        if revealed <= self.revealed:
+            return None
+        self.revealed = revealed
+        return " ".join(words[:revealed])
+
+    def finish(self) -> dict:
+        digest = self.seed.digest()
+        return {
+            "text": " ".join(self._words()) if self.received else "",
+            "confidence": round(0.85 + (digest[1] / 255) * 0.14, 2) if self.received else 0.0,
+            "detected_language": self.language,
+        }
+
+
+_backends: dict[str, Callable[[str], TranscriptionSession]] = {
+    "local": LocalTranscriptionSession,
+}
+_pool: ThreadPoolExecutor | None = None
+
+
+def register_backend(name: str, factory: Callable[[str], TranscriptionSession]):
+    """Make a backend selectable via TRANSCRIBE_BACKEND. `factory(language)` opens a session."""
+    _backends[name] = factory
+
+
+def get_pool() -> ThreadPoolExecutor:
+    """Return the shared transcription worker pool."""
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS, thread_name_prefix="transcribe")
+    return _pool
+
+
+class AsyncTranscription:
+    """Event-loop side of a session: every call runs on the worker pool."""
+
+    def __init__(self, language: str = "en-US", backend: str | None = None):
+        name = backend or TRANSCRIBE_BACKEND
+        factory = _backends.get(name)
+        if factory is None:
+            raise ValueError(f"Unknown transcription backend: {name}")
+        self.session = factory(language)
+
+    async def feed(self, chunk: bytes) -> str | None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_pool(), self.session.feed, chunk)
+
+    async def finish(self) -> dict:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_pool(), self.session.finish)
+
+
+def shutdown_transcription_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
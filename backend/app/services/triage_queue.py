@@ -0,0 +1,280 @@
+"""In-memory per-department triage queue backed by binary heaps.
+
+Patients are ordered by `priority_score` plus an aging bonus of
+AGING_POINTS_PER_MINUTE for every minute spent waiting. Because every waiting
+patient ages at the same rate, the aged order is the same as ordering by
+`priority_score - AGING_POINTS_PER_MINUTE * arrival_minute`, so heap keys are
+fixed at push time and never need re-heapifying.
+
+Removals and re-prioritisations are lazy: the stale heap entry is left in
+place and skipped when it reaches the top. Each API worker process holds its
+own queue, rebuilt from `v_triage_queue` on startup and every
+TRIAGE_QUEUE_RESYNC_SECONDS after that, so patients triaged or seen through
+another worker show up here too. A resync swaps in the new heaps in one go;
+patients pushed or removed locally while it was reading keep their local
+state until the next resync.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+from datetime import datetime
+
+from app.db.supabase_client import SUPABASE_URL, table_select
+
+logger = logging.getLogger(__name__)
+
+AGING_POINTS_PER_MINUTE = float(os.getenv("QUEUE_AGING_POINTS_PER_MINUTE", "0.5"))
+TRIAGE_QUEUE_RESYNC_SECONDS = int(os.getenv("TRIAGE_QUEUE_RESYNC_SECONDS", "15"))
+
+QUEUE_STATUSES = ("waiting", "triage")
+
+
+def _arrival_minutes(arrival: datetime) -> float:
+    return arrival.timestamp() / 60
+
+
+class TriageQueue:
+    def __init__(self, aging_per_minute: float = AGING_POINTS_PER_MINUTE):
+        self.aging_per_minute = aging_per_minute
+        self._heaps: dict[str, list] = {}
+        self._entries: dict[str, list] = {}  # patient_code -> live heap entry
+        self._counts: dict[str, int] = {}    # department_id -> live entries
+        self._stale: dict[str, int] = {}     # department_id -> retired entries still in heap
+        self._counter = itertools.count()
+        self._version = 0
+        self._touched: dict[str, int] = {}   # patient_code -> version of its last local push/remove
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _key(self, priority_score: int, arrival: datetime) -> float:
+        return -(priority_score - self.aging_per_minute * _arrival_minutes(arrival))
+
+    def _entry(self, patient: dict) -> list:
+        arrival = patient.get("arrival") or datetime.utcnow()
+        department_id = patient.get("department_id") or "general"
+        data = {**patient, "department_id": department_id, "arrival": arrival}
+        return [self._key(patient["priority_score"], arrival), next(self._counter), data]
+
+    def _touch(self, patient_code: str):
+        self._version += 1
+        self._touched[patient_code] = self._version
+
+    def push(self, patient: dict):
+        """Add or re-prioritise a patient. Needs patient_code, department_id, priority_score."""
+        entry = self._entry(patient)
+        department_id = entry[2]["department_id"]
+
+        with self._lock:
+            self._touch(patient["patient_code"])
+            old = self._entries.get(patient["patient_code"])
+            if old is not None:
+                self._retire(old)
+            self._entries[patient["patient_code"]] = entry
+            heapq.heappush(self._heaps.setdefault(department_id, []), entry)
+            self._counts[department_id] = self._counts.get(department_id, 0) + 1
+
+    def get(self, patient_code: str) -> dict | None:
+        """The queued entry for a patient, including its arrival time."""
+        with self._lock:
+            entry = self._entries.get(patient_code)
+            return dict(entry[2]) if entry is not None else None
+
+    def remove(self, patient_code: str) -> dict | None:
+        """Drop a patient from the queue (attended, discharged, transferred)."""
+        with self._lock:
+            self._touch(patient_code)
+            entry = self._entries.pop(patient_code, None)
+            if entry is None:
+                return None
+            data = entry[2]
+            self._retire(entry)
+            return data
+
+    def _retire(self, entry: list):
+        department_id = entry[2]["department_id"]
+        entry[2] = None
+        self._counts[department_id] -= 1
+        self._stale[department_id] = self._stale.get(department_id, 0) + 1
+
+        # Compact once stale entries outnumber live ones so heaps stay O(live)
+        heap = self._heaps[department_id]
+        if self._stale[department_id] > len(heap) // 2:
+            heap[:] = [e for e in heap if e[2] is not None]
+            heapq.heapify(heap)
+            self._stale[department_id] = 0
+
+    def _prune(self, heap: list, department_id: str):
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+            self._stale[department_id] -= 1
+
+    def peek(self, department_id: str | None = None) -> dict | None:
+        """Return the next patient to see, within one department or across all."""
+        with self._lock:
+            departments = [department_id] if department_id else list(self._heaps)
+            best = None
+            for dept in departments:
+                heap = self._heaps.get(dept)
+                if not heap:
+                    continue
+                self._prune(heap, dept)
+                if heap and (best is None or heap[0][:2] < best[:2]):
+                    best = heap[0]
+            return self._view(best) if best else None
+
+    def ordered(self, department_id: str | None = None, limit: int | None = None) -> list[dict]:
+        """Return queued patients in the order they should be seen."""
+        with self._lock:
+            if department_id:
+                entries = [e for e in self._heaps.get(department_id, []) if e[2] is not None]
+            else:
+                entries = list(self._entries.values())
+            if limit is not None:
+                top = heapq.nsmallest(limit, entries, key=lambda e: e[:2])
+            else:
+                top = sorted(entries, key=lambda e: e[:2])
+            return [self._view(e) for e in top]
+
+    def depth(self, department_id: str) -> int:
+        """Number of patients waiting in a department, in O(1)."""
+        return self._counts.get(department_id, 0)
+
+    def clear(self):
+        with self._lock:
+            self._heaps.clear()
+            self._entries.clear()
+            self._counts.clear()
+            self._stale.clear()
+            self._touched.clear()
+
+    def version(self) -> int:
+        """Counter of local pushes and removals, to pass to replace()."""
+        with self._lock:
+            return self._version
+
+    def replace(self, patients: list[dict], since: int):
+        """Swap in a fresh snapshot of the queue taken after version `since`.
+
+        Patients pushed or removed locally after `since` keep their local
+        state; the snapshot may have been read before those changes.
+        """
+        entries = {p["patient_code"]: self._entry(p) for p in patients}
+        with self._lock:
+            for code, version in self._touched.items():
+                if version <= since:
+                    continue
+                live = self._entries.get(code)
+                if live is not None:
+                    entries[code] = live
+                else:
+                    entries.pop(code, None)
+            heaps: dict[str, list] = {}
+            for entry in entries.values():
+                heaps.setdefault(entry[2]["department_id"], []).append(entry)
+            for heap in heaps.values():
+                heapq.heapify(heap)
+            self._heaps = heaps
+            self._entries = entries
+            self._counts = {dept: len(heap) for dept, heap in heaps.items()}
+            self._stale = {}
+            self._touched = {}
+
+    def _view(self, entry: list) -> dict:
+        data = entry[2]
+        waited = max((datetime.utcnow() - data["arrival"]).total_seconds() / 60, 0)
+        return {
+            **{k: v for k, v in data.items() if k != "arrival"},
+            "triage_time": data["arrival"].isoformat(),
+            "waited_minutes": int(waited),
+            "effective_priority": round(data["priority_score"] + self.aging_per_minute * waited, 1),
+        }
+
+
+_queue: TriageQueue | None = None
+
+
+def get_queue() -> TriageQueue:
+    """Return the process-wide triage queue."""
+    global _queue
+    if _queue is None:
+        _queue = TriageQueue()
+    return _queue
+
+
+def queue_entry_from_row(row: dict) -> dict:
+    """Build a queue entry from a v_triage_queue row."""
+    triage_time = row.get("triage_time")
+    arrival = (
+        datetime.fromisoformat(triage_time.replace("Z", "+00:00")).replace(tzinfo=None)
+        if triage_time else datetime.utcnow()
+    )
+    return {
+        "patient_code": row["patient_code"],
+        "name": row.get("name"),
+        "age": row.get("age"),
+        "gender": row.get("gender"),
+        "risk_level": row.get("risk_level"),
+        "priority_score": row.get("priority_score") or 0,
+        "predicted_disease": row.get("predicted_disease"),
+        "department_id": row.get("department_id"),
+        "department_name": row.get("department_name"),
+        "waiting_time": row.get("waiting_time"),
+        "arrival": arrival,
+    }
+
+
+def load_queue() -> int:
+    """Rebuild the queue from open triages in v_triage_queue. Returns queue size."""
+    since = get_queue().version()
+    rows = table_select("v_triage_queue", {
+        "select": "patient_code,name,age,gender,risk_level,priority_score,"
+                  "predicted_disease,department_id,department_name,waiting_time,triage_time",
+    })
+    queue = get_queue()
+    # A patient with several triages appears once per row; keep the latest
+    rows.sort(key=lambda r: r.get("triage_time") or "")
+    queue.replace([queue_entry_from_row(row) for row in rows], since)
+    logger.debug(f"Loaded {len(queue)} patients into the triage queue")
+    return len(queue)
+
+
+# --- Resync loop ---
+
+_task: asyncio.Task | None = None
+
+
+async def _resync_forever():
+    while True:
+        await asyncio.sleep(TRIAGE_QUEUE_RESYNC_SECONDS)
+        try:
+            await asyncio.to_thread(load_queue)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Triage queue resync failed: {e}")
+
+
+def start_triage_queue_resync():
+    """Periodically rebuild the triage queue (no-op without Supabase)."""
+    global _task
+    if not SUPABASE_URL:
+        return
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_resync_forever())
+
+
+async def stop_triage_queue_resync():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,285 @@
+"""Live per-department wait-time estimator.
+
+Tracks, per department, how many patients are waiting in each priority class
+plus exponentially decayed arrival and service rates. The service rate is
+completions per minute during which the department had someone waiting.
+Every update and every estimate is O(1) and touches no database.
+
+A new patient of class k waits for everyone already queued in classes <= k,
+plus the residual of the patient currently being seen. That line shrinks at
+the department's service rate, minus the arrival rate of strictly more
+urgent patients who will be seen first, so
+
+    wait_k = ahead_k / (service_rate - urgent_arrival_rate_k)
+
+Until a department has observed enough completions, its service rate leans on
+a prior of one patient every DEFAULT_SERVICE_MINUTES.
+
+Each worker only sees its own arrivals and completions, so after every
+triage queue resync the estimator is reconciled with the rebuilt queue:
+patients that appeared count as arrivals, and patients that left count as
+served (the queue does not record why they left).
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+
+from app.db.supabase_client import SUPABASE_URL
+from app.services.triage_queue import TRIAGE_QUEUE_RESYNC_SECONDS, get_queue
+
+logger = logging.getLogger(__name__)
+
+RATE_WINDOW_MINUTES = float(os.getenv("WAIT_RATE_WINDOW_MINUTES", "60"))
+DEFAULT_SERVICE_MINUTES = float(os.getenv("WAIT_DEFAULT_SERVICE_MINUTES", "10"))
+PRIOR_WEIGHT = 2.0  # pseudo-completions backing the prior service rate
+MAX_WAIT_MINUTES = 240
+
+# priority_score lower bounds for classes 0 (most urgent) .. 3
+PRIORITY_CLASS_BOUNDS = (80, 60, 40, 0)
+
+
+def priority_class(priority_score: int) -> int:
+    for cls, bound in enumerate(PRIORITY_CLASS_BOUNDS):
+        if priority_score >= bound:
+            return cls
+    return len(PRIORITY_CLASS_BOUNDS) - 1
+
+
+class DecayingRate:
+    """Event rate (per minute) with exponential forgetting over `window` minutes."""
+
+    __slots__ = ("window", "count", "updated")
+
+    def __init__(self, window: float):
+        self.window = window
+        self.count = 0.0
+        self.updated = time.monotonic()
+
+    def _decay(self, now: float):
+        elapsed = (now - self.updated) / 60
+        if elapsed > 0:
+            self.count *= math.exp(-elapsed / self.window)
+            self.updated = now
+
+    def tick(self, now: float | None = None):
+        self._decay(now or time.monotonic())
+        self.count += 1
+
+    def decayed_count(self, now: float | None = None) -> float:
+        self._decay(now or time.monotonic())
+        return self.count
+
+    def rate(self, now: float | None = None) -> float:
+        return self.decayed_count(now) / self.window
+
+
+class DepartmentState:
+    __slots__ = ("window", "depth", "arrivals", "service", "busy_minutes", "updated")
+
+    def __init__(self, window: float):
+        n = len(PRIORITY_CLASS_BOUNDS)
+        self.window = window
+        self.depth = [0] * n
+        self.arrivals = [DecayingRate(window) for _ in range(n)]
+        self.service = DecayingRate(window)
+        self.busy_minutes = 0.0  # decayed minutes with at least one patient waiting
+        self.updated = time.monotonic()
+
+    def advance(self, now: float):
+        """Accrue busy time since the last event, with the same forgetting as the rates."""
+        elapsed = (now - self.updated) / 60
+        if elapsed > 0:
+            self.busy_minutes *= math.exp(-elapsed / self.window)
+            if sum(self.depth) > 0:
+                self.busy_minutes += elapsed
+            self.updated = now
+
+
+class WaitEstimator:
+    def __init__(
+        self,
+        window_minutes: float = RATE_WINDOW_MINUTES,
+        default_service_minutes: float = DEFAULT_SERVICE_MINUTES,
+    ):
+        self.window = window_minutes
+        self.default_service_minutes = default_service_minutes
+        self._departments: dict[str, DepartmentState] = {}
+        self._patients: dict[str, tuple[str, int]] = {}  # patient_code -> (department_id, class)
+        self._lock = threading.Lock()
+
+    def _dept(self, department_id: str) -> DepartmentState:
+        state = self._departments.get(department_id)
+        if state is None:
+            state = self._departments[department_id] = DepartmentState(self.window)
+        return state
+
+    def add(self, patient_code: str, department_id: str, priority_score: int, arrival: bool = True):
+        """Record a patient joining a department queue."""
+        with self._lock:
+            cls = priority_class(priority_score)
+            self._add(patient_code, department_id, cls, arrival, time.monotonic())
+
+    def remove(self, patient_code: str, served: bool):
+        """Record a patient leaving the queue; `served` counts toward the service rate."""
+        with self._lock:
+            self._remove(patient_code, served, time.monotonic())
+
+    def _add(self, patient_code: str, department_id: str, cls: int, arrival: bool, now: float):
+        previous = self._patients.pop(patient_code, None)
+        if previous is not None:
+            self._dept(previous[0]).advance(now)
+            self._dept(previous[0]).depth[previous[1]] -= 1
+        state = self._dept(department_id)
+        state.advance(now)
+        state.depth[cls] += 1
+        if arrival:
+            state.arrivals[cls].tick(now)
+        self._patients[patient_code] = (department_id, cls)
+
+    def _remove(self, patient_code: str, served: bool, now: float):
+        entry = self._patients.pop(patient_code, None)
+        if entry is None:
+            return
+        state = self._dept(entry[0])
+        state.advance(now)
+        state.depth[entry[1]] -= 1
+        if served:
+            state.service.tick(now)
+
+    def sync(self, patients: list[dict]):
+        """Reconcile with the full queue, counting changes made through other workers."""
+        now = time.monotonic()
+        with self._lock:
+            queued = {p["patient_code"] for p in patients}
+            for patient_code in [code for code in self._patients if code not in queued]:
+                self._remove(patient_code, True, now)
+            for p in patients:
+                place = (p["department_id"], priority_class(p["priority_score"]))
+                current = self._patients.get(p["patient_code"])
+                if current != place:
+                    self._add(p["patient_code"], *place, current is None, now)
+
+    def _service_rate(self, state: DepartmentState, now: float) -> float:
+        # Completions per busy minute measures capacity; idle time would only
+        # measure how few patients turned up.
+        state.advance(now)
+        completions = state.service.decayed_count(now)
+        return (completions + PRIOR_WEIGHT) / (
+            state.busy_minutes + PRIOR_WEIGHT * self.default_service_minutes
+        )
+
+    def _wait(self, state: DepartmentState, cls: int, ahead: float, now: float) -> float:
+        urgent_arrivals = sum(state.arrivals[c].rate(now) for c in range(cls))
+        drain_rate = self._service_rate(state, now) - urgent_arrivals
+        if drain_rate <= 0:
+            return MAX_WAIT_MINUTES
+        # Plus half a service time: the residual of whoever is being seen now
+        return min((ahead + 0.5) / drain_rate, MAX_WAIT_MINUTES)
+
+    def estimate_wait(self, department_id: str, priority_score: int) -> int:
+        """Expected minutes until a newly arriving patient of this priority is seen."""
+        cls = priority_class(priority_score)
+        now = time.monotonic()
+        with self._lock:
+            state = self._dept(department_id)
+            ahead = sum(state.depth[: cls + 1])
+            return int(round(self._wait(state, cls, ahead, now)))
+
+    def department_waits(self, department_id: str) -> dict:
+        """Queue depth, rates and expected wait per priority class for one department."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._dept(department_id)
+            return {
+                "department_id": department_id,
+                "depth": list(state.depth),
+                "arrival_rate_per_hour": round(sum(r.rate(now) for r in state.arrivals) * 60, 2),
+                "service_rate_per_hour": round(self._service_rate(state, now) * 60, 2),
+                "expected_wait": [
+                    int(round(self._wait(state, cls, sum(state.depth[: cls + 1]), now)))
+                    for cls in range(len(PRIORITY_CLASS_BOUNDS))
+                ],
+            }
+
+    def average_wait(self) -> float:
+        """Mean expected remaining wait across everyone currently queued."""
+        now = time.monotonic()
+        total_wait = 0.0
+        total_patients = 0
+        with self._lock:
+            for state in self._departments.values():
+                ahead_of_class = 0
+                for cls, n in enumerate(state.depth):
+                    if n > 0:
+                        # On average half of the patient's own class is ahead of them
+                        mean_ahead = ahead_of_class + (n - 1) / 2
+                        total_wait += n * self._wait(state, cls, mean_ahead, now)
+                        total_patients += n
+                    ahead_of_class += max(n, 0)
+        return round(total_wait / total_patients, 1) if total_patients else 0.0
+
+    def departments(self) -> list[str]:
+        return list(self._departments)
+
+    def clear(self):
+        with self._lock:
+            self._departments.clear()
+            self._patients.clear()
+
+
+_estimator: WaitEstimator | None = None
+
+
+def get_wait_estimator() -> WaitEstimator:
+    """Return the process-wide wait estimator."""
+    global _estimator
+    if _estimator is None:
+        _estimator = WaitEstimator()
+    return _estimator
+
+
+def seed_wait_estimator():
+    """Load current queue depths from the triage queue (run after load_queue)."""
+    estimator = get_wait_estimator()
+    estimator.clear()
+    for patient in get_queue().ordered():
+        estimator.add(patient["patient_code"], patient["department_id"], patient["priority_score"], arrival=False)
+
+
+# --- Sync loop ---
+
+_task: asyncio.Task | None = None
+
+
+async def _sync_forever():
+    # Same cadence as the triage queue resync, which this follows
+    while True:
+        await asyncio.sleep(TRIAGE_QUEUE_RESYNC_SECONDS)
+        try:
+            get_wait_estimator().sync(get_queue().ordered())
+        except Exception as e:
+            logger.error(f"Wait estimator sync failed: {e}")
+
+
+def start_wait_estimator_sync():
+    """Periodically reconcile the estimator with the triage queue (no-op without Supabase)."""
+    global _task
+    if not SUPABASE_URL:
+        return
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_sync_forever())
+
+
+async def stop_wait_estimator_sync():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,48 @@
+"""Background replay of writes spooled while Supabase was unavailable (app/db/write_spool.py)."""
+
+import asyncio
+import logging
+import os
+
+from app.db.supabase_client import SUPABASE_URL, replay_spooled_writes
+from app.db.write_spool import get_write_spool
+
+logger = logging.getLogger(__name__)
+
+SUPABASE_REPLAY_INTERVAL_SECONDS = float(os.getenv("SUPABASE_REPLAY_INTERVAL_SECONDS", "2"))
+
+_task: asyncio.Task | None = None
+
+
+async def _replay_forever():
+    while True:
+        await asyncio.sleep(SUPABASE_REPLAY_INTERVAL_SECONDS)
+        if not get_write_spool().pending():
+            continue
+        try:
+            replayed = await asyncio.to_thread(replay_spooled_writes)
+            logger.info(f"Replayed {replayed} spooled writes, {get_write_spool().pending()} left")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Spooled write replay paused: {e}")
+
+
+def start_write_replay():
+    """Keep draining the write spool into Supabase (no-op without Supabase)."""
+    global _task
+    if not SUPABASE_URL:
+        return
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_replay_forever())
+
+
+async def stop_write_replay():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
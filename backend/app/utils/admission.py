@@ -0,0 +1,187 @@
+"""Priority-aware admission control for API requests.
+
+Each request gets a class from ROUTE_CLASSES:
+
+* critical: triage and re-triage, voice intake and bed moves;
+* standard: other writes, plus the reads clinicians work from (queue, patient);
+* best_effort: every other read (dashboards, analytics, forecasts).
+
+A worker serves at most ADMISSION_MAX_IN_FLIGHT requests at once. Lower
+classes may only fill part of those slots (CLASS_SHARE), so the rest stay
+free for triage. A request that finds no slot waits in its class's queue.
+Freed slots go to the highest class first. A request is shed with
+`503 Service Unavailable` and a `Retry-After` hint when:
+
+* its queue is full, or it waited longer than its class allows;
+* it is best-effort and critical requests are already waiting.
+
+In-flight counts, queue depth, queue time and sheds per class are exported
+at /metrics. ADMISSION_MAX_IN_FLIGHT=0 disables the controller.
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+
+from app.utils.metrics import counter, gauge, histogram
+
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+
+CRITICAL, STANDARD, BEST_EFFORT = "critical", "standard", "best_effort"
+PRIORITY = (CRITICAL, STANDARD, BEST_EFFORT)
+
+# (method, path prefix, class); first match wins
+ROUTE_CLASSES = [
+    ("POST", "/api/triage", CRITICAL),
+    ("POST", "/api/voice", CRITICAL),
+    ("POST", "/api/beds", CRITICAL),
+    ("PATCH", "/api/patients/", CRITICAL),
+    ("POST", "/api/patients/", CRITICAL),  # repeat vitals re-triage
+    ("GET", "/api/queue", STANDARD),
+    ("GET", "/api/patients/", STANDARD),
+    ("GET", "/api/beds", STANDARD),
+]
+
+# Share of the in-flight slots each class may occupy
+CLASS_SHARE = {CRITICAL: 1.0, STANDARD: 0.75, BEST_EFFORT: 0.4}
+# Longest a request may wait for a slot, and how many may wait, per class
+QUEUE_TIMEOUT_SECONDS = {CRITICAL: 15.0, STANDARD: 3.0, BEST_EFFORT: 0.5}
+QUEUE_LIMIT = {CRITICAL: 512, STANDARD: 128, BEST_EFFORT: 32}
+
+IN_FLIGHT = gauge("admission_in_flight", "Requests holding an admission slot", ("class",))
+QUEUE_DEPTH = gauge("admission_queue_depth", "Requests waiting for an admission slot", ("class",))
+QUEUE_SECONDS = histogram("admission_queue_seconds", "Time spent waiting for an admission slot", ("class",))
+SHED = counter("admission_shed_total", "Requests rejected by admission control", ("class", "reason"))
+
+
+def classify(method: str, path: str) -> str | None:
+    """Admission class for a request, or None if it bypasses admission control."""
+    if method == "OPTIONS" or not path.startswith("/api/"):
+        return None  # CORS preflight, /metrics, /debug, docs
+    for rule_method, prefix, cls in ROUTE_CLASSES:
+        if method == rule_method and path.startswith(prefix):
+            return cls
+    return BEST_EFFORT if method in ("GET", "HEAD") else STANDARD
+
+
+class Shed(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Slot accounting for one worker's event loop (not thread-safe by design)."""
+
+    def __init__(self, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self.limits = {cls: max(1, math.ceil(max_in_flight * share)) for cls, share in CLASS_SHARE.items()}
+        self.total = 0
+        self.in_flight = {cls: 0 for cls in PRIORITY}
+        self.waiters: dict[str, deque] = {cls: deque() for cls in PRIORITY}
+        self._service_seconds = 0.05  # moving average, for Retry-After hints
+
+    def _take(self, cls: str):
+        self.total += 1
+        self.in_flight[cls] += 1
+        IN_FLIGHT.set(self.in_flight[cls], cls)
+
+    def _queued_ahead(self, cls: str) -> bool:
+        return any(self.waiters[c] for c in PRIORITY[:PRIORITY.index(cls) + 1])
+
+    def retry_after(self) -> int:
+        waiting = sum(len(w) for w in self.waiters.values())
+        return max(1, math.ceil(self._service_seconds * (waiting + self.total) / self.max_in_flight))
+
+    async def acquire(self, cls: str) -> float:
+        """Wait for a slot. Returns seconds queued; raises Shed if rejected."""
+        if self.total < self.limits[cls] and not self._queued_ahead(cls):
+            self._take(cls)
+            QUEUE_SECONDS.observe(0.0, cls)
+            return 0.0
+        if cls == BEST_EFFORT and self.waiters[CRITICAL]:
+            raise Shed("priority", self.retry_after())
+        if len(self.waiters[cls]) >= QUEUE_LIMIT[cls]:
+            raise Shed("queue_full", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self.waiters[cls]
+        queue.append(future)
+        QUEUE_DEPTH.set(len(queue), cls)
+        start = time.perf_counter()
+        try:
+            async with asyncio.timeout(QUEUE_TIMEOUT_SECONDS[cls]):
+                await future
+        except TimeoutError:
+            if not (future.done() and not future.cancelled()):
+                raise Shed("timeout", self.retry_after())
+            # Granted a slot just as the timeout fired: keep it
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(cls, 0.0)
+            raise
+        finally:
+            if future in queue:
+                queue.remove(future)
+            QUEUE_DEPTH.set(len(queue), cls)
+        waited = time.perf_counter() - start
+        QUEUE_SECONDS.observe(waited, cls)
+        return waited
+
+    def release(self, cls: str, service_seconds: float):
+        self.total -= 1
+        self.in_flight[cls] -= 1
+        IN_FLIGHT.set(self.in_flight[cls], cls)
+        if service_seconds:
+            self._service_seconds += 0.1 * (service_seconds - self._service_seconds)
+        # Hand free slots to waiters, highest class first
+        for c in PRIORITY:
+            queue = self.waiters[c]
+            while queue and self.total < self.limits[c]:
+                future = queue.popleft()
+                if not future.done():
+                    self._take(c)
+                    future.set_result(None)
+            QUEUE_DEPTH.set(len(queue), c)
+            if queue:
+                break  # lower classes never jump a class that is still waiting
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController to HTTP requests."""
+
+    def __init__(self, app, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT):
+        self.app = app
+        self.controller = AdmissionController(max_in_flight)
+
+    async def __call__(self, scope, receive, send):
+        cls = classify(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if cls is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(cls)
+        except Shed as shed:
+            SHED.inc(cls, shed.reason)
+            body = json.dumps({"detail": "Server is busy, please retry", "class": cls, "reason": shed.reason}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(shed.retry_after).encode()),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(cls, time.perf_counter() - start)
@@ -145,6 +145,33 @@ DEPARTMENT_KEYWORDS = {
     ]
 }
 
+# Map department_mapper output names to Supabase department IDs
+DEPT_NAME_TO_ID = {
+    "Emergency": "emergency",
+    "Emergency Medicine": "emergency",
+    "Cardiology": "cardiology",
+    "Neurology": "neurology",
+    "Orthopedics": "orthopedics",
+    "General Medicine": "general",
+    "Pediatrics": "pediatrics",
+    "Ophthalmology": "ophthalmology",
+    "Pulmonology": "pulmonology",
+    "Dermatology": "dermatology",
+    "Gastroenterology": "gastroenterology",
+    "ENT": "ent",
+    "Nephrology": "nephrology",
+    "Oncology": "oncology",
+    "Endocrinology": "endocrinology",
+    "Psychiatry": "psychiatry",
+    "Urology": "urology",
+    "Gynecology": "gynecology",
+    "Hematology": "hematology",
+    "Infectious Disease": "infectious-disease",
+    "Rheumatology": "rheumatology",
+}
+# First name per department id, for departments stored without their display name
+DEPT_ID_TO_NAME = {dept_id: name for name, dept_id in reversed(DEPT_NAME_TO_ID.items())}
+
 
 def map_disease_to_department(disease: str) -> str:
     """Map a disease name to a hospital department."""
@@ -0,0 +1,312 @@
+"""Extract structured patient data from .docx EHR documents.
+
+Two parsers produce identical output through the shared `apply_ehr_*`
+helpers: `parse_ehr_docx` builds the full python-docx object model, while
+`parse_ehr_docx_stream` stream-parses `word/document.xml` straight out of
+the zip and keeps only the body paragraphs and table rows it needs.
+"""
+
+import io
+import zipfile
+from xml.etree.ElementTree import iterparse
+from docx import Document
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_BODY = W_NS + "body"
+W_P = W_NS + "p"
+W_R = W_NS + "r"
+W_T = W_NS + "t"
+W_TBL = W_NS + "tbl"
+W_TR = W_NS + "tr"
+W_TC = W_NS + "tc"
+W_VAL = W_NS + "val"
+W_HYPERLINK = W_NS + "hyperlink"
+
+# Run children that python-docx renders as text, other than <w:t> and <w:br>
+RUN_TEXT = {W_NS + "tab": "\t", W_NS + "ptab": "\t", W_NS + "cr": "\n", W_NS + "noBreakHyphen": "-"}
+
+# python-docx shows these built-in style names capitalised (see docx.styles.BabelFish)
+STYLE_UI_NAMES = {
+    "caption": "Caption",
+    "footer": "Footer",
+    "header": "Header",
+    **{f"heading {i}": f"Heading {i}" for i in range(1, 10)},
+}
+
+
+def celsius_to_fahrenheit(temp_c: float) -> float:
+    """Convert Celsius to Fahrenheit."""
+    return temp_c * 9 / 5 + 32
+
+
+def parse_ehr_docx(file_bytes: bytes) -> dict:
+    """Parse a .docx EHR document and extract structured patient data.
+
+    Expected format (from sample Patient_Record_1.docx):
+    - Title paragraph: "Patient Record #N"
+    - Table 0 (Demographics): Age, Gender rows
+    - Table 1 (Vitals): BP Systolic, BP Diastolic, Heart Rate, Temperature, SpO2, Respiratory Rate
+    - Table 2 (Clinical): Symptoms (comma-separated), Conditions (comma-separated)
+    - Patient Notes paragraph after "Patient Notes" heading
+    """
+    doc = Document(io.BytesIO(file_bytes))
+
+    result = empty_ehr_result()
+    apply_ehr_paragraphs(result, ((para.style.name, para.text) for para in doc.paragraphs))
+
+    # Parse tables
+    for table in doc.tables:
+        for row in table.rows:
+            apply_ehr_table_row(result, [cell.text.strip() for cell in row.cells])
+
+    return result
+
+
+def empty_ehr_result() -> dict:
+    return {
+        "name": "",
+        "age": 0,
+        "gender": "",
+        "blood_pressure_systolic": None,
+        "blood_pressure_diastolic": None,
+        "heart_rate": None,
+        "temperature": None,
+        "oxygen_saturation": None,
+        "respiratory_rate": None,
+        "symptoms": [],
+        "conditions": [],
+        "notes": "",
+    }
+
+
+def apply_ehr_paragraphs(result: dict, paragraphs):
+    """Fill name and notes from body paragraphs given as (style_name, text) pairs."""
+    capture_notes = False
+    found_title = False
+    for style_name, text in paragraphs:
+        # Extract patient name from title if present
+        if not found_title and style_name == "Title" and text.strip():
+            result["name"] = text.strip()
+            found_title = True
+
+        # Extract notes from paragraphs after "Patient Notes" heading
+        if "patient notes" in text.lower() and style_name.startswith("Heading"):
+            capture_notes = True
+            continue
+        if capture_notes and text.strip():
+            result["notes"] = text.strip()
+            capture_notes = False
+
+
+def apply_ehr_table_row(result: dict, cells: list[str]):
+    """Fill demographics, vitals and clinical fields from one label/value table row."""
+    if len(cells) < 2:
+        return
+
+    label = cells[0].lower()
+    value = cells[1].strip()
+
+    # Demographics
+    if label == "age":
+        try:
+            result["age"] = int(value)
+        except ValueError:
+            pass
+    elif label == "gender":
+        result["gender"] = value.lower()
+
+    # Vitals
+    elif "systolic" in label:
+        try:
+            result["blood_pressure_systolic"] = int(float(value))
+        except ValueError:
+            pass
+    elif "diastolic" in label:
+        try:
+            result["blood_pressure_diastolic"] = int(float(value))
+        except ValueError:
+            pass
+    elif "heart rate" in label:
+        try:
+            result["heart_rate"] = int(float(value))
+        except ValueError:
+            pass
+    elif "temperature" in label:
+        try:
+            temp = float(value)
+            # Check unit - if in Celsius (< 50), convert to Fahrenheit
+            unit = cells[2].strip().upper() if len(cells) > 2 else ""
+            if "C" in unit or temp < 50:
+                temp = celsius_to_fahrenheit(temp)
+            result["temperature"] = round(temp, 1)
+        except (ValueError, IndexError):
+            pass
+    elif "oxygen" in label or "spo2" in label:
+        try:
+            result["oxygen_saturation"] = int(float(value))
+        except ValueError:
+            pass
+    elif "respiratory" in label:
+        try:
+            result["respiratory_rate"] = int(float(value))
+        except ValueError:
+            pass
+
+    # Clinical
+    elif "symptom" in label:
+        symptoms = [s.strip() for s in value.split(",") if s.strip()]
+        result["symptoms"] = symptoms
+    elif "condition" in label:
+        conditions = [c.strip() for c in value.split(",") if c.strip()]
+        result["conditions"] = conditions
+    elif "name" in label and "patient" in label:
+        result["name"] = value
+
+
+def _run_text(run) -> str:
+    parts = []
+    for child in run:
+        tag = child.tag
+        if tag == W_T:
+            parts.append(child.text or "")
+        elif tag == W_NS + "br":
+            if child.get(W_NS + "type") in (None, "textWrapping"):
+                parts.append("\n")
+        elif tag in RUN_TEXT:
+            parts.append(RUN_TEXT[tag])
+    return "".join(parts)
+
+
+def _paragraph_text(p) -> str:
+    parts = []
+    for child in p:
+        if child.tag == W_R:
+            parts.append(_run_text(child))
+        elif child.tag == W_HYPERLINK:
+            parts.extend(_run_text(r) for r in child if r.tag == W_R)
+    return "".join(parts)
+
+
+def _paragraph_style_id(p) -> str | None:
+    ppr = p.find(W_NS + "pPr")
+    style = ppr.find(W_NS + "pStyle") if ppr is not None else None
+    return style.get(W_VAL) if style is not None else None
+
+
+def _resolve_style_names(zf: zipfile.ZipFile, style_ids: set) -> tuple[dict, str]:
+    """Map paragraph style ids to names, plus the default paragraph style name.
+
+    Streams styles.xml and stops as soon as every requested id is resolved.
+    """
+    names: dict[str, str] = {}
+    default_name = None
+    wanted = set(style_ids)
+    try:
+        with zf.open("word/styles.xml") as f:
+            for _, el in iterparse(f):
+                if el.tag != W_NS + "style":
+                    continue
+                if el.get(W_NS + "type") == "paragraph":
+                    name_el = el.find(W_NS + "name")
+                    name = name_el.get(W_VAL) if name_el is not None else ""
+                    name = STYLE_UI_NAMES.get(name, name)
+                    style_id = el.get(W_NS + "styleId")
+                    if style_id in wanted:
+                        names[style_id] = name
+                        wanted.discard(style_id)
+                    if default_name is None and el.get(W_NS + "default") in ("1", "true"):
+                        default_name = name
+                el.clear()
+                if not wanted and default_name is not None:
+                    break
+    except KeyError:
+        pass  # no styles part
+    return names, default_name or "Normal"
+
+
+def parse_ehr_docx_stream(file_bytes: bytes) -> dict:
+    """Parse a .docx EHR document without building the python-docx object model.
+
+    Reads only the top-level body paragraphs and top-level table rows of
+    `word/document.xml` (the same content `parse_ehr_docx` looks at) and
+    frees each element once handled, so memory stays flat in document size.
+    """
+    paragraphs: list[tuple[str | None, str]] = []
+    rows: list[list[str]] = []
+
+    with zipfile.ZipFile(io.BytesIO(file_bytes)) as zf:
+        with zf.open("word/document.xml") as f:
+            stack: list[str] = []
+            row: list[str] = []
+            cell_paragraphs: list[str] = []
+            above: dict[int, str] = {}   # grid offset -> cell text in the previous row
+            current: dict[int, str] = {}
+            offset = 0
+
+            for event, el in iterparse(f, events=("start", "end")):
+                tag = el.tag
+                if event == "start":
+                    stack.append(tag)
+                    if tag == W_TR and len(stack) == 4:
+                        row, current = [], {}
+                        before = el.find(f"{W_NS}trPr/{W_NS}gridBefore")
+                        offset = int(before.get(W_VAL)) if before is not None else 0
+                    elif tag == W_TC and len(stack) == 5:
+                        cell_paragraphs = []
+                    continue
+
+                depth = len(stack)
+                stack.pop()
+
+                # <w:document>/<w:body>/<w:p>
+                if tag == W_P and depth == 3:
+                    paragraphs.append((_paragraph_style_id(el), _paragraph_text(el)))
+                    el.clear()
+
+                # <w:document>/<w:body>/<w:tbl>/<w:tr>/<w:tc>/<w:p>
+                elif tag == W_P and depth == 6 and stack[2] == W_TBL:
+                    cell_paragraphs.append(_paragraph_text(el))
+
+                elif tag == W_TC and depth == 5 and stack[2] == W_TBL:
+                    tc_pr = el.find(W_NS + "tcPr")
+                    span_el = tc_pr.find(W_NS + "gridSpan") if tc_pr is not None else None
+                    merge_el = tc_pr.find(W_NS + "vMerge") if tc_pr is not None else None
+                    span = int(span_el.get(W_VAL)) if span_el is not None else 1
+                    if merge_el is not None and merge_el.get(W_VAL, "continue") == "continue":
+                        # Vertical merge continuation shows the root cell's text
+                        text = above.get(offset, "")
+                    else:
+                        text = "\n".join(cell_paragraphs)
+                    current[offset] = text
+                    row.extend([text] * span)
+                    offset += span
+
+                elif tag == W_TR and depth == 4 and stack[2] == W_TBL:
+                    rows.append([cell.strip() for cell in row])
+                    above = current
+                    el.clear()
+
+                elif tag == W_TBL and depth == 3:
+                    above = {}
+                    el.clear()
+
+        style_names, default_name = _resolve_style_names(
+            zf, {style_id for style_id, _ in paragraphs if style_id}
+        )
+
+    result = empty_ehr_result()
+    apply_ehr_paragraphs(result, (
+        (style_names.get(style_id, default_name) if style_id else default_name, text)
+        for style_id, text in paragraphs
+    ))
+    for cells in rows:
+        apply_ehr_table_row(result, cells)
+    return result
+
+
+def parse_ehr_document(file_bytes: bytes) -> dict:
+    """Parse with the streaming parser, falling back to python-docx on anything unusual."""
+    try:
+        return parse_ehr_docx_stream(file_bytes)
+    except Exception:
+        return parse_ehr_docx(file_bytes)
@@ -73,17 +73,38 @@ def prepare_triage_features(
     return np.array(features).reshape(1, -1)
 
 
-def prepare_symptom_features(symptoms: list[str], symptom_columns: list[str]) -> np.ndarray:
-    """Convert symptom list to binary feature vector matching dataset columns."""
+def resolve_symptom_column(name: str, symptom_columns: list[str]) -> int | None:
+    """Index of the column matching a (mapped, lowercase) symptom name, exact or partial."""
+    if name in symptom_columns:
+        return symptom_columns.index(name)
+    for i, col in enumerate(symptom_columns):
+        if name == col or name in col or col in name:
+            return i
+    return None
+
+
+def prepare_symptom_features(
+    symptoms: list[str],
+    symptom_columns: list[str],
+    extracted: list[dict] | None = None,
+) -> np.ndarray:
+    """Convert symptom list to binary feature vector matching dataset columns.
+
+    `extracted` adds symptoms found in free text (see symptom_extractor);
+    negated mentions are skipped.
+    """
     feature_vector = np.zeros(len(symptom_columns))
 
     for symptom in symptoms:
         mapped_name = SYMPTOM_MAPPING.get(symptom, symptom.lower())
         # Find matching column (exact or partial match)
-        for i, col in enumerate(symptom_columns):
-            if mapped_name == col or mapped_name in col or col in mapped_name:
-                feature_vector[i] = 1
-                break
+        i = resolve_symptom_column(mapped_name, symptom_columns)
+        if i is not None:
+            feature_vector[i] = 1
+
+    for mention in extracted or []:
+        if not mention["negated"]:
+            feature_vector[symptom_columns.index(mention["symptom"])] = 1
 
     return feature_vector.reshape(1, -1)
 
@@ -96,9 +117,22 @@ def compute_contributing_factors(
     oxygen_saturation: int | None,
     respiratory_rate: int | None,
     age: int,
-    feature_importances: dict[str, float] | None = None,
+    feature_contributions: dict[str, float] | None = None,
+    chronic_disease_count: int = 0,
 ) -> list[dict]:
-    """Compute contributing factors with impact scores for the UI."""
+    """Compute contributing factors with impact scores for the UI.
+
+    With the triage model's `feature_contributions`, each factor's impact is
+    its share of the model's total attribution, and it counts as positive
+    when it pushed towards a less urgent level. Without them, the impact
+    falls back to deviation from the normal vital ranges.
+    """
+    if feature_contributions is not None:
+        return _model_contributing_factors(
+            feature_contributions, heart_rate, systolic_bp, diastolic_bp,
+            temperature_f, oxygen_saturation, age, chronic_disease_count,
+        )
+
     factors = []
 
     vitals = {
@@ -161,3 +195,41 @@ def compute_contributing_factors(
     factors.sort(key=lambda x: x["impact"], reverse=True)
 
     return factors[:6]  # Return top 6 factors
+
+
+def _model_contributing_factors(
+    contributions: dict[str, float],
+    heart_rate: int | None,
+    systolic_bp: int | None,
+    diastolic_bp: int | None,
+    temperature_f: float | None,
+    oxygen_saturation: int | None,
+    age: int,
+    chronic_disease_count: int,
+) -> list[dict]:
+    bp_display = f"{systolic_bp}/{diastolic_bp} mmHg" if diastolic_bp else f"{systolic_bp} mmHg"
+    # (model feature, display name, value shown, whether the input was provided)
+    rows = [
+        ("heart_rate", VITAL_RANGES["heart_rate"]["name"], f"{heart_rate} bpm", heart_rate),
+        ("systolic_bp", VITAL_RANGES["blood_pressure_systolic"]["name"], bp_display, systolic_bp),
+        ("oxygen_saturation", VITAL_RANGES["oxygen_saturation"]["name"], f"{oxygen_saturation} %", oxygen_saturation),
+        ("body_temperature", VITAL_RANGES["temperature_f"]["name"], f"{temperature_f} °F", temperature_f),
+        ("age", "Age Factor", f"{age} years", age),
+        ("chronic_disease_count", "Chronic Conditions", str(chronic_disease_count), chronic_disease_count),
+    ]
+    total = sum(abs(v) for v in contributions.values()) or 1.0
+
+    factors = []
+    for feature, name, display_value, provided in rows:
+        if provided is None:
+            continue  # the model saw a default, not a measurement
+        contribution = contributions.get(feature, 0.0)
+        factors.append({
+            "name": name,
+            "value": display_value,
+            "impact": int(round(abs(contribution) / total * 100)),
+            "isPositive": contribution <= 0,
+        })
+
+    factors.sort(key=lambda x: x["impact"], reverse=True)
+    return factors
@@ -0,0 +1,217 @@
+"""In-process latency histograms exposed in Prometheus text format.
+
+Timers are cheap (a perf_counter pair, a bisect and a locked increment,
+a few microseconds), so they can wrap every triage stage and database call
+without noticeably adding to request time. Metrics are per worker process;
+Prometheus sums them across scrape targets.
+
+    with stage_timer("triage_model"):
+        ...
+
+    @timed("ehr_parse_seconds")
+    def parse(...): ...
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# Seconds; tuned for sub-millisecond model calls up to multi-second requests
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for n, v in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                labels = _format_labels(self.labels + ("le",), label_values + (repr(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels + ("le",), label_values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for label_values, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value: float, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+_registry: dict[str, Histogram | Counter] = {}
+
+
+def histogram(name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    """Get or create a registered histogram."""
+    if name not in _registry:
+        _registry[name] = Histogram(name, help_text, labels, buckets)
+    return _registry[name]
+
+
+def counter(name: str, help_text: str, labels: tuple = ()) -> Counter:
+    """Get or create a registered counter."""
+    if name not in _registry:
+        _registry[name] = Counter(name, help_text, labels)
+    return _registry[name]
+
+
+def gauge(name: str, help_text: str, labels: tuple = ()) -> Gauge:
+    """Get or create a registered gauge."""
+    if name not in _registry:
+        _registry[name] = Gauge(name, help_text, labels)
+    return _registry[name]
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in _registry.values():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- timers ---
+
+REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+)
+REQUESTS_IN_FLIGHT = gauge("http_requests_in_flight", "HTTP requests being served")
+TRIAGE_STAGE_SECONDS = histogram(
+    "triage_stage_duration_seconds", "Latency of each run_triage stage", ("stage",)
+)
+SUPABASE_SECONDS = histogram(
+    "supabase_request_duration_seconds", "Supabase REST call latency", ("method", "table", "outcome")
+)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time one stage of run_triage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        TRIAGE_STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+
+
+@contextmanager
+def supabase_timer(method: str, table: str):
+    """Time one Supabase REST call, labelled ok or error."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        SUPABASE_SECONDS.observe(time.perf_counter() - start, method, table, outcome)
+
+
+def timed(name: str, help_text: str = ""):
+    """Decorator recording a function's latency into its own histogram."""
+    hist = histogram(name, help_text or f"Latency of {name}")
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by method, route template and status."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(amount=1)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.inc(amount=-1)
+            # The router stores the matched route in the scope; use its template
+            # so /patients/P-1 and /patients/P-2 share one series
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], path, str(status))
@@ -0,0 +1,109 @@
+"""Client and wire format for the shared model server.
+
+When MODEL_SERVER_SOCKET is set, `predict_triage`/`predict_disease` send
+feature rows to the model server (app/services/model_server.py) over that
+Unix socket instead of loading the models into every API worker.
+
+Frames are a fixed little-endian header followed by raw array bytes:
+
+    request:  request_id u32, model u8, rows u32, cols u32
+              rows * cols float32 features
+    response: request_id u32, status u8, rows u32, cols u32, extra_cols u32
+              status 0: rows int32 labels, rows * cols float64 probabilities,
+                        then rows * extra_cols float64 model-specific outputs
+                        (flattened feature contributions for triage)
+              status 1: a utf-8 error message of `cols` bytes
+
+Each thread keeps its own blocking connection, so callers never interleave
+frames and need no locking.
+"""
+
+import os
+import socket
+import struct
+import threading
+
+import numpy as np
+
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET", "")
+MODEL_SERVER_TIMEOUT_SECONDS = float(os.getenv("MODEL_SERVER_TIMEOUT_SECONDS", "5"))
+
+MODEL_TRIAGE = 1
+MODEL_DISEASE = 2
+
+REQUEST_HEADER = struct.Struct("<IBII")
+RESPONSE_HEADER = struct.Struct("<IBIII")
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+_local = threading.local()
+
+
+class ModelServerUnavailable(Exception):
+    """The server could not be reached or the connection broke."""
+
+
+class ModelServerError(Exception):
+    """The server received the request but the model call failed."""
+
+
+def enabled() -> bool:
+    return bool(MODEL_SERVER_SOCKET)
+
+
+def recv_exactly(sock: socket.socket, n: int) -> bytearray:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    while n:
+        received = sock.recv_into(view[-n:], n)
+        if not received:
+            raise ConnectionError("model server closed the connection")
+        n -= received
+    return buf
+
+
+def _connection() -> socket.socket:
+    sock = getattr(_local, "sock", None)
+    if sock is None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(MODEL_SERVER_TIMEOUT_SECONDS)
+        try:
+            sock.connect(MODEL_SERVER_SOCKET)
+        except OSError:
+            sock.close()
+            raise
+        _local.sock = sock
+        _local.next_id = 0
+    return sock
+
+
+def _close():
+    sock = getattr(_local, "sock", None)
+    if sock is not None:
+        sock.close()
+        _local.sock = None
+
+
+def predict(model: int, features: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Labels, class probabilities and extra outputs for every row of `features`."""
+    features = np.ascontiguousarray(features, dtype="<f4")
+    rows, cols = features.shape
+    try:
+        sock = _connection()
+        request_id = _local.next_id = (_local.next_id + 1) & 0xFFFFFFFF
+        sock.sendall(REQUEST_HEADER.pack(request_id, model, rows, cols) + features.tobytes())
+
+        header = recv_exactly(sock, RESPONSE_HEADER.size)
+        response_id, status, rows_out, cols_out, extra_cols = RESPONSE_HEADER.unpack(header)
+        if response_id != request_id:
+            raise ConnectionError(f"model server answered request {response_id}, expected {request_id}")
+        if status != STATUS_OK:
+            raise ModelServerError(recv_exactly(sock, cols_out).decode())
+        labels = np.frombuffer(recv_exactly(sock, rows_out * 4), dtype="<i4")
+        probabilities = np.frombuffer(recv_exactly(sock, rows_out * cols_out * 8), dtype="<f8")
+        extras = np.frombuffer(recv_exactly(sock, rows_out * extra_cols * 8), dtype="<f8")
+    except OSError as e:
+        # Includes timeouts: the stream position is unknown, so start over next call
+        _close()
+        raise ModelServerUnavailable(str(e)) from e
+    return labels, probabilities.reshape(rows_out, cols_out), extras.reshape(rows_out, extra_cols)
@@ -0,0 +1,151 @@
+"""Opt-in sampling profiler for live requests.
+
+Enabled only when DEBUG_TOKEN is set; otherwise the middleware is never
+installed and costs nothing. A request is profiled when it carries
+`X-Debug-Profile: 1` with a valid `X-Debug-Token`, or when it is picked by
+the admin sampling toggle (see /debug/profiling).
+
+While a profiled request runs, a background thread samples the event-loop
+thread's Python stack every DEBUG_PROFILE_INTERVAL_MS. It writes the stacks
+in collapsed ("folded") format, one `frame;frame;frame count` line per
+unique stack, which flamegraph.pl, speedscope and inferno all read. Other
+coroutines interleaved on the loop during the request show up too, so
+profile under representative but not peak load.
+"""
+
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEBUG_PROFILE_DIR = os.getenv("DEBUG_PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+DEBUG_PROFILE_INTERVAL_MS = float(os.getenv("DEBUG_PROFILE_INTERVAL_MS", "5"))
+DEBUG_PROFILE_MAX_FILES = int(os.getenv("DEBUG_PROFILE_MAX_FILES", "200"))
+
+
+def debug_enabled() -> bool:
+    return bool(DEBUG_TOKEN)
+
+
+def token_valid(token: str | None) -> bool:
+    return debug_enabled() and token is not None and hmac.compare_digest(token, DEBUG_TOKEN)
+
+
+class SamplingProfiler:
+    """Collects stack samples of one thread on a background thread."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="debug-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def write_folded(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfilingSettings:
+    """Admin toggle: profile a share of requests under a path prefix."""
+
+    def __init__(self):
+        self.sample_rate = 0.0
+        self.path_prefix = "/api"
+        self._active = threading.Lock()  # one profile at a time keeps overhead bounded
+
+    def to_dict(self) -> dict:
+        return {"sample_rate": self.sample_rate, "path_prefix": self.path_prefix, "output_dir": DEBUG_PROFILE_DIR}
+
+
+profiling_settings = ProfilingSettings()
+
+
+def _prune_profiles():
+    files = sorted(
+        (os.path.join(DEBUG_PROFILE_DIR, name) for name in os.listdir(DEBUG_PROFILE_DIR)),
+        key=os.path.getmtime,
+    )
+    for path in files[:-DEBUG_PROFILE_MAX_FILES]:
+        os.remove(path)
+
+
+class ProfilerMiddleware:
+    """ASGI middleware profiling requests selected by header or sampling toggle."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _selected(self, scope) -> bool:
+        headers = dict(scope.get("headers") or [])
+        if headers.get(b"x-debug-profile") == b"1":
+            token = headers.get(b"x-debug-token", b"").decode("latin-1")
+            return token_valid(token)
+        settings = profiling_settings
+        return (
+            settings.sample_rate > 0
+            and scope["path"].startswith(settings.path_prefix)
+            and random.random() < settings.sample_rate
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._selected(scope):
+            await self.app(scope, receive, send)
+            return
+        if not profiling_settings._active.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        os.makedirs(DEBUG_PROFILE_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        slug = re.sub(r"[^A-Za-z0-9_-]+", "_", scope["path"].strip("/")) or "root"
+        filename = f"{stamp}-{scope['method']}-{slug}.folded"
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-file", filename.encode())]
+            await send(message)
+
+        profiler = SamplingProfiler(threading.get_ident(), DEBUG_PROFILE_INTERVAL_MS / 1000)
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            profiler.stop()
+            profiling_settings._active.release()
+            profiler.write_folded(os.path.join(DEBUG_PROFILE_DIR, filename))
+            _prune_profiles()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            logger.info(f"Profiled {filename}: {sum(profiler.samples.values())} samples over {elapsed_ms:.1f} ms")
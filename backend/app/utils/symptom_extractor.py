@@ -0,0 +1,184 @@
+"""Extract model symptoms from free text (intake notes, voice transcripts).
+
+All symptom columns, the SYMPTOM_MAPPING aliases, negation cues and clause
+breaks are compiled into a single Aho–Corasick automaton over word tokens,
+so a note is scanned once, in time linear in its length, however many
+patterns there are. Working on tokens rather than characters gives whole-word
+matching for free and keeps the Python loop to one step per word.
+
+Negation follows a simplified NegEx: a cue such as "no", "denies" or
+"negative for" negates the symptoms that follow it in the same clause, as
+long as few other words separate them from the cue. That lets lists like
+"no fever, cough or chills" negate all three. A clause break (". ; but")
+ends the scope, and so does a comma unless it continues a list the cue
+has already started negating (with a symptom, or "and"/"or"/"nor"):
+"no fever, has a bad cough" negates only the fever, and in "fever not
+improving, cough" the cough is not negated.
+"""
+
+import re
+from itertools import accumulate
+
+from app.utils.feature_engineering import SYMPTOM_MAPPING, resolve_symptom_column
+
+NEGATION_CUES = [
+    "no", "not", "denies", "denied", "deny", "without", "negative for",
+    "free of", "absence of", "no signs of", "no evidence of", "never had",
+]
+CLAUSE_BREAKS = [".", ";", "!", "?", "\n", "but", "however", "although", "except"]
+# Max non-symptom words allowed between a negation cue and a symptom it negates
+NEGATION_GAP_WORDS = 3
+LIST_WORDS = {"and", "or", "nor", "any"}
+
+SYMPTOM, NEGATION, BREAK = 0, 1, 2
+
+# Words (keeping in-word apostrophes) and sentence punctuation
+_TOKEN_RE = re.compile(r"([a-z0-9]+(?:'[a-z]+)?|[.;!?\n])")
+
+
+class SymptomMatcher:
+    """Aho–Corasick automaton over symptom names, aliases and negation cues."""
+
+    def __init__(self, symptom_columns: list[str]):
+        self.source = symptom_columns
+        self.columns = list(symptom_columns)
+        # Per state: goto transitions on tokens, failure link, and outputs as (length, kind, value)
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.out: list[list[tuple[int, int, int]]] = [[]]
+
+        patterns: dict[str, tuple[int, int]] = {}
+        for i, column in enumerate(self.columns):
+            patterns[column.lower()] = (SYMPTOM, i)
+        for alias, mapped in SYMPTOM_MAPPING.items():
+            index = resolve_symptom_column(mapped.lower(), self.columns)
+            if index is not None:
+                patterns.setdefault(alias.lower(), (SYMPTOM, index))
+        for cue in NEGATION_CUES:
+            patterns[cue] = (NEGATION, -1)
+        for term in CLAUSE_BREAKS:
+            patterns[term] = (BREAK, -1)
+
+        for pattern, (kind, value) in patterns.items():
+            tokens = _TOKEN_RE.findall(pattern)
+            if tokens:
+                self._add(tokens, kind, value)
+        self._build_failure_links()
+
+    def _add(self, tokens: list[str], kind: int, value: int):
+        state = 0
+        for token in tokens:
+            nxt = self.goto[state].get(token)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][token] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            state = nxt
+        self.out[state].append((len(tokens), kind, value))
+
+    def _build_failure_links(self):
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def scan(self, tokens: list[str]) -> list[tuple[int, int, int, int]]:
+        """Matches as (first_token, last_token + 1, kind, value), leftmost-longest."""
+        goto, fail, out = self.goto, self.fail, self.out
+        root = goto[0]
+        found = []
+        state = 0
+        for i, token in enumerate(tokens):
+            if state:
+                while state and token not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(token, 0)
+            else:
+                # Most words start no pattern: one dict lookup and move on
+                state = root.get(token, 0)
+                if not state:
+                    continue
+            for length, kind, value in out[state]:
+                found.append((i + 1 - length, i + 1, kind, value))
+
+        # Keep the longest match at each position and drop ones nested inside it
+        found.sort(key=lambda m: (m[0], m[0] - m[1]))
+        selected = []
+        last_end = 0
+        for match in found:
+            if match[0] >= last_end:
+                selected.append(match)
+                last_end = match[1]
+        return selected
+
+    def extract(self, text: str, source: str) -> list[dict]:
+        """Symptoms mentioned in `text`, each with its span and negation flag."""
+        # split() alternates [gap, token, gap, token, ..., gap]; running lengths
+        # give every token's character offsets without a per-token regex match
+        pieces = _TOKEN_RE.split(text.lower())
+        tokens = pieces[1::2]
+        offsets = list(accumulate(map(len, pieces)))
+
+        results = []
+        negating = scoped = False  # scoped: the current cue has negated a symptom
+        position = gap = 0
+        for first, last, kind, value in self.scan(tokens):
+            if kind == BREAK:
+                negating = False
+            elif kind == NEGATION:
+                negating, scoped = True, False
+                position, gap = last, 0
+            else:
+                if negating:
+                    # Words since the cue, skipping list words and the symptoms already negated
+                    for i in range(position, first):
+                        if "," in pieces[2 * i] and tokens[i] not in LIST_WORDS:
+                            negating = False  # a new clause starts after the comma
+                            break
+                        if tokens[i] not in LIST_WORDS:
+                            gap += 1
+                    if negating and not scoped and "," in pieces[2 * first]:
+                        negating = False  # the cue's own phrase ended at the comma
+                negated = negating and gap <= NEGATION_GAP_WORDS
+                if negated:
+                    position, scoped = last, True
+                else:
+                    negating = False
+                start, end = offsets[2 * first], offsets[2 * last - 1]
+                results.append({
+                    "symptom": self.columns[value],
+                    "source": source,
+                    "text": text[start:end],
+                    "start": start,
+                    "end": end,
+                    "negated": negated,
+                })
+        return results
+
+
+_matcher: SymptomMatcher | None = None
+
+
+def get_symptom_matcher(symptom_columns: list[str]) -> SymptomMatcher:
+    """Return the matcher for these columns, building it on first use."""
+    global _matcher
+    if _matcher is None or _matcher.source is not symptom_columns:
+        _matcher = SymptomMatcher(symptom_columns)
+    return _matcher
+
+
+def extract_symptoms(texts: dict[str, str], symptom_columns: list[str]) -> list[dict]:
+    """Extract symptoms from several named texts, e.g. {"notes": ..., "transcript": ...}."""
+    matcher = get_symptom_matcher(symptom_columns)
+    extracted = []
+    for source, text in texts.items():
+        if text:
+            extracted.extend(matcher.extract(text, source))
+    return extracted
@@ -0,0 +1,140 @@
+"""Parity check and throughput benchmark for the EHR .docx parsers.
+
+Compares `parse_ehr_docx_stream` against the python-docx based
+`parse_ehr_docx` on EHR/Patient_Record_1.docx and a set of synthetic
+variants, then times both parsers.
+
+Usage (from backend/):
+    python -m benchmarks.ehr_parser [--iterations 200]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+from docx import Document
+
+from app.utils.ehr_parser import parse_ehr_docx, parse_ehr_docx_stream
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_PATH = os.path.join(BASE_DIR, "EHR", "Patient_Record_1.docx")
+
+
+def _save(doc) -> bytes:
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def _table(doc, rows, cols=2):
+    table = doc.add_table(rows=0, cols=cols)
+    for values in rows:
+        cells = table.add_row().cells
+        for cell, value in zip(cells, values):
+            cell.text = value
+    return table
+
+
+def synthetic_variants() -> dict[str, bytes]:
+    """Documents exercising the layouts the parsers must agree on."""
+    variants = {}
+
+    doc = Document()
+    doc.add_heading("Jane Doe", level=0)
+    _table(doc, [["Age", "67"], ["Gender", "Female"]])
+    _table(doc, [
+        ["Blood Pressure (Systolic)", "165", "mmHg"],
+        ["Blood Pressure (Diastolic)", "98", "mmHg"],
+        ["Heart Rate", "112", "bpm"],
+        ["Temperature", "38.9", "C"],
+        ["SpO2", "91", "%"],
+        ["Respiratory Rate", "24", "/min"],
+    ], cols=3)
+    _table(doc, [["Symptoms", "fever, cough , shortness of breath"], ["Conditions", "COPD, diabetes"]])
+    doc.add_heading("Patient Notes", level=1)
+    doc.add_paragraph("")
+    doc.add_paragraph("Worse over three days.")
+    variants["celsius_and_blank_notes_line"] = _save(doc)
+
+    doc = Document()
+    _table(doc, [["Patient Name", "John Smith"], ["Age", "not recorded"], ["Gender", "MALE"]])
+    _table(doc, [["Temperature", "101.2", "F"], ["Heart Rate", "n/a"]], cols=3)
+    doc.add_heading("Patient Notes", level=2)
+    p = doc.add_paragraph("Line one")
+    p.add_run().add_break()
+    p.add_run("line\ttwo")
+    variants["name_row_bad_numbers_breaks"] = _save(doc)
+
+    doc = Document()
+    doc.add_heading("Merged Cells", level=0)
+    table = _table(doc, [["Age", "45", ""], ["Gender", "other", ""], ["Symptoms", "", ""]], cols=3)
+    table.cell(2, 1).merge(table.cell(2, 2)).text = "headache, nausea"
+    table.cell(0, 2).merge(table.cell(1, 2))
+    outer = _table(doc, [["Conditions", "asthma"]])
+    outer.cell(0, 1).add_table(rows=1, cols=2).cell(0, 0).text = "Age"
+    variants["merged_and_nested_cells"] = _save(doc)
+
+    doc = Document()
+    doc.add_paragraph("No structure at all, just a note.")
+    variants["no_tables"] = _save(doc)
+
+    doc = Document()
+    doc.add_heading("Patient Record #2", level=0)
+    doc.add_heading("Patient Record #3", level=0)
+    doc.add_heading("Patient Notes", level=1)
+    doc.add_paragraph("First note")
+    doc.add_heading("Patient Notes (addendum)", level=1)
+    doc.add_paragraph("Second note")
+    variants["repeated_title_and_notes"] = _save(doc)
+
+    return variants
+
+
+def check_parity(documents: dict[str, bytes]) -> bool:
+    ok = True
+    for name, data in documents.items():
+        expected = parse_ehr_docx(data)
+        actual = parse_ehr_docx_stream(data)
+        if expected == actual:
+            print(f"  [ok]   {name}")
+        else:
+            ok = False
+            print(f"  [FAIL] {name}")
+            for key in expected:
+                if expected[key] != actual.get(key):
+                    print(f"         {key}: docx={expected[key]!r} stream={actual.get(key)!r}")
+    return ok
+
+
+def benchmark(data: bytes, iterations: int):
+    for label, parser in (("python-docx", parse_ehr_docx), ("stream", parse_ehr_docx_stream)):
+        parser(data)  # warm up
+        start = time.perf_counter()
+        for _ in range(iterations):
+            parser(data)
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<12} {elapsed / iterations * 1000:7.2f} ms/doc  {iterations / elapsed:8.1f} docs/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(SAMPLE_PATH, "rb") as f:
+        sample = f.read()
+
+    documents = {"Patient_Record_1.docx": sample, **synthetic_variants()}
+    print("Parity:")
+    ok = check_parity(documents)
+
+    print(f"\nThroughput on Patient_Record_1.docx ({args.iterations} iterations):")
+    benchmark(sample, args.iterations)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
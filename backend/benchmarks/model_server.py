@@ -0,0 +1,93 @@
+"""Throughput and memory: in-process models vs the shared model server.
+
+Starts N worker processes that each call predict_triage + predict_disease
+on single rows in a loop, the way run_triage does. This runs once with every
+worker loading its own models and once through a model server started for
+the run. Reports total predictions/s and the mean worker RSS.
+
+Usage (from backend/, with the trained models in saved_models/):
+    python -m benchmarks.model_server [--workers 8] [--seconds 10]
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import subprocess
+import sys
+import time
+
+SOCKET_PATH = "/tmp/medtriage-models-bench.sock"
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def worker(socket_path: str, seconds: float, results):
+    if socket_path:
+        os.environ["MODEL_SERVER_SOCKET"] = socket_path
+    import numpy as np
+    from app.models.disease_model import get_symptom_columns, predict_disease
+    from app.models.triage_model import predict_triage
+
+    rng = np.random.default_rng(os.getpid())
+    n_symptoms = len(get_symptom_columns())
+    triage_rows = np.column_stack([
+        rng.integers(1, 95, 256), rng.integers(50, 150, 256), rng.integers(80, 190, 256),
+        rng.integers(85, 100, 256), rng.uniform(36, 40, 256), rng.integers(0, 4, 256),
+    ]).astype(float)
+    symptom_rows = (rng.random((256, n_symptoms)) < 0.02).astype(float)
+
+    # Warm up (loads the models in local mode, connects in server mode)
+    predict_triage(triage_rows[:1])
+    predict_disease(symptom_rows[:1])
+
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        i = done % 256
+        predict_triage(triage_rows[i:i + 1])
+        predict_disease(symptom_rows[i:i + 1])
+        done += 1
+    results.put((done, rss_mb()))
+
+
+def run(workers: int, seconds: float, socket_path: str) -> tuple[float, float]:
+    results = mp.Queue()
+    procs = [mp.Process(target=worker, args=(socket_path, seconds, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    outcomes = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    total = sum(done for done, _ in outcomes)
+    return total / seconds, sum(rss for _, rss in outcomes) / workers
+
+
+def main(workers: int, seconds: float):
+    rate, rss = run(workers, seconds, "")
+    print(f"in-process:   {rate:9.0f} predictions/s  {rss:7.1f} MB RSS per worker")
+
+    server = subprocess.Popen([sys.executable, "-m", "app.services.model_server", "--socket", SOCKET_PATH])
+    try:
+        while not os.path.exists(SOCKET_PATH):
+            if server.poll() is not None:
+                raise SystemExit("model server failed to start")
+            time.sleep(0.1)
+        rate, rss = run(workers, seconds, SOCKET_PATH)
+        print(f"model server: {rate:9.0f} predictions/s  {rss:7.1f} MB RSS per worker")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+    main(args.workers, args.seconds)
@@ -0,0 +1,126 @@
+"""Surge load generator: triage latency while dashboards flood the API.
+
+Dashboard pollers hit best-effort reads in a tight loop while triage POSTs
+arrive at a fixed rate. Reports status counts and latency percentiles per
+endpoint, plus the admission metrics. Without --url the load runs in
+process against a stand-in app behind AdmissionMiddleware. That app
+handles requests like a saturated worker: each one gets slower as more run
+at once. Pass --no-admission to see the same surge without load shedding.
+
+Usage (from backend/):
+    python -m benchmarks.surge_load [--pollers 300 --triage-rps 20 --duration 10]
+    python -m benchmarks.surge_load --url http://localhost:8000
+"""
+
+import argparse
+import asyncio
+import time
+from collections import Counter, defaultdict
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+
+from app.utils.admission import AdmissionMiddleware
+from app.utils.metrics import render_prometheus
+
+POLL_PATHS = ["/api/dashboard/stats", "/api/analytics/daily", "/api/forecast/occupancy"]
+TRIAGE_BODY = {
+    "name": "Surge Patient",
+    "age": 45,
+    "gender": "Male",
+    "symptoms": ["chest pain", "shortness of breath"],
+    "vitals": {"heart_rate": 118, "blood_pressure": "150/95", "temperature": 99.1, "oxygen_saturation": 93},
+}
+
+# Stand-in worker: a request takes SERVICE_MS, stretched once more than CAPACITY run together
+SERVICE_MS = 20
+CAPACITY = 16
+
+
+def stand_in_app(admission: bool, max_in_flight: int):
+    app = FastAPI()
+    running = 0
+
+    async def work():
+        nonlocal running
+        running += 1
+        try:
+            await asyncio.sleep(SERVICE_MS / 1000 * max(1.0, running / CAPACITY))
+        finally:
+            running -= 1
+
+    @app.get("/api/{path:path}")
+    async def read(path: str):
+        await work()
+        return {"ok": True}
+
+    @app.post("/api/triage")
+    async def triage(body: dict):
+        await work()
+        return {"risk_level": "high"}
+
+    return AdmissionMiddleware(app, max_in_flight) if admission else app
+
+
+async def poller(client: httpx.AsyncClient, index: int, stop: float, results: dict):
+    path = POLL_PATHS[index % len(POLL_PATHS)]
+    while time.monotonic() < stop:
+        await request(client, "GET", path, results)
+
+
+async def request(client: httpx.AsyncClient, method: str, path: str, results: dict, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, path, **kwargs)
+        status = response.status_code
+        if status == 503:
+            # Honour Retry-After, capped so the surge keeps up its pressure
+            await asyncio.sleep(min(float(response.headers.get("retry-after", 1)), 1.0))
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    results[f"{method} {path}"].append((status, time.perf_counter() - start))
+
+
+async def main(url: str | None, pollers: int, triage_rps: float, duration: float, admission: bool, max_in_flight: int):
+    if url:
+        transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=pollers + 100))
+        base = url
+    else:
+        transport = httpx.ASGITransport(app=stand_in_app(admission, max_in_flight))
+        base = "http://surge"
+    results: dict[str, list] = defaultdict(list)
+
+    async with httpx.AsyncClient(transport=transport, base_url=base, timeout=30) as client:
+        stop = time.monotonic() + duration
+        tasks = [asyncio.create_task(poller(client, i, stop, results)) for i in range(pollers)]
+        triages = []
+        while time.monotonic() < stop:
+            triages.append(asyncio.create_task(request(client, "POST", "/api/triage", results, json=TRIAGE_BODY)))
+            await asyncio.sleep(1 / triage_rps)
+        await asyncio.gather(*tasks, *triages)
+        metrics = (await client.get("/metrics")).text if url else render_prometheus()
+
+    print(f"{pollers} pollers + {triage_rps:g} triage/s for {duration:g}s"
+          f" ({'remote ' + url if url else 'stand-in app, admission ' + ('on' if admission else 'off')})")
+    for endpoint, samples in sorted(results.items()):
+        statuses = Counter(status for status, _ in samples)
+        ok = np.array([seconds for status, seconds in samples if status == 200]) * 1000
+        latency = (f"p50 {np.percentile(ok, 50):7.1f} ms  p99 {np.percentile(ok, 99):7.1f} ms"
+                   if len(ok) else "no successful requests")
+        print(f"  {endpoint:32} {len(samples):7} req  {latency}  {dict(statuses)}")
+    for line in metrics.splitlines():
+        if line.startswith(("admission_shed_total", "admission_queue_seconds_sum", "admission_queue_seconds_count")):
+            print(f"  {line}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Run against a live server instead of the in-process stand-in")
+    parser.add_argument("--pollers", type=int, default=300)
+    parser.add_argument("--triage-rps", type=float, default=20.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--no-admission", action="store_true")
+    parser.add_argument("--max-in-flight", type=int, default=CAPACITY)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.pollers, args.triage_rps, args.duration, not args.no_admission, args.max_in_flight))
@@ -0,0 +1,105 @@
+"""Latency budget for model-attributed contributing factors.
+
+Times the triage stages of run_triage (prediction plus contributing factors)
+over varied intakes, once the old way (predict + predict_proba, rule-based
+factors) and once the current way (one pred_contribs pass, model-attributed
+factors), both uncached and cached. Exits non-zero when the uncached median
+overhead exceeds TRIAGE_ATTRIBUTION_BUDGET_MS. The whole triage_intake path
+has its own budget, checked by tests/test_triage_latency.py.
+
+Usage (from backend/, with the trained model in saved_models/):
+    python -m benchmarks.triage_latency [--requests 500]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from app.models import triage_model
+from app.utils.feature_engineering import compute_contributing_factors, prepare_triage_features
+
+TRIAGE_ATTRIBUTION_BUDGET_MS = float(os.getenv("TRIAGE_ATTRIBUTION_BUDGET_MS", "2"))
+
+
+def intakes(n: int) -> list[dict]:
+    rng = np.random.default_rng(42)
+    return [
+        {
+            "age": int(rng.integers(1, 95)),
+            "heart_rate": int(rng.integers(45, 160)),
+            "systolic_bp": int(rng.integers(80, 200)),
+            "diastolic_bp": int(rng.integers(50, 120)),
+            "oxygen_saturation": int(rng.integers(82, 100)),
+            "temperature_f": round(float(rng.uniform(96, 104)), 1),
+            "respiratory_rate": int(rng.integers(10, 30)),
+            "chronic": int(rng.integers(0, 4)),
+        }
+        for _ in range(n)
+    ]
+
+
+def old_path(intake: dict):
+    features = prepare_triage_features(
+        intake["age"], intake["heart_rate"], intake["systolic_bp"],
+        intake["oxygen_saturation"], intake["temperature_f"], intake["chronic"],
+    )
+    model = triage_model.get_model()
+    model.predict(features)
+    model.predict_proba(features)
+    compute_contributing_factors(
+        intake["heart_rate"], intake["systolic_bp"], intake["diastolic_bp"], intake["temperature_f"],
+        intake["oxygen_saturation"], intake["respiratory_rate"], intake["age"],
+    )
+
+
+def new_path(intake: dict):
+    features = prepare_triage_features(
+        intake["age"], intake["heart_rate"], intake["systolic_bp"],
+        intake["oxygen_saturation"], intake["temperature_f"], intake["chronic"],
+    )
+    result = triage_model.predict_triage(features)
+    compute_contributing_factors(
+        intake["heart_rate"], intake["systolic_bp"], intake["diastolic_bp"], intake["temperature_f"],
+        intake["oxygen_saturation"], intake["respiratory_rate"], intake["age"],
+        feature_contributions=result["feature_contributions"], chronic_disease_count=intake["chronic"],
+    )
+
+
+def median_ms(fn, samples: list[dict]) -> float:
+    timings = []
+    for intake in samples:
+        start = time.perf_counter()
+        fn(intake)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main(requests: int) -> int:
+    samples = intakes(requests)
+    triage_model.get_model()
+    old_path(samples[0])  # warm up
+
+    old = median_ms(old_path, samples)
+    triage_model._cache.clear()
+    new = median_ms(new_path, samples)
+    cached = median_ms(new_path, samples)
+
+    print(f"rule-based factors:      {old:7.3f} ms median")
+    print(f"model factors, uncached: {new:7.3f} ms median ({new - old:+.3f} ms)")
+    print(f"model factors, cached:   {cached:7.3f} ms median")
+    if new - old > TRIAGE_ATTRIBUTION_BUDGET_MS:
+        print(f"FAIL: overhead exceeds the {TRIAGE_ATTRIBUTION_BUDGET_MS} ms budget")
+        return 1
+    print(f"OK: within the {TRIAGE_ATTRIBUTION_BUDGET_MS} ms budget")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    sys.exit(main(args.requests))
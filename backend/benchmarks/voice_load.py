@@ -0,0 +1,64 @@
+"""Load benchmark for streaming voice transcription.
+
+Runs many concurrent transcription sessions against the configured backend
+(TRANSCRIBE_BACKEND, "local" by default) the same way the /voice endpoints
+drive them, and reports throughput plus the worst event-loop stall seen.
+
+Usage (from backend/):
+    LOCAL_TRANSCRIBE_MS_PER_AUDIO_SECOND=50 python -m benchmarks.voice_load [--sessions 200]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from app.services.transcription import AUDIO_BYTES_PER_SECOND, AsyncTranscription
+
+CHUNK_BYTES = 32 * 1024
+
+
+async def run_session(audio: bytes) -> int:
+    transcription = AsyncTranscription()
+    partials = 0
+    for start in range(0, len(audio), CHUNK_BYTES):
+        if await transcription.feed(audio[start:start + CHUNK_BYTES]) is not None:
+            partials += 1
+    await transcription.finish()
+    return partials
+
+
+async def watch_loop(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Largest delay between scheduled wake-ups, i.e. how long the loop was blocked."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def main(sessions: int, seconds: float):
+    recordings = [os.urandom(int(seconds * AUDIO_BYTES_PER_SECOND)) for _ in range(sessions)]
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop(stop))
+
+    start = time.perf_counter()
+    partials = await asyncio.gather(*(run_session(audio) for audio in recordings))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    worst_stall = await watcher
+
+    audio_seconds = sessions * seconds
+    print(f"{sessions} sessions x {seconds:.0f}s audio in {elapsed:.2f}s")
+    print(f"  {sessions / elapsed:8.1f} sessions/s  {audio_seconds / elapsed:8.1f} audio-s/s")
+    print(f"  {sum(partials) / sessions:8.1f} partials/session")
+    print(f"  {worst_stall * 1000:8.1f} ms worst event-loop stall")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.sessions, args.seconds))
@@ -0,0 +1,79 @@
+-- Beds: occupancy and assignment history change together
+--
+-- The bed index (app/services/bed_index.py) used to flip `beds` with a
+-- conditional PATCH and then write `bed_assignments` in a second request,
+-- undoing the first on failure. A crash or a failed undo in between left a
+-- bed occupied with no history row. These functions make each move one
+-- transaction. A bed that is not in the expected state raises PT409 (HTTP
+-- 409 Conflict), an unknown bed PT404.
+--
+-- A patient holds at most one bed, enforced by the unique indexes below;
+-- occupy_bed() reports it with HINT 'patient_has_bed'. The indexes fail to
+-- build if a patient already holds two beds: release one of them first.
+
+-- 0. One bed per patient
+CREATE UNIQUE INDEX IF NOT EXISTS idx_beds_one_per_patient
+    ON beds(current_patient_id) WHERE is_occupied AND current_patient_id IS NOT NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bed_assignments_open
+    ON bed_assignments(patient_id) WHERE discharged_at IS NULL;
+
+-- 1. Occupy a free bed and open its assignment
+CREATE OR REPLACE FUNCTION occupy_bed(p_bed_id UUID, p_patient_id UUID)
+RETURNS SETOF beds
+LANGUAGE plpgsql VOLATILE AS $$
+DECLARE
+    v_bed beds;
+    v_held TEXT;
+BEGIN
+    SELECT * INTO v_bed FROM beds WHERE id = p_bed_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Bed % not found', p_bed_id USING ERRCODE = 'PT404';
+    END IF;
+    IF v_bed.is_occupied THEN
+        RAISE EXCEPTION 'Bed was assigned by someone else' USING ERRCODE = 'PT409';
+    END IF;
+    -- A concurrent occupy for the same patient is caught by the unique indexes
+    SELECT bed_number INTO v_held FROM beds
+    WHERE current_patient_id = p_patient_id AND is_occupied;
+    IF FOUND THEN
+        RAISE EXCEPTION 'Patient already holds bed %', v_held
+            USING ERRCODE = 'PT409', HINT = 'patient_has_bed';
+    END IF;
+
+    UPDATE beds SET is_occupied = TRUE, current_patient_id = p_patient_id
+    WHERE id = p_bed_id
+    RETURNING * INTO v_bed;
+    INSERT INTO bed_assignments (bed_id, patient_id) VALUES (p_bed_id, p_patient_id);
+    RETURN NEXT v_bed;
+END;
+$$;
+
+-- 2. Free a bed held by a patient and close its assignment
+CREATE OR REPLACE FUNCTION vacate_bed(p_bed_id UUID, p_patient_id UUID)
+RETURNS SETOF beds
+LANGUAGE plpgsql VOLATILE AS $$
+DECLARE
+    v_bed beds;
+BEGIN
+    UPDATE beds SET is_occupied = FALSE, current_patient_id = NULL
+    WHERE id = p_bed_id AND is_occupied AND current_patient_id = p_patient_id
+    RETURNING * INTO v_bed;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Bed is not occupied by this patient' USING ERRCODE = 'PT409';
+    END IF;
+    UPDATE bed_assignments SET discharged_at = NOW()
+    WHERE bed_id = p_bed_id AND patient_id = p_patient_id AND discharged_at IS NULL;
+    RETURN NEXT v_bed;
+END;
+$$;
+
+-- 3. Move a patient between beds: both beds change or neither does
+CREATE OR REPLACE FUNCTION transfer_bed(p_patient_id UUID, p_from_bed_id UUID, p_to_bed_id UUID)
+RETURNS SETOF beds
+LANGUAGE plpgsql VOLATILE AS $$
+BEGIN
+    -- Old bed first, so the one-bed-per-patient check and indexes hold
+    RETURN QUERY SELECT * FROM vacate_bed(p_from_bed_id, p_patient_id);
+    RETURN QUERY SELECT * FROM occupy_bed(p_to_bed_id, p_patient_id);
+END;
+$$;
@@ -0,0 +1,31 @@
+-- EHR import jobs: resumable parse → triage → persist pipeline
+
+-- 1. Import Jobs
+CREATE TABLE ehr_import_jobs (
+    id              UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    status          VARCHAR(20) NOT NULL DEFAULT 'queued',  -- queued, running, completed, failed
+    total           INTEGER NOT NULL DEFAULT 0,
+    completed       INTEGER NOT NULL DEFAULT 0,             -- documents triaged and saved
+    failed          INTEGER NOT NULL DEFAULT 0,             -- documents that could not be imported
+    error           TEXT,                                   -- why the job stopped, if it did
+    created_at      TIMESTAMP DEFAULT NOW(),
+    started_at      TIMESTAMP,
+    finished_at     TIMESTAMP,
+    updated_at      TIMESTAMP DEFAULT NOW()
+);
+
+-- 2. Import Items
+-- One row per uploaded document. patient_code is assigned up front so a
+-- resumed job recognises patients it already created.
+CREATE TABLE ehr_import_items (
+    job_id          UUID NOT NULL REFERENCES ehr_import_jobs(id) ON DELETE CASCADE,
+    item_index      INTEGER NOT NULL,
+    filename        VARCHAR(500) NOT NULL,
+    patient_code    VARCHAR(20) NOT NULL,
+    status          VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending, done, failed
+    error           TEXT,
+    PRIMARY KEY (job_id, item_index)
+);
+
+CREATE INDEX idx_import_jobs_active ON ehr_import_jobs(status) WHERE status IN ('queued', 'running');
+CREATE INDEX idx_import_items_pending ON ehr_import_items(job_id) WHERE status = 'pending';
@@ -0,0 +1,9 @@
+-- EHR import jobs: single-worker leases
+--
+-- Every API worker resumes active jobs on startup, so a job is only run by
+-- the worker that holds its lease. A worker claims a job with a conditional
+-- update (no owner, its own, or an expired lease) and renews the lease with
+-- every progress update; a worker that finds the lease gone stops the job.
+
+ALTER TABLE ehr_import_jobs ADD COLUMN IF NOT EXISTS owner TEXT;              -- '<host>:<pid>' running the job
+ALTER TABLE ehr_import_jobs ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP;
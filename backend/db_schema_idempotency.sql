@@ -0,0 +1,17 @@
+-- Idempotency keys for retried POSTs (app/services/idempotency.py)
+--
+-- A row is claimed ('processing') by the first request with a key and
+-- completed with its response. Rows older than IDEMPOTENCY_TTL_SECONDS are
+-- reclaimed in place by the next request using the key; prune old rows with
+--   DELETE FROM idempotency_keys WHERE created_at < NOW() - INTERVAL '7 days';
+
+CREATE TABLE idempotency_keys (
+    key             VARCHAR(255) PRIMARY KEY,               -- "<scope>:<Idempotency-Key>"
+    request_hash    CHAR(64) NOT NULL,                      -- SHA-256 of the request body
+    status          VARCHAR(20) NOT NULL DEFAULT 'processing', -- processing, completed, failed
+    response        JSONB,
+    created_at      TIMESTAMP DEFAULT NOW(),
+    completed_at    TIMESTAMP
+);
+
+CREATE INDEX idx_idempotency_keys_created ON idempotency_keys(created_at);
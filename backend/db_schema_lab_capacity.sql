@@ -0,0 +1,68 @@
+-- Lab Scheduling: slot capacity enforced by the database
+--
+-- Each API worker picks slots from its own in-memory calendars
+-- (app/services/lab_scheduler.py), which can lag behind bookings made by
+-- other workers. A pending booking holds one numbered seat of its slot, and
+-- a seat can only be held once, so a slot can never take more than
+-- `capacity_per_slot` pending bookings. book_lab_slots() is the only way
+-- bookings are created.
+
+-- 1. Seat within the slot
+ALTER TABLE lab_bookings ADD COLUMN IF NOT EXISTS seat SMALLINT;
+
+-- Existing pending bookings take seats in booking order
+UPDATE lab_bookings lb
+SET seat = numbered.seat
+FROM (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY lab_id, scheduled_at ORDER BY booking_time, id) AS seat
+    FROM lab_bookings
+    WHERE status = 'pending' AND scheduled_at IS NOT NULL
+) numbered
+WHERE lb.id = numbered.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_lab_bookings_seat
+    ON lab_bookings(lab_id, scheduled_at, seat) WHERE status = 'pending';
+
+-- 2. Book a batch of slots, all or nothing
+-- Each booking takes the lowest free seat of its slot. If a slot is full the
+-- whole batch is rolled back and PostgREST answers 409 Conflict.
+CREATE OR REPLACE FUNCTION book_lab_slots(p_bookings JSONB)
+RETURNS SETOF lab_bookings
+LANGUAGE plpgsql VOLATILE AS $$
+DECLARE
+    b RECORD;
+    v_capacity INTEGER;
+    v_seat INTEGER;
+    v_row lab_bookings;
+BEGIN
+    FOR b IN
+        SELECT * FROM jsonb_to_recordset(p_bookings)
+            AS r(lab_id UUID, patient_id UUID, scheduled_at TIMESTAMPTZ, risk_level TEXT)
+    LOOP
+        SELECT capacity_per_slot INTO v_capacity FROM labs WHERE id = b.lab_id;
+        LOOP
+            SELECT s INTO v_seat
+            FROM generate_series(1, COALESCE(v_capacity, 0)) AS s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM lab_bookings lb
+                WHERE lb.lab_id = b.lab_id AND lb.scheduled_at = b.scheduled_at
+                  AND lb.status = 'pending' AND lb.seat = s
+            )
+            ORDER BY s
+            LIMIT 1;
+            IF v_seat IS NULL THEN
+                RAISE EXCEPTION 'Lab slot % is full', b.scheduled_at USING ERRCODE = 'PT409';
+            END IF;
+            BEGIN
+                INSERT INTO lab_bookings (lab_id, patient_id, status, scheduled_at, risk_level, seat)
+                VALUES (b.lab_id, b.patient_id, 'pending', b.scheduled_at, COALESCE(b.risk_level, 'low'), v_seat)
+                RETURNING * INTO v_row;
+                RETURN NEXT v_row;
+                EXIT;
+            EXCEPTION WHEN unique_violation THEN
+                NULL;  -- taken by a concurrent booking; try the next free seat
+            END;
+        END LOOP;
+    END LOOP;
+END;
+$$;
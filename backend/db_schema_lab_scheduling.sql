@@ -0,0 +1,17 @@
+-- Lab Scheduling: slot capacity for labs and scheduled slots for bookings
+
+-- 1. Lab capacity (slot length and how many patients one slot can take)
+ALTER TABLE labs ADD COLUMN IF NOT EXISTS slot_minutes INTEGER NOT NULL DEFAULT 15;
+ALTER TABLE labs ADD COLUMN IF NOT EXISTS capacity_per_slot INTEGER NOT NULL DEFAULT 2;
+
+-- 2. Booking slot and the triage risk it was prioritised with
+ALTER TABLE lab_bookings ADD COLUMN IF NOT EXISTS scheduled_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE lab_bookings ADD COLUMN IF NOT EXISTS risk_level TEXT DEFAULT 'low';
+
+-- 3. Index for loading upcoming bookings into the scheduler
+CREATE INDEX IF NOT EXISTS idx_lab_bookings_upcoming ON lab_bookings(lab_id, scheduled_at) WHERE status = 'pending';
+
+-- 4. Seed capacities
+UPDATE labs SET slot_minutes = 30, capacity_per_slot = 1 WHERE name = 'MRI Scanner';
+UPDATE labs SET slot_minutes = 10, capacity_per_slot = 2 WHERE name = 'X-Ray Room 1';
+UPDATE labs SET slot_minutes = 5,  capacity_per_slot = 4 WHERE type = 'pathology';
@@ -0,0 +1,17 @@
+-- Patient codes: leased blocks of a sequence
+--
+-- Each API worker leases a block of codes at a time and hands them out from
+-- memory (app/services/patient_codes.py). The block size is the sequence's
+-- INCREMENT, so it is defined in one place and leases can never overlap.
+-- To change it: ALTER SEQUENCE patient_code_seq INCREMENT BY <n>;
+
+CREATE SEQUENCE IF NOT EXISTS patient_code_seq START WITH 1 INCREMENT BY 100;
+
+-- Returns the first code number of a fresh block and the block's size
+CREATE OR REPLACE FUNCTION lease_patient_codes()
+RETURNS TABLE (block_start BIGINT, block_size BIGINT)
+LANGUAGE sql VOLATILE AS $$
+    SELECT nextval('patient_code_seq'), s.increment_by
+    FROM pg_sequences s
+    WHERE s.schemaname = current_schema() AND s.sequencename = 'patient_code_seq';
+$$;
@@ -0,0 +1,7 @@
+-- Repeat-vitals re-triage (POST /api/patients/{patient_code}/vitals)
+--
+-- The disease model's own confidence is kept next to the combined one, so a
+-- re-triage that reuses the stored disease prediction can recombine it with
+-- the new triage confidence without running the disease model again.
+
+ALTER TABLE triage_results ADD COLUMN IF NOT EXISTS disease_confidence INTEGER;  -- 0-100
@@ -0,0 +1,57 @@
+-- Repeat-vitals re-triage: one transaction per save
+--
+-- A re-triage appends an intake, updates the triage in place and replaces
+-- its contributing factors (app/routes/triage.py, _save_retriage). Sent as
+-- separate requests, a failure after the old factors were deleted left the
+-- triage with none. save_retriage() does all of it or nothing.
+
+CREATE OR REPLACE FUNCTION save_retriage(
+    p_triage_id UUID,
+    p_intake JSONB,
+    p_triage JSONB,
+    p_factors JSONB DEFAULT '[]'
+)
+RETURNS UUID
+LANGUAGE plpgsql VOLATILE AS $$
+DECLARE
+    v_intake_id UUID;
+BEGIN
+    INSERT INTO patient_intakes (
+        patient_id, blood_pressure_systolic, blood_pressure_diastolic, heart_rate,
+        temperature, oxygen_saturation, respiratory_rate, symptoms, conditions, notes, intake_method
+    )
+    SELECT r.patient_id, r.blood_pressure_systolic, r.blood_pressure_diastolic, r.heart_rate,
+           r.temperature, r.oxygen_saturation, r.respiratory_rate,
+           COALESCE(r.symptoms, '{}'), COALESCE(r.conditions, '{}'), COALESCE(r.notes, ''), r.intake_method
+    FROM jsonb_populate_record(NULL::patient_intakes, p_intake) r
+    RETURNING id INTO v_intake_id;
+
+    UPDATE triage_results t
+    SET risk_level = r.risk_level,
+        priority_score = r.priority_score,
+        triage_level = r.triage_level,
+        confidence = r.confidence,
+        predicted_disease = r.predicted_disease,
+        disease_confidence = r.disease_confidence,
+        department_id = r.department_id,
+        waiting_time = r.waiting_time,
+        estimated_los_days = r.estimated_los_days,
+        los_confidence = r.los_confidence,
+        is_escalated = t.is_escalated OR COALESCE(r.is_escalated, FALSE),
+        intake_id = v_intake_id,
+        updated_at = NOW()
+    FROM jsonb_populate_record(NULL::triage_results, p_triage) r
+    WHERE t.id = p_triage_id;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Triage % not found', p_triage_id USING ERRCODE = 'PT404';
+    END IF;
+
+    DELETE FROM contributing_factors WHERE triage_id = p_triage_id;
+    INSERT INTO contributing_factors (triage_id, name, value, impact, is_positive, sort_order)
+    SELECT p_triage_id, f.name, f.value, f.impact, f.is_positive, f.sort_order
+    FROM jsonb_to_recordset(p_factors)
+        AS f(name VARCHAR(100), value VARCHAR(100), impact INTEGER, is_positive BOOLEAN, sort_order INTEGER);
+
+    RETURN v_intake_id;
+END;
+$$;
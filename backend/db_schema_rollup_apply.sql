@@ -0,0 +1,145 @@
+-- Rollups: single-runner lease and atomic batch commits
+--
+-- Every API worker starts the rollup loop (app/services/rollup.py), but only
+-- the holder of the 'rollup' lease runs a cycle. Each folded batch is then
+-- committed by rollup_apply() in one transaction: the stats deltas are added
+-- and the watermark advanced together, and only if the watermark is still
+-- where the batch was read from. A batch is never counted twice, even if
+-- the lease changes hands mid-cycle or a call fails halfway.
+
+-- 1. Worker Leases
+CREATE TABLE worker_leases (
+    name        TEXT PRIMARY KEY,           -- 'rollup'
+    owner       TEXT NOT NULL,              -- '<host>:<pid>' of the holder
+    expires_at  TIMESTAMP NOT NULL
+);
+
+-- Take or renew a lease. Returns TRUE if p_owner holds it afterwards.
+CREATE OR REPLACE FUNCTION try_worker_lease(p_name TEXT, p_owner TEXT, p_ttl_seconds INTEGER)
+RETURNS BOOLEAN
+LANGUAGE plpgsql VOLATILE AS $$
+BEGIN
+    INSERT INTO worker_leases (name, owner, expires_at)
+    VALUES (p_name, p_owner, NOW() + make_interval(secs => p_ttl_seconds))
+    ON CONFLICT (name) DO UPDATE
+        SET owner = EXCLUDED.owner, expires_at = EXCLUDED.expires_at
+        WHERE worker_leases.owner = EXCLUDED.owner OR worker_leases.expires_at < NOW();
+    RETURN FOUND;
+END;
+$$;
+
+-- 2. Atomic batch commit
+-- Deltas carry a batch's counts and its own averages; averages are merged
+-- weighted by patient counts. Returns FALSE (and changes nothing) if the
+-- watermark is no longer at (p_expected_ts, p_expected_id).
+CREATE OR REPLACE FUNCTION rollup_apply(
+    p_name TEXT,
+    p_expected_ts TIMESTAMP,
+    p_expected_id UUID,
+    p_last_ts TIMESTAMP,
+    p_last_id UUID,
+    p_hourly JSONB DEFAULT '[]',
+    p_daily JSONB DEFAULT '[]',
+    p_performance JSONB DEFAULT '[]'
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql VOLATILE AS $$
+BEGIN
+    INSERT INTO rollup_watermarks (name, last_ts, last_id)
+    VALUES (p_name, '1970-01-01', NULL)
+    ON CONFLICT (name) DO NOTHING;
+
+    UPDATE rollup_watermarks
+    SET last_ts = p_last_ts, last_id = p_last_id, updated_at = NOW()
+    WHERE name = p_name
+      AND last_ts = p_expected_ts
+      AND last_id IS NOT DISTINCT FROM p_expected_id;
+    IF NOT FOUND THEN
+        RETURN FALSE;
+    END IF;
+
+    INSERT INTO hourly_stats AS h
+        (stat_date, stat_hour, total_patients, high_risk, medium_risk, low_risk, avg_wait_time, recorded_at)
+    SELECT stat_date, stat_hour, total_patients, high_risk, medium_risk, low_risk, avg_wait_time, NOW()
+    FROM jsonb_to_recordset(p_hourly) AS r(
+        stat_date DATE, stat_hour INTEGER, total_patients INTEGER,
+        high_risk INTEGER, medium_risk INTEGER, low_risk INTEGER, avg_wait_time FLOAT
+    )
+    ON CONFLICT (stat_date, stat_hour) DO UPDATE SET
+        total_patients = COALESCE(h.total_patients, 0) + EXCLUDED.total_patients,
+        high_risk = COALESCE(h.high_risk, 0) + EXCLUDED.high_risk,
+        medium_risk = COALESCE(h.medium_risk, 0) + EXCLUDED.medium_risk,
+        low_risk = COALESCE(h.low_risk, 0) + EXCLUDED.low_risk,
+        avg_wait_time = ROUND(((COALESCE(h.avg_wait_time, 0) * COALESCE(h.total_patients, 0)
+                                + EXCLUDED.avg_wait_time * EXCLUDED.total_patients)
+                               / NULLIF(COALESCE(h.total_patients, 0) + EXCLUDED.total_patients, 0))::NUMERIC, 2),
+        recorded_at = NOW();
+
+    INSERT INTO daily_stats AS d
+        (stat_date, total_patients, high_risk_count, medium_risk_count, low_risk_count,
+         avg_wait_time, avg_priority_score, recorded_at)
+    SELECT stat_date, total_patients, high_risk_count, medium_risk_count, low_risk_count,
+           avg_wait_time, avg_priority_score, NOW()
+    FROM jsonb_to_recordset(p_daily) AS r(
+        stat_date DATE, total_patients INTEGER, high_risk_count INTEGER, medium_risk_count INTEGER,
+        low_risk_count INTEGER, avg_wait_time FLOAT, avg_priority_score FLOAT
+    )
+    ON CONFLICT (stat_date) DO UPDATE SET
+        total_patients = COALESCE(d.total_patients, 0) + EXCLUDED.total_patients,
+        high_risk_count = COALESCE(d.high_risk_count, 0) + EXCLUDED.high_risk_count,
+        medium_risk_count = COALESCE(d.medium_risk_count, 0) + EXCLUDED.medium_risk_count,
+        low_risk_count = COALESCE(d.low_risk_count, 0) + EXCLUDED.low_risk_count,
+        avg_wait_time = ROUND(((COALESCE(d.avg_wait_time, 0) * COALESCE(d.total_patients, 0)
+                                + EXCLUDED.avg_wait_time * EXCLUDED.total_patients)
+                               / NULLIF(COALESCE(d.total_patients, 0) + EXCLUDED.total_patients, 0))::NUMERIC, 2),
+        avg_priority_score = ROUND(((COALESCE(d.avg_priority_score, 0) * COALESCE(d.total_patients, 0)
+                                     + EXCLUDED.avg_priority_score * EXCLUDED.total_patients)
+                                    / NULLIF(COALESCE(d.total_patients, 0) + EXCLUDED.total_patients, 0))::NUMERIC, 2),
+        recorded_at = NOW();
+
+    INSERT INTO department_performance AS p
+        (department_id, stat_date, patients_seen, avg_treatment_time, efficiency_pct, recorded_at)
+    SELECT department_id, stat_date, patients_seen, avg_treatment_time, efficiency_pct, NOW()
+    FROM jsonb_to_recordset(p_performance) AS r(
+        department_id VARCHAR(50), stat_date DATE, patients_seen INTEGER,
+        avg_treatment_time FLOAT, efficiency_pct FLOAT
+    )
+    ON CONFLICT (department_id, stat_date) DO UPDATE SET
+        patients_seen = COALESCE(p.patients_seen, 0) + EXCLUDED.patients_seen,
+        avg_treatment_time = ROUND(((COALESCE(p.avg_treatment_time, 0) * COALESCE(p.patients_seen, 0)
+                                     + EXCLUDED.avg_treatment_time * EXCLUDED.patients_seen)
+                                    / NULLIF(COALESCE(p.patients_seen, 0) + EXCLUDED.patients_seen, 0))::NUMERIC, 2),
+        efficiency_pct = ROUND(((COALESCE(p.efficiency_pct, 0) * COALESCE(p.patients_seen, 0)
+                                 + EXCLUDED.efficiency_pct * EXCLUDED.patients_seen)
+                                / NULLIF(COALESCE(p.patients_seen, 0) + EXCLUDED.patients_seen, 0))::NUMERIC, 1),
+        recorded_at = NOW();
+
+    RETURN TRUE;
+END;
+$$;
+
+-- 3. Outcome counts
+-- Discharges, escalations and transfers happen after a triage is created, so
+-- they are recounted from triage_results for recent days rather than folded.
+CREATE OR REPLACE FUNCTION rollup_refresh_outcomes(p_since DATE)
+RETURNS INTEGER
+LANGUAGE sql VOLATILE AS $$
+    WITH outcomes AS (
+        SELECT created_at::DATE AS stat_date,
+               COUNT(*) FILTER (WHERE discharged_at IS NOT NULL) AS discharged,
+               COUNT(*) FILTER (WHERE is_escalated) AS escalated,
+               COUNT(*) FILTER (WHERE transferred_to IS NOT NULL) AS transferred
+        FROM triage_results
+        WHERE created_at >= p_since
+        GROUP BY 1
+    ), updated AS (
+        UPDATE daily_stats d
+        SET total_discharged = o.discharged,
+            total_escalated = o.escalated,
+            total_transferred = o.transferred
+        FROM outcomes o
+        WHERE d.stat_date = o.stat_date
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$;
@@ -0,0 +1,22 @@
+-- Rollups: database-stamped cursor for the created stream
+--
+-- The rollup worker (app/services/rollup.py) reads new triage_results past a
+-- watermark. It used to page on created_at, but writes spooled during a
+-- Supabase outage (app/db/write_spool.py) are replayed later with their
+-- original created_at, which is by then behind the watermark, so they never
+-- reached hourly_stats or daily_stats. ingested_at is set by the database
+-- when the row actually lands and is never sent by the app, so replayed rows
+-- show up past the watermark. created_at still decides the stats bucket.
+
+-- 1. Ingest time
+ALTER TABLE triage_results ADD COLUMN IF NOT EXISTS ingested_at TIMESTAMP;
+
+-- Existing rows keep their creation time, so the 'triage_created' watermark
+-- (a created_at until now) carries over without refolding anything
+UPDATE triage_results SET ingested_at = created_at WHERE ingested_at IS NULL;
+
+ALTER TABLE triage_results ALTER COLUMN ingested_at SET DEFAULT NOW();
+ALTER TABLE triage_results ALTER COLUMN ingested_at SET NOT NULL;
+
+-- 2. Index supporting the created-stream scan
+CREATE INDEX IF NOT EXISTS idx_triage_ingested ON triage_results(ingested_at, id);
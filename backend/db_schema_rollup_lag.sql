@@ -0,0 +1,49 @@
+-- Rollups: database clock for the attended stream and the read cutoff
+--
+-- attended_at is stamped by whichever API worker marked the patient, so
+-- clock skew between workers let a row land behind the 'triage_attended'
+-- watermark and never be folded. attended_recorded_at is stamped by the
+-- database instead and is what the stream pages on.
+--
+-- Cursor timestamps are taken when a transaction starts, so a row can
+-- commit after rows with later timestamps were already folded. The worker
+-- therefore only reads rows older than rollup_cutoff(), a lag measured on
+-- the database clock (ROLLUP_LAG_SECONDS in app/services/rollup.py).
+
+-- 1. Attended time, database clock
+ALTER TABLE triage_results ADD COLUMN IF NOT EXISTS attended_recorded_at TIMESTAMP;
+
+-- Existing rows keep attended_at, so the watermark carries over
+UPDATE triage_results SET attended_recorded_at = attended_at
+WHERE attended_at IS NOT NULL AND attended_recorded_at IS NULL;
+
+CREATE OR REPLACE FUNCTION stamp_attended_recorded_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF NEW.attended_at IS NULL THEN
+        NEW.attended_recorded_at := NULL;
+    ELSIF TG_OP = 'INSERT' OR OLD.attended_at IS NULL THEN
+        NEW.attended_recorded_at := NOW();
+    ELSE
+        NEW.attended_recorded_at := OLD.attended_recorded_at;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_triage_attended_recorded_at ON triage_results;
+CREATE TRIGGER trg_triage_attended_recorded_at
+    BEFORE INSERT OR UPDATE OF attended_at ON triage_results
+    FOR EACH ROW EXECUTE FUNCTION stamp_attended_recorded_at();
+
+CREATE INDEX IF NOT EXISTS idx_triage_attended_recorded ON triage_results(attended_recorded_at, id)
+    WHERE attended_recorded_at IS NOT NULL;
+
+-- 2. Read cutoff
+-- Same time base as TIMESTAMP columns defaulting to NOW()
+CREATE OR REPLACE FUNCTION rollup_cutoff(p_lag_seconds INTEGER)
+RETURNS TIMESTAMP
+LANGUAGE sql STABLE AS $$
+    SELECT LOCALTIMESTAMP - make_interval(secs => p_lag_seconds);
+$$;
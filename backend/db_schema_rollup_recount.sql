@@ -0,0 +1,65 @@
+-- Rollups: recount risk classes changed by re-triage
+--
+-- A repeat-vitals re-triage (save_retriage, db_schema_retriage_apply.sql)
+-- changes risk_level and priority_score in place, after the triage may
+-- already have been folded into hourly_stats and daily_stats. Like the
+-- outcome counts, the risk split and average priority of recent days are
+-- now recounted on every cycle. Only rows already folded (at or before the
+-- 'triage_created' watermark) are counted, so the totals they are split
+-- from stay consistent; later rows arrive through rollup_apply() as before.
+
+CREATE OR REPLACE FUNCTION rollup_refresh_outcomes(p_since DATE)
+RETURNS INTEGER
+LANGUAGE sql VOLATILE AS $$
+    WITH outcomes AS (
+        SELECT created_at::DATE AS stat_date,
+               COUNT(*) FILTER (WHERE discharged_at IS NOT NULL) AS discharged,
+               COUNT(*) FILTER (WHERE is_escalated) AS escalated,
+               COUNT(*) FILTER (WHERE transferred_to IS NOT NULL) AS transferred
+        FROM triage_results
+        WHERE created_at >= p_since
+        GROUP BY 1
+    ), folded AS (
+        SELECT tr.created_at, tr.risk_level, tr.priority_score
+        FROM triage_results tr
+        JOIN rollup_watermarks w ON w.name = 'triage_created'
+        WHERE tr.created_at >= p_since
+          AND (tr.ingested_at < w.last_ts OR (tr.ingested_at = w.last_ts AND tr.id <= w.last_id))
+    ), daily_risks AS (
+        SELECT created_at::DATE AS stat_date,
+               COUNT(*) FILTER (WHERE risk_level = 'high') AS high,
+               COUNT(*) FILTER (WHERE risk_level = 'medium') AS medium,
+               COUNT(*) FILTER (WHERE risk_level = 'low') AS low,
+               ROUND(AVG(priority_score)::NUMERIC, 2) AS avg_priority
+        FROM folded
+        GROUP BY 1
+    ), hourly_risks AS (
+        SELECT created_at::DATE AS stat_date,
+               EXTRACT(HOUR FROM created_at)::INTEGER AS stat_hour,
+               COUNT(*) FILTER (WHERE risk_level = 'high') AS high,
+               COUNT(*) FILTER (WHERE risk_level = 'medium') AS medium,
+               COUNT(*) FILTER (WHERE risk_level = 'low') AS low
+        FROM folded
+        GROUP BY 1, 2
+    ), updated_hourly AS (
+        UPDATE hourly_stats h
+        SET high_risk = r.high, medium_risk = r.medium, low_risk = r.low
+        FROM hourly_risks r
+        WHERE h.stat_date = r.stat_date AND h.stat_hour = r.stat_hour
+        RETURNING 1
+    ), updated AS (
+        UPDATE daily_stats d
+        SET total_discharged = o.discharged,
+            total_escalated = o.escalated,
+            total_transferred = o.transferred,
+            high_risk_count = COALESCE(r.high, d.high_risk_count),
+            medium_risk_count = COALESCE(r.medium, d.medium_risk_count),
+            low_risk_count = COALESCE(r.low, d.low_risk_count),
+            avg_priority_score = COALESCE(r.avg_priority, d.avg_priority_score)
+        FROM outcomes o
+        LEFT JOIN daily_risks r ON r.stat_date = o.stat_date
+        WHERE d.stat_date = o.stat_date
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$;
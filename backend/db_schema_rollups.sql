@@ -0,0 +1,13 @@
+-- Rollups: watermarks for the background aggregation worker
+
+-- 1. Rollup Watermarks
+-- One row per rollup stream; the worker only reads source rows past this point.
+CREATE TABLE rollup_watermarks (
+    name TEXT PRIMARY KEY,              -- 'triage_created', 'triage_attended'
+    last_ts TIMESTAMP NOT NULL,         -- timestamp of the last row folded in
+    last_id UUID,                       -- tie-breaker for rows sharing last_ts
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- 2. Index supporting the attended-stream scan
+CREATE INDEX idx_triage_attended ON triage_results(attended_at) WHERE attended_at IS NOT NULL;
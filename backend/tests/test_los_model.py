@@ -0,0 +1,121 @@
+import numpy as np
+
+from app.models.los_model import predict_los, predict_los_batch
+
+DISEASES = [
+    "Acute Myocardial Infarction", "Heart Failure", "Stroke", "Pneumonia", "COPD", "Asthma",
+    "Urinary Tract Infection", "Sepsis", "Viral Fever", "COVID-19", "Contact Dermatitis",
+    "Acne", "Throat Infection", "Migraine", "Appendicitis", "Gastroenteritis", "",
+]
+
+
+def old_predict_los(risk_level: str, predicted_disease: str, age: int, vitals: dict) -> dict:
+    """The per-patient rules los_model.py replaced, kept as the reference."""
+    days = 0
+    confidence = 1.0
+
+    if risk_level.lower() == "high":
+        days += 7
+    elif risk_level.lower() == "medium":
+        days += 3
+    else:
+        days += 1
+
+    disease_lower = predicted_disease.lower()
+    if any(k in disease_lower for k in ["cardiac", "heart", "myocardial", "stroke", "neuro"]):
+        days += 3
+    elif any(k in disease_lower for k in ["pneumonia", "asthma", "copd", "respiratory", "lung"]):
+        days += 2
+    elif any(k in disease_lower for k in ["infection", "sepsis", "viral", "bacterial", "covid"]):
+        days += 1
+    elif any(k in disease_lower for k in ["rash", "dermatitis", "acne", "ent", "ear", "nose", "throat"]):
+        days = max(1, days - 1)
+
+    if age > 60:
+        days += (age - 60) // 10
+
+    try:
+        hr = int(float(vitals.get("heart_rate") or vitals.get("hr", 75)))
+    except (TypeError, ValueError):
+        hr = 75
+    if not (60 <= hr <= 100):
+        days += 1
+        confidence -= 0.1
+
+    bp = vitals.get("blood_pressure") or vitals.get("bp", "120/80")
+    try:
+        systolic = int(str(bp).split("/")[0])
+        if systolic > 140 or systolic < 90:
+            days += 1
+            confidence -= 0.1
+    except ValueError:
+        pass
+
+    try:
+        spo2 = int(float(vitals.get("oxygen_saturation") or vitals.get("spo2", 98)))
+    except (TypeError, ValueError):
+        spo2 = 98
+    if spo2 < 95:
+        days += 2
+        confidence -= 0.2
+
+    try:
+        temp = float(vitals.get("temperature") or vitals.get("temp", 98.6))
+    except (TypeError, ValueError):
+        temp = 98.6
+    if temp > 100.4 or temp < 96.0:
+        days += 1
+
+    return {
+        "estimated_los_days": int(days),
+        "los_confidence": round(max(0.1, min(1.0, confidence)), 2),
+    }
+
+
+def maybe(rng, value):
+    return None if rng.random() < 0.15 else value
+
+
+def random_cases(n: int) -> list[dict]:
+    rng = np.random.default_rng(7)
+    return [
+        {
+            "risk_level": str(rng.choice(["high", "medium", "low", "High", "LOW", "unknown"])),
+            "predicted_disease": str(rng.choice(DISEASES)),
+            "age": int(rng.integers(0, 100)),
+            "heart_rate": maybe(rng, round(float(rng.uniform(35, 180)), 1)),
+            "systolic_bp": maybe(rng, int(rng.integers(70, 220))),
+            "oxygen_saturation": maybe(rng, round(float(rng.uniform(75, 100)), 1)),
+            "temperature_f": maybe(rng, round(float(rng.uniform(94, 106)), 1)),
+        }
+        for _ in range(n)
+    ]
+
+
+def old_rules(case: dict) -> dict:
+    vitals = {
+        "heart_rate": case["heart_rate"],
+        "blood_pressure": f"{case['systolic_bp']}/80" if case["systolic_bp"] is not None else None,
+        "oxygen_saturation": case["oxygen_saturation"],
+        "temperature": case["temperature_f"],
+    }
+    return old_predict_los(case["risk_level"], case["predicted_disease"], case["age"], vitals)
+
+
+def test_batch_matches_old_rules():
+    cases = random_cases(5000)
+    results = predict_los_batch(*(
+        [case[key] for case in cases]
+        for key in ("risk_level", "predicted_disease", "age", "heart_rate",
+                    "systolic_bp", "oxygen_saturation", "temperature_f")
+    ))
+    mismatches = [
+        (case, result, old_rules(case))
+        for case, result in zip(cases, results) if result != old_rules(case)
+    ]
+    assert not mismatches, f"{len(mismatches)} mismatches, first: {mismatches[0]}"
+
+
+def test_single_matches_old_rules():
+    for case in random_cases(200):
+        assert predict_los(**case) == old_rules(case)
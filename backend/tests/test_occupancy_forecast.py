@@ -0,0 +1,56 @@
+import numpy as np
+
+from app.services import occupancy_forecast
+from app.services.occupancy_forecast import count_occupancy, simulate_occupancy
+
+
+def brute_force_occupancy(department_idx, n_departments, admitted, remaining, horizon):
+    scenarios, n = admitted.shape
+    occupancy = np.zeros((scenarios, n_departments, horizon), dtype=np.int32)
+    for s in range(scenarios):
+        for p in range(n):
+            if not admitted[s, p]:
+                continue
+            for t in range(1, horizon + 1):
+                if remaining[s, p] > t:
+                    occupancy[s, department_idx[p], t - 1] += 1
+    return occupancy
+
+
+def census(rng, n: int, n_departments: int) -> dict:
+    return {
+        "department_idx": rng.integers(0, n_departments, n),
+        "n_departments": n_departments,
+        "admit_probability": rng.choice([1.0, 0.9, 0.5, 0.15], n),
+        "los_days": rng.integers(1, 12, n).astype(float),
+        "los_confidence": rng.uniform(0, 1, n),
+        "elapsed_days": rng.uniform(0, 6, n) * (rng.random(n) < 0.5),
+    }
+
+
+def test_count_occupancy_matches_brute_force():
+    rng = np.random.default_rng(3)
+    for horizon in (1, 7, 14):
+        department_idx = rng.integers(0, 4, 30)
+        admitted = rng.random((50, 30)) < 0.6
+        # Whole days included: a patient with exactly t days left is gone on day t
+        remaining = np.where(rng.random((50, 30)) < 0.2, rng.integers(0, 16, (50, 30)), rng.uniform(0, 16, (50, 30)))
+        assert np.array_equal(
+            count_occupancy(department_idx, 4, admitted, remaining, horizon),
+            brute_force_occupancy(department_idx, 4, admitted, remaining, horizon),
+        )
+
+
+def test_simulation_in_blocks(monkeypatch):
+    inputs = census(np.random.default_rng(5), n=40, n_departments=3)
+    whole = simulate_occupancy(**inputs, horizon=7, scenarios=3000, rng=np.random.default_rng(0))
+
+    # 100 draws per block: 2 scenarios at a time for 40 patients
+    monkeypatch.setattr(occupancy_forecast, "FORECAST_MAX_CELLS", 100)
+    blocks = simulate_occupancy(**inputs, horizon=7, scenarios=3000, rng=np.random.default_rng(0))
+
+    assert blocks.shape == whole.shape == (3000, 3, 7)
+    per_department = np.bincount(inputs["department_idx"], minlength=3)
+    assert (blocks <= per_department[None, :, None]).all()
+    assert (np.diff(blocks, axis=2) <= 0).all()
+    assert np.allclose(blocks.mean(axis=0), whole.mean(axis=0), atol=0.5)
@@ -0,0 +1,27 @@
+from app.utils.symptom_extractor import SymptomMatcher
+
+COLUMNS = ["fever", "cough", "chills", "vomiting"]
+
+
+def negations(text: str) -> dict[str, bool]:
+    return {m["symptom"]: m["negated"] for m in SymptomMatcher(COLUMNS).extract(text, "notes")}
+
+
+def test_comma_ends_negation_before_new_clause():
+    assert negations("no fever, has a bad cough") == {"fever": True, "cough": False}
+
+
+def test_comma_after_negated_phrase_does_not_carry_over():
+    assert negations("not feeling well, high fever") == {"fever": False}
+
+
+def test_negation_covers_comma_separated_list():
+    assert negations("no fever, cough or chills") == {"fever": True, "cough": True, "chills": True}
+
+
+def test_comma_after_cue_phrase_ends_negation():
+    assert negations("fever not improving, cough") == {"fever": False, "cough": False}
+
+
+def test_clause_break_ends_negation():
+    assert negations("denies fever but reports vomiting") == {"fever": True, "vomiting": False}
@@ -0,0 +1,98 @@
+"""Latency budget for triage_intake, with small stand-in models and no Supabase.
+
+benchmarks/triage_latency.py measures the real model; this keeps the rest of
+the request path (features, attributions, symptom extraction, department
+mapping, wait estimate, LOS, thread hand-offs) inside its budget on every
+test run.
+"""
+
+import asyncio
+import itertools
+import os
+import statistics
+
+import numpy as np
+import pytest
+from sklearn.preprocessing import LabelEncoder
+from xgboost import XGBClassifier
+
+from app.models import disease_model, triage_model
+from app.routes import triage
+from app.schemas.patient import PatientIntakeRequest
+from app.utils import model_client
+
+TRIAGE_INTAKE_BUDGET_MS = float(os.getenv("TRIAGE_INTAKE_BUDGET_MS", "25"))
+REQUESTS = 200
+
+SYMPTOMS = ["fever", "cough", "chills", "vomiting", "headache", "chest_pain"]
+DISEASES = ["Influenza", "Pneumonia", "Migraine", "Gastroenteritis"]
+
+
+@pytest.fixture
+def small_models(monkeypatch):
+    rng = np.random.default_rng(0)
+
+    X = np.column_stack([
+        rng.integers(1, 95, 400), rng.integers(45, 160, 400), rng.integers(80, 200, 400),
+        rng.integers(82, 100, 400), rng.uniform(96, 104, 400), rng.integers(0, 4, 400),
+    ]).astype(float)
+    triage_clf = XGBClassifier(n_estimators=20, max_depth=3, objective="multi:softprob", num_class=4)
+    triage_clf.fit(X, rng.integers(0, 4, 400))
+    monkeypatch.setattr(triage_model, "_model", triage_clf)
+    monkeypatch.setattr(triage_model, "_next_check", float("inf"))
+    monkeypatch.setattr(triage_model, "_cache", type(triage_model._cache)())
+
+    encoder = LabelEncoder().fit(DISEASES)
+    disease_clf = XGBClassifier(n_estimators=10, max_depth=3)
+    disease_clf.fit(rng.integers(0, 2, (200, len(SYMPTOMS))), rng.integers(0, len(DISEASES), 200))
+    monkeypatch.setattr(disease_model, "_model", disease_clf)
+    monkeypatch.setattr(disease_model, "_label_encoder", encoder)
+    monkeypatch.setattr(disease_model, "_symptom_columns", SYMPTOMS)
+
+    monkeypatch.setattr(model_client, "enabled", lambda: False)
+    codes = itertools.count(1)
+    monkeypatch.setattr(triage, "new_patient_code", lambda: f"P-{next(codes):06d}")
+    monkeypatch.setattr(triage, "_persist", lambda *args: "triage-id")
+    monkeypatch.setattr(triage, "_complete_pending", lambda *args: asyncio.sleep(0))
+
+
+def intakes(n: int) -> list[PatientIntakeRequest]:
+    rng = np.random.default_rng(42)
+    return [
+        PatientIntakeRequest(
+            name="Test Patient",
+            age=int(rng.integers(1, 95)),
+            gender="female",
+            blood_pressure_systolic=int(rng.integers(80, 200)),
+            blood_pressure_diastolic=int(rng.integers(50, 120)),
+            heart_rate=int(rng.integers(45, 160)),
+            temperature=round(float(rng.uniform(96, 104)), 1),
+            oxygen_saturation=int(rng.integers(82, 100)),
+            respiratory_rate=int(rng.integers(10, 30)),
+            symptoms=list(rng.choice(SYMPTOMS, size=2, replace=False)),
+            conditions=["diabetes"] if rng.random() < 0.3 else [],
+            notes="no vomiting, mild headache since yesterday",
+        )
+        for _ in range(n)
+    ]
+
+
+def test_triage_intake_within_budget(small_models):
+    async def run() -> list[tuple[dict, dict]]:
+        await triage.triage_intake(intakes(1)[0])  # warm up
+        results = []
+        for request in intakes(REQUESTS):
+            response, final = await triage.triage_intake(request)
+            assert final
+            results.append((response.stages, response.timings_ms))
+        return results
+
+    results = asyncio.run(run())
+
+    for stages, _ in results:
+        assert set(stages.values()) == {"done"}
+    totals = sorted(timings["total"] for _, timings in results)
+    median = statistics.median(totals)
+    p95 = totals[int(len(totals) * 0.95)]
+    assert median <= TRIAGE_INTAKE_BUDGET_MS, f"median {median} ms"
+    assert p95 <= 2 * TRIAGE_INTAKE_BUDGET_MS, f"p95 {p95} ms"
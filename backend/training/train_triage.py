@@ -9,7 +9,7 @@ import os
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, accuracy_score
+from sklearn.metrics import classification_report, accuracy_score, log_loss
 from xgboost import XGBClassifier
 import joblib
 
@@ -18,6 +18,9 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATASET_PATH = os.path.join(BASE_DIR, "dataset", "synthetic_medical_triage.csv")
 MODEL_DIR = os.path.join(BASE_DIR, "saved_models")
 MODEL_PATH = os.path.join(MODEL_DIR, "triage_model.joblib")
+# Replay and held-out samples used by incremental refreshes (app/services/model_refresh.py)
+REFRESH_DATA_PATH = os.path.join(MODEL_DIR, "triage_refresh_data.npz")
+REPLAY_SAMPLES = 5000
 
 
 def train():
@@ -85,6 +88,20 @@ def train():
     # Also save feature column names for reference
     joblib.dump(feature_cols, os.path.join(MODEL_DIR, "triage_features.joblib"))
 
+    # A slice of the training set to replay alongside feedback, the untouched
+    # test set to validate refreshed models against, and this model's score
+    # on it, which no refreshed model may fall short of
+    rng = np.random.default_rng(42)
+    replay = rng.choice(len(X_train), size=min(REPLAY_SAMPLES, len(X_train)), replace=False)
+    np.savez_compressed(
+        REFRESH_DATA_PATH,
+        X_replay=X_train[replay], y_replay=y_train[replay],
+        X_holdout=X_test, y_holdout=y_test,
+        baseline_accuracy=accuracy,
+        baseline_log_loss=log_loss(y_test, model.predict_proba(X_test), labels=[0, 1, 2, 3]),
+    )
+    print(f"Refresh data saved to {REFRESH_DATA_PATH}")
+
 
 if __name__ == "__main__":
     train()